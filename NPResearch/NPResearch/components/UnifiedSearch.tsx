@@ -8,12 +8,16 @@
 import React, { useState, useCallback, useEffect } from 'react';
 import {
   searchOrganizations,
+  suggestOrganizations,
   SearchResult,
+  Suggestion,
 } from '../services/organizationService';
 import OrganizationCard from './OrganizationCard';
 
 // Debounce delay for search input
 const SEARCH_DEBOUNCE_MS = 400;
+// Typeahead is answered from a local index, so it can run on nearly every keystroke
+const SUGGEST_DEBOUNCE_MS = 80;
 
 interface UnifiedSearchProps {
   onGenerateDossier: (org: SearchResult) => void;
@@ -29,6 +33,21 @@ const UnifiedSearch: React.FC<UnifiedSearchProps> = ({
   const [isSearching, setIsSearching] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [hasSearched, setHasSearched] = useState(false);
+  const [suggestions, setSuggestions] = useState<Suggestion[]>([]);
+
+  // Typeahead suggestions
+  useEffect(() => {
+    if (!query) {
+      setSuggestions([]);
+      return;
+    }
+
+    const timer = setTimeout(async () => {
+      setSuggestions(await suggestOrganizations(query));
+    }, SUGGEST_DEBOUNCE_MS);
+
+    return () => clearTimeout(timer);
+  }, [query]);
 
   // Debounced search
   useEffect(() => {
@@ -85,7 +104,15 @@ const UnifiedSearch: React.FC<UnifiedSearchProps> = ({
             value={query}
             onChange={handleInputChange}
             aria-label="Search for nonprofit organizations"
+            list="org-suggestions"
           />
+          <datalist id="org-suggestions">
+            {suggestions.map((s) => (
+              <option key={`${s.kind}:${s.ein ?? s.url}`} value={s.name}>
+                {s.kind === 'dds' ? 'DDS provider' : 'Nonprofit'} · {s.city}
+              </option>
+            ))}
+          </datalist>
           <i className="fa-solid fa-search absolute left-4 top-1/2 -translate-y-1/2 text-slate-400"></i>
 
           {query && (
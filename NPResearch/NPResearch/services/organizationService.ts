@@ -79,6 +79,82 @@ export const searchOrganizations = async (
   return data.results;
 };
 
+export interface ProgressiveSearchResponse extends SearchResponse {
+  search_token: string;
+  pending: Array<string | number>;  // EINs whose DDS match is still coming
+  done: boolean;
+}
+
+export interface DDSMatchUpdate {
+  seq: number;
+  ein: string | number;
+  dds_provider: DDSProvider | null;
+}
+
+/**
+ * Search that returns ProPublica hits immediately; DDS matches not yet known
+ * to the backend are delivered to `onMatch` as they are found. Returns the
+ * initial results and a function that stops listening.
+ */
+export const searchOrganizationsProgressive = async (
+  query: string,
+  onMatch: (update: DDSMatchUpdate) => void,
+  state: string = 'CT'
+): Promise<{ results: SearchResult[]; close: () => void }> => {
+  if (!query || query.length < 2) {
+    return { results: [], close: () => {} };
+  }
+
+  const params = new URLSearchParams({ q: query, state, progressive: 'true' });
+  const response = await fetch(`${API_BASE}/api/search/unified?${params}`);
+
+  if (!response.ok) {
+    throw new Error(`Search failed: ${response.statusText}`);
+  }
+
+  const data: ProgressiveSearchResponse = await response.json();
+  if (data.done) {
+    return { results: data.results, close: () => {} };
+  }
+
+  const events = new EventSource(`${API_BASE}/api/search/unified/${data.search_token}/stream`);
+  events.addEventListener('match', (e) => onMatch(JSON.parse((e as MessageEvent).data)));
+  const close = () => events.close();
+  events.addEventListener('done', close);
+  events.addEventListener('expired', close);
+  return { results: data.results, close };
+};
+
+export interface Suggestion {
+  kind: 'nonprofit' | 'dds';
+  name: string;
+  city: string;
+  ein?: string;  // nonprofit suggestions
+  url?: string;  // DDS provider suggestions
+}
+
+/**
+ * Typeahead suggestions from the backend's local index (no upstream calls).
+ */
+export const suggestOrganizations = async (
+  query: string,
+  limit: number = 8
+): Promise<Suggestion[]> => {
+  if (!query.trim()) {
+    return [];
+  }
+
+  const params = new URLSearchParams({ q: query, limit: String(limit) });
+  const response = await fetch(`${API_BASE}/api/suggest?${params}`);
+
+  if (!response.ok) {
+    return [];
+  }
+
+  const data = await response.json();
+  return data.suggestions;
+};
+
 /**
  * Get detailed organization info from ProPublica.
  */
@@ -130,6 +206,63 @@ export const fetchAllDocuments = async (
   return response.json();
 };
 
+export interface QualityFocusArea {
+  description: string;
+  percentMet: number;
+  status: 'high' | 'medium' | 'low';
+}
+
+export interface ProviderExtraction {
+  name: string | null;
+  address: string | null;
+  phones: string[];
+  emails: string[];
+  websites: string[];
+  services: string[];
+  qualityUrl: string | null;
+  pages: number;
+  sha1: string;
+  text?: string;
+}
+
+export interface QualityExtraction {
+  reviewDate: string | null;
+  dates: string[];
+  focusAreas: QualityFocusArea[];
+  averagePercentMet: number | null;
+  strengths: string[];
+  concerns: string[];
+  pages: number;
+  sha1: string;
+  text?: string;
+}
+
+export interface ProviderDocumentsExtraction {
+  url: string;
+  provider: ProviderExtraction;
+  qualityUrl: string | null;
+  quality: QualityExtraction | null;
+  error: string | null;
+}
+
+/**
+ * Structured fields and clean text from a DDS provider profile and its
+ * Quality Report, extracted server-side (a few KB instead of two PDFs).
+ */
+export const extractProviderDocuments = async (
+  providerUrl: string,
+  includeText: boolean = true
+): Promise<ProviderDocumentsExtraction> => {
+  const params = new URLSearchParams({ url: providerUrl, include_text: String(includeText) });
+  const response = await fetch(`${API_BASE}/api/extract/provider?${params}`);
+
+  if (!response.ok) {
+    throw new Error(`Failed to extract provider documents: ${response.statusText}`);
+  }
+
+  return response.json();
+};
+
 /**
  * Convert base64 document to UploadedFile format for Gemini service.
  */
@@ -210,3 +343,21 @@ export const fetchFinancials = async (
 
   return response.json();
 };
+
+export type LeadExportFormat = 'csv' | 'ndjson' | 'parquet';
+
+/**
+ * URL of the server-side lead export (DDS providers joined with EINs and
+ * financials). Statewide unless a town is given; point a link or
+ * window.location at it so the browser streams the download itself.
+ */
+export const getLeadsExportUrl = (
+  format: LeadExportFormat = 'csv',
+  town?: string
+): string => {
+  const params = new URLSearchParams({ format });
+  if (town) {
+    params.set('town', town);
+  }
+  return `${API_BASE}/api/export/leads?${params}`;
+};
@@ -0,0 +1,32 @@
+"""
+Admin Access
+
+Operator-only features (request profiling, manual overrides) are enabled
+by setting ADMIN_TOKEN and sending it in the `X-Admin-Token` header.
+Without ADMIN_TOKEN they are disabled entirely.
+"""
+
+from __future__ import annotations
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+def is_admin_token(value: Optional[str]) -> bool:
+    """Constant-time check of a supplied token against ADMIN_TOKEN."""
+    if not ADMIN_TOKEN or not value:
+        return False
+    return hmac.compare_digest(value.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """FastAPI dependency rejecting requests without a valid admin token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
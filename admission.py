@@ -0,0 +1,259 @@
+"""
+Admission Control
+
+Sync endpoints all run on one threadpool, so a bulk user firing
+`fetch-docs` or a statewide export could take every thread and leave
+`/api/health` (the Railway healthcheck) and cheap reads waiting behind
+them. `AdmissionMiddleware` puts each request in a lane first:
+
+- reserved: health/readiness probes, metrics, static files, reads
+  served from memory (`/api/towns`, `/api/suggest`) and progressive
+  search event streams. Never queued or
+  rejected; `reserve_threads` keeps threads free for them.
+- heavy: endpoints that download or parse PDFs, or walk every town
+  (`fetch-docs`, `fetch-provider-with-quality`, extraction, exports, and
+  the matches rebuild while the statewide roster is not cached).
+- standard: everything else.
+
+Each lane admits at most `limit` requests at once and queues up to
+`queue` more (FIFO, for at most QUEUE_TIMEOUT seconds). A client may hold
+at most `per_client` running or queued requests in a lane. Over the
+per-client cap the request gets 429; with the lane's queue full or the
+wait timed out it gets 503. Both carry a Retry-After estimated from the
+lane's recent request durations.
+
+Clients are told apart by the first X-Forwarded-For address (Railway's
+proxy sets it), else the socket peer. A client forging the header only
+escapes its own per-client cap; the lane limits still hold.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Tuple
+
+from metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("ADMISSION_CONTROL", "on").strip().lower() not in ("0", "false", "off", "no")
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+RESERVED_THREADS = int(os.environ.get("ADMISSION_RESERVED_THREADS", "8"))
+MAX_RETRY_AFTER = 60
+
+LANE_RESERVED = "reserved"
+LANE_HEAVY = "heavy"
+LANE_STANDARD = "standard"
+
+_RESERVED_RE = re.compile(
+    r"^/(?:$|static/|metrics$|api/(?:health|ready|towns|suggest)$"
+    r"|api/search/unified/[^/]+/stream$)"  # async, holds no thread while open
+)
+_HEAVY_RE = re.compile(
+    r"^/api/(?:organization/fetch-docs|fetch-provider-with-quality|fetch-quality-report|fetch-pdf"
+    r"|providers/nearby|extract/|export/|peers/|organization/[^/]+/form990/)"
+)
+# Paths that are only heavy while a scraper cache is cold: path -> cache key
+_HEAVY_WHEN_COLD = {"/api/admin/matches/rebuild": "all_providers_flat"}
+
+
+def _lane_config(name: str, limit: int, queue: int, per_client: int) -> Tuple[int, int, int]:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return (
+        int(os.environ.get(prefix + "LIMIT", str(limit))),
+        int(os.environ.get(prefix + "QUEUE", str(queue))),
+        int(os.environ.get(prefix + "PER_CLIENT", str(per_client))),
+    )
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, detail: str, retry_after: int) -> None:
+        super().__init__(detail)
+        self.status = status
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _Lane:
+    """Concurrency limit with a bounded FIFO queue and a per-client cap (event-loop only, no locking)."""
+
+    def __init__(self, name: str, limit: int, queue: int, per_client: int) -> None:
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.per_client = max(1, per_client)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._clients: Counter = Counter()
+        self._avg_seconds = 1.0  # EWMA of request durations, for Retry-After
+
+    def retry_after(self) -> int:
+        backlog = (len(self._waiters) + 1) / self.limit
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self._avg_seconds * backlog)))
+
+    async def acquire(self, client: str) -> None:
+        if self._clients[client] >= self.per_client:
+            raise Rejected(
+                429, "client",
+                f"Too many concurrent {self.name} requests from this client (max {self.per_client})",
+                self.retry_after(),
+            )
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._clients[client] += 1
+            return
+        if len(self._waiters) >= self.queue:
+            raise Rejected(503, "queue_full", f"Server busy: {self.name} request queue is full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._clients[client] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, QUEUE_TIMEOUT)
+        except BaseException as e:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self._release_slot()  # handed a slot just as we gave up
+            self._drop_client(client)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected(
+                    503, "timeout", f"Server busy: no {self.name} capacity within {QUEUE_TIMEOUT:.0f}s",
+                    self.retry_after(),
+                ) from None
+            raise
+        finally:
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, lane=self.name)
+
+    def release(self, client: str, seconds: float) -> None:
+        self._drop_client(client)
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+        self._release_slot()
+
+    def _drop_client(self, client: str) -> None:
+        self._clients[client] -= 1
+        if self._clients[client] <= 0:
+            del self._clients[client]
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes straight to the next waiter
+                return
+        self.active -= 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "perClient": self.per_client,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "clients": len(self._clients),
+        }
+
+
+LANES: Dict[str, _Lane] = {
+    LANE_HEAVY: _Lane(LANE_HEAVY, *_lane_config(LANE_HEAVY, 6, 12, 2)),
+    LANE_STANDARD: _Lane(LANE_STANDARD, *_lane_config(LANE_STANDARD, 20, 40, 8)),
+}
+
+
+def classify(path: str) -> str:
+    """The lane for a request path."""
+    if _RESERVED_RE.match(path):
+        return LANE_RESERVED
+    if _HEAVY_RE.match(path):
+        return LANE_HEAVY
+    cache_key = _HEAVY_WHEN_COLD.get(path)
+    if cache_key is not None:
+        import scraper
+
+        if scraper.cache_info(cache_key) is None:
+            return LANE_HEAVY
+    return LANE_STANDARD
+
+
+def client_key(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"x-forwarded-for":
+            first = value.decode("latin-1").split(",")[0].strip()
+            if first:
+                return first
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def stats() -> Dict[str, Any]:
+    """Current occupancy of each lane."""
+    return {"enabled": ENABLED, "lanes": {name: lane.to_dict() for name, lane in LANES.items()}}
+
+
+def reserve_threads() -> None:
+    """
+    Grow the sync threadpool so RESERVED_THREADS stay free when every lane is full.
+
+    Must run inside the event loop (e.g. in the app lifespan).
+    """
+    import anyio.to_thread
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    needed = sum(lane.limit for lane in LANES.values()) + RESERVED_THREADS
+    if ENABLED and limiter.total_tokens < needed:
+        logger.info("Raising threadpool size from %d to %d for admission lanes", limiter.total_tokens, needed)
+        limiter.total_tokens = needed
+
+
+async def _reject(send, error: Rejected) -> None:
+    body = json.dumps({"detail": error.detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": error.status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(error.retry_after).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware holding each non-reserved request in its lane until it finishes."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        lane_name = classify(scope.get("path", ""))
+        if lane_name == LANE_RESERVED:
+            await self.app(scope, receive, send)
+            return
+
+        lane = LANES[lane_name]
+        client = client_key(scope)
+        try:
+            await lane.acquire(client)
+        except Rejected as e:
+            ADMISSION_REJECTED.inc(lane=lane_name, reason=e.reason)
+            logger.warning("Rejected %s %s from %s: %s", scope.get("method"), scope.get("path"), client, e.detail)
+            await _reject(send, e)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(client, time.perf_counter() - start)
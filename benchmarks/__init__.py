@@ -0,0 +1 @@
+"""Offline benchmarks. Run from the repo root, e.g. `python -m benchmarks.memory` or `python -m benchmarks.run`."""
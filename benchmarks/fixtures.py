@@ -0,0 +1,250 @@
+"""
+Benchmark fixtures shaped like the real upstream responses.
+
+Writes a deterministic fixture tree under `benchmarks/fixtures/`, laid out
+by upstream host and path so the stub server can replay it:
+
+    portal.ct.gov/dds/searchable-archive/.../provider-by-town   towns page (HTML)
+    portal.ct.gov/-/media/DDS/provider_town/<town>.pdf           town rosters
+    portal.ct.gov/-/media/DDS/provider_alpha/<provider>_pp.pdf   provider profiles
+    portal.ct.gov/-/media/DDS/qsr/<provider>_qsr.pdf             quality reports
+    projects.propublica.org/nonprofits/api/v2/organizations/<ein>.json
+    projects.propublica.org/nonprofits/fixtures/990_<ein>_<year>.pdf
+    propublica_orgs.json                                          search corpus
+
+The PDFs are minimal text PDFs written by hand (no PDF library needed)
+with the same line layout pdfplumber sees in the real documents.
+
+Usage:
+    python -m benchmarks.fixtures [--towns 40] [--providers 300] [--force]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import scraper
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+PROPUBLICA_HOST = "projects.propublica.org"
+
+TOWN_NAMES = [
+    "Andover", "Ansonia", "Ashford", "Avon", "Berlin", "Bethel", "Bloomfield", "Bolton", "Branford",
+    "Bridgeport", "Bristol", "Brookfield", "Canton", "Cheshire", "Clinton", "Colchester", "Coventry",
+    "Cromwell", "Danbury", "Darien", "Derby", "Durham", "East Hartford", "East Haven", "Enfield",
+    "Fairfield", "Farmington", "Glastonbury", "Greenwich", "Groton", "Guilford", "Hamden", "Hartford",
+    "Killingly", "Ledyard", "Madison", "Manchester", "Meriden", "Middletown", "Milford", "Naugatuck",
+    "New Britain", "New Haven", "New London", "Newington", "Norwalk", "Norwich", "Plainville",
+    "Southington", "Stamford", "Stratford", "Torrington", "Vernon", "Wallingford", "Waterbury",
+    "West Hartford", "West Haven", "Wethersfield", "Windham", "Windsor",
+]
+
+NAME_PARTS = (
+    ["Arc", "Harbor", "Oak Hill", "Sunrise", "Keystone", "Meadow", "Riverview", "Beacon", "Summit",
+     "Evergreen", "Horizon", "Lighthouse", "Cornerstone", "Pathways", "Bridges", "Compass"],
+    ["Community", "Family", "Residential", "Support", "Life", "Care", "Human", "Vocational"],
+    ["Services", "Network", "Partners", "Alliance", "Center", "Homes", "Options", "Solutions"],
+)
+
+
+# -----------------------------------------------------------------------------
+# Minimal PDF writer
+# -----------------------------------------------------------------------------
+
+LINES_PER_PAGE = 60
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(lines: Sequence[str], font_size: int = 7) -> bytes:
+    """A text-only PDF with one line per string, paginated, in Helvetica."""
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page_lines in pages:
+        ops = [f"BT /F1 {font_size} Tf {font_size + 3} TL 36 756 Td"]
+        for line in page_lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", errors="replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+# -----------------------------------------------------------------------------
+# Fixture set
+# -----------------------------------------------------------------------------
+
+
+def _slug(name: str) -> str:
+    return "".join(ch if ch.isalnum() else "_" for ch in name.lower()).strip("_")
+
+
+def _path_for(url: str) -> Path:
+    parsed = urlparse(url)
+    return FIXTURES_DIR / parsed.hostname / parsed.path.lstrip("/")
+
+
+def _write(url: str, data: bytes) -> None:
+    path = _path_for(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def _provider_profile_lines(name: str, town: str, quality_url: Optional[str], rng: random.Random) -> List[str]:
+    lines = [
+        "DDS Qualified Provider Profile",
+        f"Provider Name: {name}",
+        f"Address: {rng.randint(1, 999)} Main Street, {town}, CT 06{rng.randint(100, 999)}",
+        f"Phone: (860) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+        f"Email: info@{_slug(name)[:20]}.org",
+        "Services Offered:",
+    ]
+    services = ["Residential Habilitation", "Day Support Options", "Supported Employment",
+                "Individualized Home Supports", "Respite", "Behavioral Support", "Adult Companion"]
+    lines += [f"  {s}" for s in rng.sample(services, 3)]
+    lines += [f"Program note {i}: services delivered across the region." for i in range(rng.randint(20, 80))]
+    if quality_url:
+        lines += ["Quality Service Review Profile:", quality_url]
+    return lines
+
+
+def _quality_lines(name: str, rng: random.Random) -> List[str]:
+    lines = [f"Quality Service Review - {name}", f"Review Date: {rng.randint(1, 12)}/{rng.randint(1, 28)}/2024"]
+    for area in ("Health and Safety", "Rights", "Community Inclusion", "Individual Planning"):
+        lines.append(f"{area}: {rng.randint(70, 100)}% Met")
+    return lines
+
+
+def _form990_lines(name: str, ein: str, year: int, rng: random.Random) -> List[str]:
+    lines = [f"Form 990 Return of Organization Exempt From Income Tax {year}", f"{name} EIN {ein}"]
+    lines += ["Part I Summary", f"Total revenue {rng.randint(10**6, 10**8):,}"]
+    lines += [f"Line {i} detail" for i in range(LINES_PER_PAGE * 5)]
+    lines += ["Part VII Compensation of Officers, Directors, Trustees, Key Employees"]
+    lines += [f"Officer {i} Director {rng.randint(50, 250) * 1000:,}" for i in range(10)]
+    lines += [f"Schedule line {i}" for i in range(LINES_PER_PAGE * 3)]
+    lines += ["SCHEDULE O (Form 990) Supplemental Information", "Governance narrative text."]
+    return lines
+
+
+def build(towns: int = 40, providers: int = 300, seed: int = 11, force: bool = False) -> Path:
+    """Write the fixture tree (skipped if present unless `force`); returns its directory."""
+    manifest_path = FIXTURES_DIR / "manifest.json"
+    if manifest_path.exists() and not force:
+        return FIXTURES_DIR
+    if FIXTURES_DIR.exists():
+        shutil.rmtree(FIXTURES_DIR)
+    rng = random.Random(seed)
+    town_names = TOWN_NAMES[:towns]
+
+    statewide = []
+    for i in range(providers):
+        name = f"{rng.choice(NAME_PARTS[0])} {rng.choice(NAME_PARTS[1])} {rng.choice(NAME_PARTS[2])} {i}, Inc."
+        url = f"{scraper.PROFILE_PDF_PREFIX}{_slug(name)}_pp.pdf"
+        quality_url = f"https://portal.ct.gov/-/media/DDS/qsr/{_slug(name)}_qsr.pdf" if i % 4 else None
+        statewide.append({"name": name, "url": url, "quality_url": quality_url, "town": rng.choice(town_names)})
+
+    # Towns page linking every town PDF
+    links = []
+    for town in town_names:
+        pdf_url = f"{scraper.TOWN_PDF_PREFIX}{_slug(town)}.pdf"
+        links.append(f'<li><a href="{pdf_url}">{town}</a></li>')
+        roster = rng.sample(statewide, rng.randint(15, 60))
+        lines = ["DDS QUALIFIED PROVIDERS BY TOWN", town.upper(), "PROVIDER NAME LINK TO PROVIDER PROFILE"]
+        for p in roster:
+            lines.append(f"{p['name']} {p['url']}")
+        _write(pdf_url, make_pdf(lines))
+    html = "<html><body><ul>" + "\n".join(links) + "</ul></body></html>"
+    _write(scraper.BASE_URL.split("?")[0], html.encode("utf-8"))
+
+    for p in statewide:
+        _write(p["url"], make_pdf(_provider_profile_lines(p["name"], p["town"], p["quality_url"], rng)))
+        if p["quality_url"]:
+            _write(p["quality_url"], make_pdf(_quality_lines(p["name"], rng)))
+
+    # ProPublica: one org per provider (names differ slightly, as in real data)
+    orgs = []
+    for i, p in enumerate(statewide):
+        ein = f"06{1000000 + i:07d}"
+        org_name = p["name"].replace(", Inc.", " Inc").upper()
+        orgs.append({"ein": int(ein), "name": org_name, "city": p["town"].upper(), "state": "CT",
+                     "ntee_code": "P80", "subsection_code": 3})
+        filings = []
+        revenue = rng.randint(10**6, 5 * 10**7)
+        for year in range(2023, 2016, -1):
+            pdf_url = f"https://{PROPUBLICA_HOST}/nonprofits/fixtures/990_{ein}_{year}.pdf"
+            filings.append({
+                "tax_prd_yr": year, "pdf_url": pdf_url, "totrevenue": revenue,
+                "totfuncexpns": int(revenue * rng.uniform(0.85, 1.05)), "totassetsend": revenue * 2,
+                "totnetassetsend": int(revenue * rng.uniform(0.2, 1.0)),
+            })
+            revenue = int(revenue / rng.uniform(0.95, 1.12))
+            if year == 2023 and i < 50:
+                _write(pdf_url, make_pdf(_form990_lines(org_name, ein, year, rng)))
+        org_json = {"organization": {**orgs[-1], "tax_period": "2023-06-01"}, "filings_with_data": filings}
+        _write(f"https://{PROPUBLICA_HOST}/nonprofits/api/v2/organizations/{ein}.json",
+               json.dumps(org_json).encode("utf-8"))
+
+    (FIXTURES_DIR / "propublica_orgs.json").write_text(json.dumps(orgs), encoding="utf-8")
+    manifest: Dict[str, object] = {
+        "seed": seed,
+        "towns": town_names,
+        "providers": len(statewide),
+        "sample_eins": [str(o["ein"]).zfill(9) for o in orgs[:50]],
+        "sample_queries": sorted({o["name"].split()[0].lower() for o in orgs})[:10],
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return FIXTURES_DIR
+
+
+def load_manifest() -> Dict[str, object]:
+    return json.loads((FIXTURES_DIR / "manifest.json").read_text(encoding="utf-8"))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.fixtures", description="Generate benchmark fixtures")
+    parser.add_argument("--towns", type=int, default=40)
+    parser.add_argument("--providers", type=int, default=300)
+    parser.add_argument("--force", action="store_true", help="Regenerate even if fixtures exist")
+    args = parser.parse_args(argv)
+    path = build(args.towns, args.providers, force=args.force)
+    print(f"Fixtures in {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Memory benchmark for the hot cached structures.
+
+Builds a synthetic statewide DDS roster and a set of cached ProPublica
+organizations, once with the old representation (a dict per provider,
+plain dataclasses) and once with the compact one (`ProviderRecord`,
+slotted dataclasses, interned strings), and reports traced allocations.
+
+Usage:
+    python -m benchmarks.memory [--towns 169] [--providers-per-town 60] [--orgs 5000] [--json out.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import propublica
+import scraper
+
+PROFILE_PREFIX = scraper.PROFILE_PDF_PREFIX
+
+
+# Pre-compaction shapes, kept here so the comparison stays reproducible
+@dataclass
+class _DictFiling:
+    tax_period: str
+    pdf_url: Optional[str]
+    total_revenue: Optional[int]
+    total_expenses: Optional[int]
+    total_assets: Optional[int]
+    net_assets: Optional[int] = None
+
+
+@dataclass
+class _DictDetails:
+    ein: str
+    name: str
+    city: str
+    state: str
+    ntee_code: Optional[str]
+    filings: List[_DictFiling]
+
+
+def _roster_source(towns: int, per_town: int, seed: int) -> List[tuple]:
+    """(town, name, url) triples as parsed from town PDFs; providers repeat across towns."""
+    rng = random.Random(seed)
+    statewide = [(f"Provider {i} Inc.", f"{PROFILE_PREFIX}provider_{i}_pp.pdf") for i in range(per_town * 8)]
+    rows = []
+    for t in range(towns):
+        town = f"Town {t}"
+        for name, url in rng.sample(statewide, per_town):
+            # Each town PDF parse yields fresh string objects, as pdfplumber does
+            rows.append((town, "".join(name), "".join(url)))
+    return rows
+
+
+def _measure(build: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return after - before
+
+
+def _build_dict_roster(rows: List[tuple]) -> List[Dict[str, str]]:
+    by_town: Dict[str, List[Dict[str, str]]] = {}
+    for town, name, url in rows:
+        by_town.setdefault(town, []).append({"name": name, "url": url})
+    flat = []
+    for town, providers in by_town.items():
+        for p in providers:
+            flat.append({"name": p["name"], "url": p["url"], "town": "".join(town)})
+    return [by_town, flat]
+
+
+def _build_compact_roster(rows: List[tuple]) -> List[Any]:
+    by_town: Dict[str, List[scraper.ProviderRecord]] = {}
+    for town, name, url in rows:
+        by_town.setdefault(town, []).append(scraper.ProviderRecord(name, url, town))
+    flat = [p for providers in by_town.values() for p in providers]
+    return [by_town, flat]
+
+
+def _org_source(orgs: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    cities = ["HARTFORD", "NEW HAVEN", "MANCHESTER", "STAMFORD", "WATERBURY", "NORWALK"]
+    return [
+        {
+            "ein": f"06{i:07d}",
+            "name": f"ORGANIZATION NUMBER {i}",
+            "city": rng.choice(cities),
+            "filings": [
+                (str(year), rng.randint(10**4, 10**8), rng.randint(10**4, 10**8))
+                for year in range(2023, 2013, -1)
+            ],
+        }
+        for i in range(orgs)
+    ]
+
+
+def _build_dict_orgs(source: List[Dict[str, Any]]) -> List[_DictDetails]:
+    return [
+        _DictDetails(
+            ein=o["ein"], name=o["name"], city="".join(o["city"]), state="".join("CT"), ntee_code=None,
+            filings=[_DictFiling("".join(y), None, rev, exp, rev * 2, rev - exp) for y, rev, exp in o["filings"]],
+        )
+        for o in source
+    ]
+
+
+def _build_compact_orgs(source: List[Dict[str, Any]]) -> List[propublica.NonprofitDetails]:
+    intern = propublica._intern
+    return [
+        propublica.NonprofitDetails(
+            ein=o["ein"], name=o["name"], city=intern("".join(o["city"])), state=intern("".join("CT")),
+            ntee_code=None,
+            filings=[
+                propublica.Filing(intern("".join(y)), None, rev, exp, rev * 2, rev - exp)
+                for y, rev, exp in o["filings"]
+            ],
+        )
+        for o in source
+    ]
+
+
+def run(towns: int, per_town: int, orgs: int, seed: int = 7) -> Dict[str, Any]:
+    # Sources are generated inside each measurement so the strings that
+    # survive in the built structures are counted, as they are in the app.
+    results = {
+        "roster": {
+            "providers": towns * per_town,
+            "dict_bytes": _measure(lambda: _build_dict_roster(_roster_source(towns, per_town, seed))),
+            "compact_bytes": _measure(lambda: _build_compact_roster(_roster_source(towns, per_town, seed))),
+        },
+        "organizations": {
+            "orgs": orgs,
+            "filings": orgs * 10,
+            "dict_bytes": _measure(lambda: _build_dict_orgs(_org_source(orgs, seed))),
+            "compact_bytes": _measure(lambda: _build_compact_orgs(_org_source(orgs, seed))),
+        },
+    }
+    for section in results.values():
+        section["saved_pct"] = round(100.0 * (1 - section["compact_bytes"] / section["dict_bytes"]), 1)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.memory", description="Cache memory benchmark")
+    parser.add_argument("--towns", type=int, default=169)
+    parser.add_argument("--providers-per-town", type=int, default=60)
+    parser.add_argument("--orgs", type=int, default=5000)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.towns, args.providers_per_town, args.orgs)
+    for name, section in results.items():
+        print(
+            f"{name:14s} old {section['dict_bytes'] / 1e6:8.2f} MB   "
+            f"compact {section['compact_bytes'] / 1e6:8.2f} MB   saved {section['saved_pct']}%"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Replay captured API traffic against a running instance.
+
+Reads a capture file written with REQUEST_CAPTURE_PATH (see `capture.py`),
+replays the requests in their original order and spacing (scaled by
+`--speed`, or back to back with `--speed 0`) at up to `--concurrency`
+requests in flight, and reports per endpoint:
+
+    requests, p50/p95/p99 latency, 5xx/exception error rate, 4xx rate,
+    and the cache hit ratio from the X-Cache-Status response header.
+
+Latency is measured from each request's scheduled send time (its submit
+time with `--speed 0`), so waiting for a free slot counts against it.
+
+Usage:
+    python -m benchmarks.replay capture.jsonl [--base-url http://127.0.0.1:8000]
+                                              [--concurrency 8] [--speed 1] [--limit N] [--json out.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import requests
+
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "path" in record and "method" in record:
+                records.append(record)
+            if limit and len(records) >= limit:
+                break
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+def _percentile(ordered: Sequence[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class _Outcome:
+    __slots__ = ("route", "seconds", "status", "cache")
+
+    def __init__(self, route: str, seconds: float, status: Optional[int], cache: Optional[str]) -> None:
+        self.route = route
+        self.seconds = seconds
+        self.status = status
+        self.cache = cache
+
+
+def replay(
+    records: Sequence[Dict[str, Any]],
+    base_url: str,
+    concurrency: int = 8,
+    speed: float = 1.0,
+) -> Dict[str, Any]:
+    """Replay `records` and return the per-endpoint report."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    outcomes: List[_Outcome] = []
+    lock = threading.Lock()
+    base_url = base_url.rstrip("/")
+
+    def send(record: Dict[str, Any], scheduled: float) -> None:
+        # Latency counts from the scheduled send time, so time spent queued
+        # behind a saturated pool shows up in the tail (no coordinated omission)
+        route = record.get("route") or record["path"]
+        start = scheduled
+        try:
+            resp = session.request(
+                record["method"],
+                base_url + record["path"],
+                params=record.get("params") or None,
+                json=record.get("body"),
+                timeout=120,
+            )
+            status: Optional[int] = resp.status_code
+            cache = resp.headers.get("X-Cache-Status")
+        except requests.RequestException:
+            status, cache = None, None
+        outcome = _Outcome(route, time.perf_counter() - start, status, cache)
+        with lock:
+            outcomes.append(outcome)
+
+    first_ts = records[0].get("ts", 0) if records else 0
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            scheduled = time.perf_counter()
+            if speed > 0:
+                scheduled = wall_start + (record.get("ts", first_ts) - first_ts) / speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, record, scheduled)
+    wall = time.perf_counter() - wall_start
+    return _report(outcomes, wall, concurrency, speed)
+
+
+def _report(outcomes: Sequence[_Outcome], wall: float, concurrency: int, speed: float) -> Dict[str, Any]:
+    by_route: Dict[str, List[_Outcome]] = defaultdict(list)
+    for outcome in outcomes:
+        by_route[outcome.route].append(outcome)
+
+    endpoints = {}
+    for route, items in sorted(by_route.items()):
+        latencies = sorted(o.seconds * 1000 for o in items)
+        errors = sum(1 for o in items if o.status is None or o.status >= 500)
+        client_errors = sum(1 for o in items if o.status is not None and 400 <= o.status < 500)
+        with_cache = [o.cache for o in items if o.cache]
+        endpoints[route] = {
+            "requests": len(items),
+            "p50Ms": round(_percentile(latencies, 50), 1),
+            "p95Ms": round(_percentile(latencies, 95), 1),
+            "p99Ms": round(_percentile(latencies, 99), 1),
+            "errorRate": round(errors / len(items), 4),
+            "clientErrorRate": round(client_errors / len(items), 4),
+            "cacheHitRatio": (
+                round(sum(1 for c in with_cache if c == "HIT") / len(with_cache), 4) if with_cache else None
+            ),
+            "cachePartialRatio": (
+                round(sum(1 for c in with_cache if c == "PARTIAL") / len(with_cache), 4) if with_cache else None
+            ),
+        }
+    return {
+        "requests": len(outcomes),
+        "wallSeconds": round(wall, 2),
+        "throughput": round(len(outcomes) / wall, 2) if wall else 0.0,
+        "concurrency": concurrency,
+        "speed": speed,
+        "endpoints": endpoints,
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"{report['requests']} requests in {report['wallSeconds']}s "
+        f"({report['throughput']}/s, concurrency {report['concurrency']}, speed {report['speed']})\n"
+    )
+    print(f"{'endpoint':40s} {'n':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'err%':>6s} {'4xx%':>6s} {'hit%':>6s}")
+    for route, stats in report["endpoints"].items():
+        hit = stats["cacheHitRatio"]
+        print(
+            f"{route:40s} {stats['requests']:6d} {stats['p50Ms']:8.1f} {stats['p95Ms']:8.1f} {stats['p99Ms']:8.1f} "
+            f"{stats['errorRate'] * 100:6.1f} {stats['clientErrorRate'] * 100:6.1f} "
+            f"{'-' if hit is None else format(hit * 100, '6.1f'):>6s}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.replay", description="Replay captured API traffic")
+    parser.add_argument("capture", help="JSONL file written via REQUEST_CAPTURE_PATH")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--speed", type=float, default=1.0, help="Time scale (2 = twice as fast, 0 = no pauses)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        parser.error(f"no requests found in {args.capture}")
+    report = replay(records, args.base_url, args.concurrency, args.speed)
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
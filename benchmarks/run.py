@@ -0,0 +1,357 @@
+"""
+Offline latency and throughput benchmarks.
+
+Replays the fixtures from `benchmarks.fixtures` through a local stub
+server (`upstream.get` is pointed at it), so runs need no network and are
+repeatable. Measures the hot paths one by one and then the API end to
+end through uvicorn:
+
+    parse_town_pdf          scraper.parse_providers_from_town_pdf
+    quality_url_parse       extract_quality_profile_url, cold (PDF parse)
+    quality_url_cached      extract_quality_profile_url, digest cache hit
+    match_town              match_to_dds_provider against one town roster
+    match_statewide         match_to_dds_provider against every provider
+    all_providers_cold      get_all_providers_flat from empty caches
+    all_providers_warm      get_all_providers_flat from cache
+    endpoint:<route>        HTTP requests/second at --concurrency
+
+Results are written to `benchmarks/results/<timestamp>.json`; pass
+`--compare` with an earlier results file to print the change per
+benchmark and flag regressions.
+
+Usage:
+    python -m benchmarks.run [--iterations 50] [--requests 200] [--concurrency 8]
+                             [--only parse,endpoint] [--latency-ms 0]
+                             [--compare benchmarks/results/baseline.json] [--fail-on-regression]
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+
+# Benchmarks get their own local store so a developer's data/leadgen.db
+# neither skews the numbers nor picks up fixture rows.
+os.environ["LEADGEN_DB"] = os.path.join(tempfile.mkdtemp(prefix="leadgen-bench-"), "bench.db")
+os.environ["WARM_CACHE"] = ""
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import platform  # noqa: E402
+import socket  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+from datetime import datetime, timezone  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import Any, Callable, Dict, List, Optional, Sequence  # noqa: E402
+
+import requests  # noqa: E402
+
+import propublica  # noqa: E402
+import scraper  # noqa: E402
+import upstream  # noqa: E402
+from benchmarks import fixtures  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+REGRESSION_THRESHOLD = 0.10  # 10% slower p50 (or lower throughput) is flagged
+REGRESSION_MIN_MS = 0.5  # ...unless the p50 moved by less than this (timer noise)
+
+
+# -----------------------------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------------------------
+
+
+def _summarize(samples: Sequence[float], wall_seconds: Optional[float] = None) -> Dict[str, float]:
+    ordered = sorted(samples)
+    n = len(ordered)
+    wall = wall_seconds if wall_seconds is not None else sum(ordered)
+    return {
+        "n": n,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[n // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(n - 1, int(n * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "ops_per_s": round(n / wall, 2) if wall else 0.0,
+    }
+
+
+def _time_calls(fn: Callable[[int], Any], iterations: int) -> Dict[str, float]:
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return _summarize(samples)
+
+
+def reset_caches() -> None:
+    """Drop every in-process cache so the next call goes upstream."""
+    scraper._CACHE.clear()
+    scraper.NEGATIVE_CACHE.clear()
+    propublica._CACHE.clear()
+    propublica.NEGATIVE_CACHE.clear()
+
+
+def _fixture_files(pattern: str) -> List[bytes]:
+    return [p.read_bytes() for p in sorted(fixtures.FIXTURES_DIR.glob(pattern))]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, check=True
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Function benchmarks
+# -----------------------------------------------------------------------------
+
+
+def bench_parse(iterations: int) -> Dict[str, Dict[str, float]]:
+    manifest = fixtures.load_manifest()
+    town_pdfs = _fixture_files("portal.ct.gov/-/media/DDS/provider_town/*.pdf")
+    towns = manifest["towns"]
+    provider_pdfs = _fixture_files("portal.ct.gov/-/media/DDS/provider_alpha/*.pdf")
+
+    results = {
+        "parse_town_pdf": _time_calls(
+            lambda i: scraper.parse_providers_from_town_pdf(town_pdfs[i % len(town_pdfs)], towns[i % len(towns)]),
+            iterations,
+        ),
+    }
+    reset_caches()
+    results["quality_url_parse"] = _time_calls(
+        lambda i: scraper.extract_quality_profile_url(provider_pdfs[i % len(provider_pdfs)]),
+        min(iterations, len(provider_pdfs)),
+    )
+    results["quality_url_cached"] = _time_calls(
+        lambda i: scraper.extract_quality_profile_url(provider_pdfs[i % len(provider_pdfs)]),
+        min(iterations, len(provider_pdfs)),
+    )
+    return results
+
+
+def bench_match(iterations: int) -> Dict[str, Dict[str, float]]:
+    orgs = json.loads((fixtures.FIXTURES_DIR / "propublica_orgs.json").read_text(encoding="utf-8"))
+    names = [o["name"] for o in orgs]
+    reset_caches()
+    statewide = [p.to_dict() for p in scraper.get_all_providers_flat()]
+    town = fixtures.load_manifest()["towns"][0]
+    town_roster = [p.to_dict() for p in scraper.get_providers_for_town(town)]
+    return {
+        "match_town": _time_calls(
+            lambda i: propublica.match_to_dds_provider(names[i % len(names)], town_roster), iterations
+        ),
+        "match_statewide": _time_calls(
+            lambda i: propublica.match_to_dds_provider(names[i % len(names)], statewide),
+            max(1, iterations // 10),
+        ),
+    }
+
+
+def bench_all_providers(iterations: int) -> Dict[str, Dict[str, float]]:
+    def cold(_: int) -> None:
+        reset_caches()
+        scraper.get_all_providers_flat()
+
+    results = {"all_providers_cold": _time_calls(cold, max(1, iterations // 10))}
+    results["all_providers_warm"] = _time_calls(lambda _: scraper.get_all_providers_flat(), iterations)
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Endpoint throughput
+# -----------------------------------------------------------------------------
+
+
+class _AppServer:
+    """The FastAPI app under uvicorn in a background thread."""
+
+    def __init__(self) -> None:
+        import uvicorn
+
+        import main
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, name="bench-app", daemon=True)
+
+    def __enter__(self) -> "_AppServer":
+        self._thread.start()
+        deadline = time.time() + 15
+        while not self._server.started:
+            if time.time() > deadline:
+                raise RuntimeError("uvicorn did not start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def _endpoint_paths() -> Dict[str, List[str]]:
+    manifest = fixtures.load_manifest()
+    towns = manifest["towns"]
+    eins = manifest["sample_eins"]
+    queries = manifest["sample_queries"]
+    return {
+        "/api/towns": ["/api/towns"],
+        "/api/providers": [f"/api/providers?town={t}" for t in towns],
+        "/api/search/unified": [f"/api/search/unified?q={q}" for q in queries],
+        "/api/organization/{ein}": [f"/api/organization/{e}" for e in eins],
+        "/api/propublica/financials/{ein}": [f"/api/propublica/financials/{e}" for e in eins],
+        "/api/suggest": [f"/api/suggest?q={q[:3]}" for q in queries],
+    }
+
+
+def bench_endpoints(total_requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    reset_caches()
+    with _AppServer() as app, requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        session.mount("http://", adapter)
+        for route, paths in _endpoint_paths().items():
+            # One pass to fill caches: the numbers below are steady-state throughput
+            for path in paths:
+                session.get(app.url + path, timeout=60)
+
+            def one(i: int) -> tuple:
+                start = time.perf_counter()
+                try:
+                    ok = session.get(app.url + paths[i % len(paths)], timeout=60).status_code < 500
+                except requests.RequestException:
+                    ok = False
+                return time.perf_counter() - start, ok
+
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(one, range(total_requests)))
+            wall = time.perf_counter() - wall_start
+            summary = _summarize([o[0] for o in outcomes], wall)
+            summary["errors"] = sum(1 for o in outcomes if not o[1])
+            summary["concurrency"] = concurrency
+            results[f"endpoint:{route}"] = summary
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Comparison
+# -----------------------------------------------------------------------------
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Print per-benchmark changes; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':42s} {'base p50':>10s} {'now p50':>10s} {'change':>8s}")
+    for name, now in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("p50_ms"):
+            print(f"{name:42s} {'-':>10s} {now['p50_ms']:10.3f} {'new':>8s}")
+            continue
+        change = now["p50_ms"] / base["p50_ms"] - 1
+        throughput_drop = base.get("ops_per_s") and now["ops_per_s"] < base["ops_per_s"] * (1 - threshold)
+        flag = ""
+        slower = change > threshold and now["p50_ms"] - base["p50_ms"] >= REGRESSION_MIN_MS
+        if slower or (name.startswith("endpoint:") and throughput_drop):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:42s} {base['p50_ms']:10.3f} {now['p50_ms']:10.3f} {change * 100:+7.1f}%{flag}")
+    return regressions
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+SUITES = ("parse", "match", "all_providers", "endpoint")
+
+
+def run(iterations: int, total_requests: int, concurrency: int, only: Sequence[str], latency_ms: float,
+        keep_rate_limit: bool) -> Dict[str, Any]:
+    fixtures.build()
+    stub = StubServer(latency_ms=latency_ms).start()
+    upstream.STUB_URL = stub.url
+    if not keep_rate_limit:
+        # ProPublica's limiter would turn every cold lookup into a fixed 0.5s
+        # sleep; it protects the real API, not the stub.
+        propublica.RATE_LIMIT_DELAY = 0.0
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        if "parse" in only:
+            results.update(bench_parse(iterations))
+        if "match" in only:
+            results.update(bench_match(iterations))
+        if "all_providers" in only:
+            results.update(bench_all_providers(iterations))
+        if "endpoint" in only:
+            results.update(bench_endpoints(total_requests, concurrency))
+    finally:
+        stub.stop()
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "requests": total_requests,
+            "concurrency": concurrency,
+            "latency_ms": latency_ms,
+            "rate_limited": keep_rate_limit,
+            "stub_requests": stub.requests,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description="Offline latency/throughput benchmarks")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", default=",".join(SUITES), help=f"Comma-separated subset of {SUITES}")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated upstream latency")
+    parser.add_argument("--keep-rate-limit", action="store_true", help="Leave the ProPublica rate limiter on")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if --compare finds a regression")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    only = [s.strip() for s in args.only.split(",") if s.strip()]
+    report = run(args.iterations, args.requests, args.concurrency, only, args.latency_ms, args.keep_rate_limit)
+
+    for name, stats in report["results"].items():
+        print(f"{name:42s} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  {stats['ops_per_s']:9.1f}/s")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
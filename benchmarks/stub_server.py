@@ -0,0 +1,127 @@
+"""
+Local upstream stub replaying the benchmark fixtures.
+
+Serves `benchmarks/fixtures/<host>/<path>` for requests to `/<host>/<path>`,
+which is the shape `upstream.get` produces when UPSTREAM_STUB_URL is set.
+ProPublica search is answered from `propublica_orgs.json` by matching
+every query word against the organization name, so arbitrary queries work
+without one fixture file per query. Organization lookups accept EINs with
+or without leading zeros, as ProPublica does.
+
+Usage:
+    python -m benchmarks.stub_server [--port 8765] [--latency-ms 0]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+from benchmarks import fixtures
+
+SEARCH_PATH = f"{fixtures.PROPUBLICA_HOST}/nonprofits/api/v2/search.json"
+SEARCH_PAGE_SIZE = 25
+# Fixtures store orgs under 9-digit EINs; ProPublica also answers unpadded ones
+ORG_PATH_RE = re.compile(rf"^({re.escape(fixtures.PROPUBLICA_HOST)}/nonprofits/api/v2/organizations/)(\d+)\.json$")
+
+CONTENT_TYPES = {".pdf": "application/pdf", ".json": "application/json"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - stdlib signature
+        pass
+
+    def do_GET(self) -> None:  # noqa: N802 - stdlib naming
+        self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path).lstrip("/")
+        if path == SEARCH_PATH:
+            self._send(200, "application/json", json.dumps(self.server.search(parse_qs(parsed.query))).encode())
+            return
+        org = ORG_PATH_RE.match(path)
+        if org:
+            path = f"{org[1]}{org[2].zfill(9)}.json"
+        file_path = (self.server.root / path).resolve()
+        if self.server.root not in file_path.parents or not file_path.is_file():
+            self._send(404, "text/plain", b"not found")
+            return
+        content_type = CONTENT_TYPES.get(file_path.suffix, "text/html; charset=utf-8")
+        self._send(200, content_type, file_path.read_bytes())
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded HTTP server over a fixture directory; `url` is its base URL."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency_ms: float = 0.0, root: Optional[Path] = None) -> None:
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.root = (root or fixtures.FIXTURES_DIR).resolve()
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        orgs_path = self.root / "propublica_orgs.json"
+        self._orgs: List[Dict[str, Any]] = (
+            json.loads(orgs_path.read_text(encoding="utf-8")) if orgs_path.exists() else []
+        )
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def search(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        words = (query.get("q") or [""])[0].lower().split()
+        state = (query.get("state[id]") or [""])[0].upper()
+        page = int((query.get("page") or ["0"])[0])
+        matches = [
+            org for org in self._orgs
+            if all(w in org["name"].lower() for w in words) and (not state or org["state"] == state)
+        ]
+        start = page * SEARCH_PAGE_SIZE
+        return {"total_results": len(matches), "organizations": matches[start:start + SEARCH_PAGE_SIZE]}
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="upstream-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.stub_server", description="Serve benchmark fixtures")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    args = parser.parse_args(argv)
+    fixtures.build()
+    server = StubServer(args.port, args.latency_ms)
+    print(f"Serving fixtures at {server.url} (set UPSTREAM_STUB_URL={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+API Traffic Capture
+
+When REQUEST_CAPTURE_PATH is set, every `/api/` request is appended to
+that file as one JSON line, in the shape `benchmarks.replay` plays back:
+
+    {"ts": 1760000000.123, "method": "GET", "path": "/api/providers",
+     "route": "/api/providers", "params": {"town": "Hartford"},
+     "status": 200, "durationMs": 41.2, "cache": "HIT"}
+
+Only the path, query parameters and (for small JSON POSTs) the body are
+kept; headers, cookies and client addresses never are, and parameters
+whose names look like credentials are redacted. Admin and probe routes
+are skipped. REQUEST_CAPTURE_SAMPLE (0-1, default 1) captures a fraction
+of requests. Capture is off unless the path is set; there is no default
+file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import parse_qsl
+
+import timing
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_PATH = os.environ.get("REQUEST_CAPTURE_PATH", "")
+CAPTURE_SAMPLE = float(os.environ.get("REQUEST_CAPTURE_SAMPLE", "1") or 1)
+
+MAX_BODY_BYTES = 16 * 1024
+MAX_PARAM_CHARS = 200
+SKIP_PREFIXES = ("/api/admin", "/api/health", "/api/ready")
+
+_SENSITIVE_RE = re.compile(r"token|key|secret|password|passwd|auth|session|cookie", re.IGNORECASE)
+REDACTED = "[redacted]"
+
+_queue: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(CAPTURE_PATH)
+
+
+def sanitize_params(query_string: str) -> Dict[str, Union[str, List[str]]]:
+    """Query parameters with credentials redacted and long values truncated."""
+    params: Dict[str, Union[str, List[str]]] = {}
+    for name, value in parse_qsl(query_string, keep_blank_values=True):
+        value = REDACTED if _SENSITIVE_RE.search(name) else value[:MAX_PARAM_CHARS]
+        existing = params.get(name)
+        if existing is None:
+            params[name] = value
+        elif isinstance(existing, list):
+            existing.append(value)
+        else:
+            params[name] = [existing, value]
+    return params
+
+
+def _sanitize_body(body: Any) -> Any:
+    if isinstance(body, dict):
+        return {k: REDACTED if _SENSITIVE_RE.search(str(k)) else _sanitize_body(v) for k, v in body.items()}
+    if isinstance(body, list):
+        return [_sanitize_body(v) for v in body]
+    return body
+
+
+def _write_loop(path: str) -> None:
+    with open(path, "a", encoding="utf-8") as fh:
+        while True:
+            line = _queue.get()
+            if line is None:
+                return
+            fh.write(line + "\n")
+            fh.flush()
+
+
+def _enqueue(record: Dict[str, Any]) -> None:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                directory = os.path.dirname(os.path.abspath(CAPTURE_PATH))
+                os.makedirs(directory, exist_ok=True)
+                _writer = threading.Thread(target=_write_loop, args=(CAPTURE_PATH,), name="capture", daemon=True)
+                _writer.start()
+                logger.info("Capturing API requests to %s", CAPTURE_PATH)
+    _queue.put(json.dumps(record, separators=(",", ":")))
+
+
+class CaptureMiddleware:
+    """ASGI middleware appending sanitized API requests to CAPTURE_PATH."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith(SKIP_PREFIXES)
+            or (CAPTURE_SAMPLE < 1 and random.random() >= CAPTURE_SAMPLE)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.time()
+        status = {"code": 500}
+        chunks: List[bytes] = []
+        is_json = any(k == b"content-type" and b"json" in v for k, v in scope.get("headers", ()))
+
+        async def receive_wrapper():
+            message = await receive()
+            if is_json and message["type"] == "http.request" and sum(map(len, chunks)) <= MAX_BODY_BYTES:
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            route = scope.get("route")
+            timings = timing.current()
+            record: Dict[str, Any] = {
+                "ts": round(start, 3),
+                "method": scope.get("method", ""),
+                "path": path,
+                "route": getattr(route, "path", None) or "unmatched",
+                "params": sanitize_params(scope.get("query_string", b"").decode("latin-1")),
+                "status": status["code"],
+                "durationMs": round((time.time() - start) * 1000, 1),
+                "cache": timings.cache_status() if timings else None,
+            }
+            body = b"".join(chunks)
+            if body and len(body) <= MAX_BODY_BYTES:
+                try:
+                    record["body"] = _sanitize_body(json.loads(body))
+                except ValueError:
+                    pass
+            _enqueue(record)
@@ -0,0 +1,337 @@
+"""
+DDS Roster Change Feed
+
+Keeps the latest roster of every town (keyed by provider profile URL) in
+the local store and logs each provider that appears, disappears or is
+renamed between crawls. Downstream lead jobs poll
+`/api/providers/changes?since=` instead of re-ingesting the whole state.
+
+Each town PDF's digest is stored with its roster, so a refresh that
+downloads an identical PDF reuses the stored roster instead of parsing it
+again (the scraper asks via the `roster.unchanged` event; see
+`roster_if_unchanged`). The first crawl of a town records a
+baseline without change rows; everything after that is a delta.
+
+Changes are also published as `providers.changed` events.
+
+Usage:
+    python -m changefeed crawl                    # crawl every town, log changes
+    python -m changefeed changes --since 2026-10-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import events
+import localstore
+
+logger = logging.getLogger(__name__)
+
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_RENAMED = "renamed"
+
+MAX_CHANGES = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roster_towns (
+    town TEXT PRIMARY KEY,
+    pdf_digest TEXT,
+    crawled_at REAL NOT NULL,
+    changed_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS roster_providers (
+    town TEXT NOT NULL,
+    url TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    removed_at REAL,
+    PRIMARY KEY (town, url)
+);
+
+CREATE TABLE IF NOT EXISTS roster_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    town TEXT NOT NULL,
+    url TEXT NOT NULL,
+    change TEXT NOT NULL,
+    name TEXT NOT NULL,
+    old_name TEXT,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS roster_changes_at ON roster_changes (changed_at);
+"""
+
+# Diffs read then write a town's rows; serialize them so two threads
+# refreshing the same town cannot both log the same change.
+_diff_lock = threading.Lock()
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("changefeed", SCHEMA)
+    return conn
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(timespec="seconds")
+
+
+def parse_since(value: str) -> float:
+    """
+    Parse a `since` value: epoch seconds, an ISO date or an ISO datetime.
+
+    Naive datetimes are taken as UTC. Raises ValueError when unparseable.
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def roster_if_unchanged(town: str, digest: str) -> Optional[List[Dict[str, str]]]:
+    """
+    The stored roster of `town` if it was parsed from a PDF with this digest.
+
+    Returns:
+        Providers as {"name", "url"} dicts in PDF order, or None when the
+        PDF changed (or the town was never crawled) and must be parsed.
+    """
+    conn = _connect()
+    row = conn.execute("SELECT pdf_digest FROM roster_towns WHERE town = ?", (town,)).fetchone()
+    if row is None or row["pdf_digest"] != digest:
+        return None
+    rows = conn.execute(
+        "SELECT name, url FROM roster_providers WHERE town = ? AND removed_at IS NULL ORDER BY position",
+        (town,),
+    ).fetchall()
+    return [{"name": r["name"], "url": r["url"]} for r in rows]
+
+
+def listing(url: str) -> Optional[Dict[str, str]]:
+    """
+    The current roster entry for a provider profile URL.
+
+    Returns:
+        {"name", "url", "town"} from the town where it was first listed, or
+        None if no crawled town lists it (any more).
+    """
+    row = _connect().execute(
+        "SELECT town, name FROM roster_providers WHERE url = ? AND removed_at IS NULL ORDER BY first_seen LIMIT 1",
+        (url,),
+    ).fetchone()
+    return {"name": row["name"], "url": url, "town": row["town"]} if row else None
+
+
+def record_roster(town: str, providers: Sequence[Dict[str, str]], digest: Optional[str] = None) -> Dict[str, list]:
+    """
+    Store a freshly loaded roster and log how it differs from the last one.
+
+    Args:
+        town: Canonical town name
+        providers: Providers with "name" and "url" (ProviderRecords work too)
+        digest: Digest of the town PDF the roster was parsed from
+
+    Returns:
+        Dict with "added", "removed" and "renamed" change lists (all empty
+        for a town's first crawl, which only sets the baseline). An empty
+        roster is not diffed against a non-empty stored one.
+    """
+    now = time.time()
+    current: Dict[str, tuple] = {}
+    for position, p in enumerate(providers):
+        current.setdefault(p["url"], (p["name"], position))
+
+    diff: Dict[str, list] = {CHANGE_ADDED: [], CHANGE_REMOVED: [], CHANGE_RENAMED: []}
+    conn = _connect()
+    with _diff_lock, conn:
+        baseline = conn.execute("SELECT 1 FROM roster_towns WHERE town = ?", (town,)).fetchone() is None
+        previous = {
+            r["url"]: r
+            for r in conn.execute("SELECT url, name, removed_at FROM roster_providers WHERE town = ?", (town,))
+        }
+        if not current and any(old["removed_at"] is None for old in previous.values()):
+            # A failed or truncated parse, not every provider leaving at once
+            logger.warning("Ignoring empty roster for %s; keeping the stored one", town)
+            return diff
+        for url, (name, position) in current.items():
+            old = previous.get(url)
+            if old is None or old["removed_at"] is not None:
+                diff[CHANGE_ADDED].append({"url": url, "name": name})
+            elif old["name"] != name:
+                diff[CHANGE_RENAMED].append({"url": url, "name": name, "oldName": old["name"]})
+        for url, old in previous.items():
+            if old["removed_at"] is None and url not in current:
+                diff[CHANGE_REMOVED].append({"url": url, "name": old["name"]})
+
+        conn.executemany(
+            """
+            INSERT INTO roster_providers (town, url, name, position, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (town, url) DO UPDATE SET
+                name = excluded.name, position = excluded.position,
+                last_seen = excluded.last_seen, removed_at = NULL
+            """,
+            [(town, url, name, position, now, now) for url, (name, position) in current.items()],
+        )
+        conn.executemany(
+            "UPDATE roster_providers SET removed_at = ? WHERE town = ? AND url = ?",
+            [(now, town, c["url"]) for c in diff[CHANGE_REMOVED]],
+        )
+
+        changed = any(diff.values())
+        if baseline:
+            diff = {kind: [] for kind in diff}
+        else:
+            conn.executemany(
+                """
+                INSERT INTO roster_changes (town, url, change, name, old_name, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (town, c["url"], kind, c["name"], c.get("oldName"), now)
+                    for kind, items in diff.items()
+                    for c in items
+                ],
+            )
+        conn.execute(
+            """
+            INSERT INTO roster_towns (town, pdf_digest, crawled_at, changed_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (town) DO UPDATE SET
+                pdf_digest = excluded.pdf_digest, crawled_at = excluded.crawled_at,
+                changed_at = COALESCE(excluded.changed_at, roster_towns.changed_at)
+            """,
+            (town, digest, now, now if changed else None),
+        )
+
+    if any(diff.values()):
+        logger.info(
+            "Roster changes for %s: %d added, %d removed, %d renamed",
+            town, len(diff[CHANGE_ADDED]), len(diff[CHANGE_REMOVED]), len(diff[CHANGE_RENAMED]),
+        )
+        events.publish("providers.changed", town=town, **diff)
+    return diff
+
+
+def changes_since(
+    since: float,
+    town: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = 1000,
+) -> Dict[str, Any]:
+    """
+    Roster changes logged after `since` (epoch seconds), oldest first.
+
+    Args:
+        since: Only changes strictly after this time
+        town: Restrict to one town (canonical name, case-insensitive)
+        after_id: Resume after this change id (the previous `nextCursor`)
+        limit: Maximum changes to return (capped at MAX_CHANGES)
+
+    Returns:
+        Dict with `changes`, `nextCursor` (pass back as `after_id` while
+        `truncated` is true) and tracking stats.
+    """
+    limit = max(1, min(limit, MAX_CHANGES))
+    sql = "SELECT id, town, url, change, name, old_name, changed_at FROM roster_changes WHERE changed_at > ?"
+    params: List[Any] = [since]
+    if town:
+        sql += " AND town = ? COLLATE NOCASE"
+        params.append(town)
+    if after_id is not None:
+        sql += " AND id > ?"
+        params.append(after_id)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit + 1)
+
+    conn = _connect()
+    rows = conn.execute(sql, params).fetchall()
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    tracked = conn.execute("SELECT COUNT(*) AS n, MAX(crawled_at) AS last FROM roster_towns").fetchone()
+    return {
+        "since": _iso(since),
+        "changes": [
+            {
+                "id": r["id"],
+                "town": r["town"],
+                "url": r["url"],
+                "change": r["change"],
+                "name": r["name"],
+                "oldName": r["old_name"],
+                "changedAt": _iso(r["changed_at"]),
+            }
+            for r in rows
+        ],
+        "nextCursor": rows[-1]["id"] if rows else after_id,
+        "truncated": truncated,
+        "townsTracked": tracked["n"],
+        "lastCrawl": _iso(tracked["last"]),
+    }
+
+
+def _mark_crawled(town: str) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute("UPDATE roster_towns SET crawled_at = ? WHERE town = ?", (time.time(), town))
+
+
+def _on_providers_loaded(
+    town: str, providers: List[Any], digest: Optional[str] = None, unchanged: bool = False, **_: Any
+) -> None:
+    if unchanged:
+        _mark_crawled(town)  # same PDF as the stored roster: nothing to diff
+    else:
+        record_roster(town, providers, digest)
+
+
+def register() -> None:
+    """
+    Record a roster snapshot whenever a town's providers are (re)loaded, and
+    let the scraper reuse stored rosters of unchanged town PDFs.
+    """
+    events.subscribe("providers.loaded", _on_providers_loaded)
+    events.subscribe("roster.unchanged", roster_if_unchanged)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="changefeed", description="DDS roster change feed")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("crawl", help="Crawl every DDS town and log roster changes")
+    changes = sub.add_parser("changes", help="Print changes as JSON")
+    changes.add_argument("--since", required=True, help="Epoch seconds or ISO date/datetime")
+    changes.add_argument("--town")
+    changes.add_argument("--limit", type=int, default=MAX_CHANGES)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "crawl":
+        import scraper
+
+        started = time.time()
+        register()
+        scraper.get_all_providers_flat()
+        found = changes_since(started, limit=MAX_CHANGES)
+        print(f"{len(found['changes'])} roster changes across {found['townsTracked']} towns")
+    elif args.command == "changes":
+        print(json.dumps(changes_since(parse_since(args.since), args.town, limit=args.limit), indent=2))
+
+
+if __name__ == "__main__":
+    main()
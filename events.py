@@ -0,0 +1,59 @@
+"""
+In-process event hooks.
+
+Loaders in `scraper` and `propublica` publish what they fetch; indexes
+derived from that data subscribe here instead of being imported by the
+loaders. Handler errors are logged and never reach the publisher.
+
+Topics:
+    providers.loaded   town: str, providers: list of {"name", "url"} records,
+                       digest: str of the town PDF, unchanged: bool (True when
+                       the PDF matched the stored roster and was not parsed;
+                       accept **_ for future fields)
+    providers.changed  town: str, added / removed / renamed: lists of
+                       {"url", "name"} dicts (renamed also has "oldName")
+    nonprofits.seen    orgs: list of {"ein", "name", "city", "state"} dicts
+
+Queries (see `ask`):
+    roster.unchanged   town: str, digest: str -> the stored roster as
+                       {"name", "url"} dicts if it was parsed from a PDF
+                       with that digest, else None
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from typing import Any, Callable, DefaultDict, List
+
+logger = logging.getLogger(__name__)
+
+_SUBSCRIBERS: DefaultDict[str, List[Callable[..., None]]] = defaultdict(list)
+
+
+def subscribe(topic: str, handler: Callable[..., None]) -> None:
+    """Call `handler(**payload)` whenever `topic` is published (once per handler)."""
+    if handler not in _SUBSCRIBERS[topic]:
+        _SUBSCRIBERS[topic].append(handler)
+
+
+def publish(topic: str, **payload) -> None:
+    """Notify all subscribers of `topic`, synchronously and in subscription order."""
+    for handler in list(_SUBSCRIBERS.get(topic, ())):
+        try:
+            handler(**payload)
+        except Exception:  # noqa: BLE001
+            logger.exception("Event handler %s failed for %s", getattr(handler, "__name__", handler), topic)
+
+
+def ask(topic: str, **payload) -> Any:
+    """The first non-None answer from `topic`'s subscribers (None if none answers)."""
+    for handler in list(_SUBSCRIBERS.get(topic, ())):
+        try:
+            answer = handler(**payload)
+        except Exception:  # noqa: BLE001
+            logger.exception("Event handler %s failed for %s", getattr(handler, "__name__", handler), topic)
+            continue
+        if answer is not None:
+            return answer
+    return None
@@ -0,0 +1,249 @@
+"""
+Streaming Lead Export
+
+One row per DDS provider listing (from `scraper.get_all_providers_flat`,
+or a single town), joined with the EIN it is matched to in the `matches`
+table (matching it there first if needed) and that organization's latest
+financials from `get_financial_history`.
+
+Rows are produced one provider at a time and written out in chunks of
+CHUNK_ROWS, so a statewide export streams with constant memory instead of
+the browser fetching every organization itself. The first row is sent on
+its own and a partial chunk is sent once CHUNK_SECONDS have passed, so a
+cold-cache export (about one ProPublica call a second) never goes quiet
+long enough for a proxy to drop it. Formats:
+
+- `csv` and `ndjson`
+- `parquet`, when the optional `pyarrow` package is installed (one row
+  group per chunk, after the file header is sent up front)
+
+Usage:
+    python -m export --format csv --town Hartford > hartford.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import logging
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import matches
+import propublica
+import scraper
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+FORMAT_PARQUET = "parquet"
+
+MEDIA_TYPES = {
+    FORMAT_CSV: "text/csv; charset=utf-8",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+}
+
+CHUNK_ROWS = 200
+CHUNK_SECONDS = 10.0  # longest wait before a partial chunk is sent
+
+COLUMNS: List[Tuple[str, str]] = [  # (name, parquet type)
+    ("town", "string"),
+    ("provider_name", "string"),
+    ("provider_url", "string"),
+    ("ein", "string"),
+    ("org_name", "string"),
+    ("org_city", "string"),
+    ("match_score", "float64"),
+    ("latest_year", "string"),
+    ("revenue", "int64"),
+    ("expenses", "int64"),
+    ("net_income", "int64"),
+    ("total_assets", "int64"),
+    ("net_assets", "int64"),
+    ("years_available", "int64"),
+    ("revenue_change_pct", "float64"),
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+# -----------------------------------------------------------------------------
+# Rows
+# -----------------------------------------------------------------------------
+
+
+def _financial_columns(ein: str, years: int) -> Dict[str, Any]:
+    history = propublica.get_financial_history(ein, years)
+    if not history:
+        return {"years_available": 0}
+    latest, oldest = history[0], history[-1]
+    change = None
+    if len(history) > 1 and latest.revenue is not None and oldest.revenue:
+        change = round((latest.revenue - oldest.revenue) / abs(oldest.revenue) * 100, 1)
+    return {
+        "latest_year": latest.year,
+        "revenue": latest.revenue,
+        "expenses": latest.expenses,
+        "net_income": latest.net_income,
+        "total_assets": latest.total_assets,
+        "net_assets": latest.net_assets,
+        "years_available": len(history),
+        "revenue_change_pct": change,
+    }
+
+
+def iter_rows(town: Optional[str] = None, financials: bool = True, years: int = 5) -> Iterator[Dict[str, Any]]:
+    """
+    Lead rows for every DDS provider (or one town's), in roster order.
+
+    A provider listed in several towns is looked up once per export. Lookup
+    errors leave the row's ProPublica columns empty rather than ending the
+    export.
+    """
+    providers = scraper.get_providers_for_town(town) if town else scraper.get_all_providers_flat()
+    joined: Dict[str, Dict[str, Any]] = {}  # provider URL -> ProPublica columns
+    for provider in providers:
+        row: Dict[str, Any] = dict.fromkeys(COLUMN_NAMES)
+        row.update(town=provider["town"], provider_name=provider["name"], provider_url=provider["url"])
+        if provider["url"] not in joined:
+            columns: Dict[str, Any] = {}
+            try:
+                match = matches.for_provider(provider["url"]) or matches.match_provider(provider)
+                if match["ein"]:
+                    columns.update(ein=match["ein"], org_name=match["orgName"], match_score=match["score"])
+                    details = propublica.get_nonprofit_details(match["ein"])
+                    if details is not None:
+                        columns.update(org_city=details.city)
+                    if financials:
+                        columns.update(_financial_columns(match["ein"], years))
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Export lookup failed for %s: %s", provider["name"], e)
+            joined[provider["url"]] = columns
+        row.update(joined[provider["url"]])
+        yield row
+
+
+def _chunks(
+    rows: Iterable[Dict[str, Any]], size: int = CHUNK_ROWS, max_wait: float = CHUNK_SECONDS
+) -> Iterator[List[Dict[str, Any]]]:
+    """Rows in lists of up to `size`: the first row alone, then whenever `size` or `max_wait` is reached."""
+    chunk: List[Dict[str, Any]] = []
+    sent_at: Optional[float] = None
+    for row in rows:
+        chunk.append(row)
+        now = time.monotonic()
+        if sent_at is None or len(chunk) >= size or now - sent_at >= max_wait:
+            yield chunk
+            chunk, sent_at = [], now
+    if chunk:
+        yield chunk
+
+
+# -----------------------------------------------------------------------------
+# Writers
+# -----------------------------------------------------------------------------
+
+
+def _stream_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMN_NAMES)
+    writer.writeheader()
+    yield buffer.getvalue().encode("utf-8")  # before the first (slow) lookups, so the download starts at once
+    for chunk in _chunks(rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _stream_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for chunk in _chunks(rows):
+        yield "".join(json.dumps(row) + "\n" for row in chunk).encode("utf-8")
+
+
+class _Drain:
+    """Write-only sink handed to pyarrow; the bytes written so far are taken after each row group."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _stream_parquet(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    pa = lazy_import("pyarrow")
+    pq = lazy_import("pyarrow.parquet")
+    schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in COLUMNS])
+    sink = _Drain()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+        yield sink.take()  # file header, before the first (slow) lookups
+        for chunk in _chunks(rows):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.take()
+    yield sink.take()  # footer
+
+
+_WRITERS = {
+    FORMAT_CSV: _stream_csv,
+    FORMAT_NDJSON: _stream_ndjson,
+    FORMAT_PARQUET: _stream_parquet,
+}
+
+
+def stream(fmt: str, town: Optional[str] = None, financials: bool = True, years: int = 5) -> Iterator[bytes]:
+    """
+    Encoded export chunks in `fmt`.
+
+    Raises ValueError for an unknown format or when Parquet is requested
+    without pyarrow installed (checked before any row is produced).
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == FORMAT_PARQUET and not parquet_available():
+        raise ValueError("Parquet export needs the optional pyarrow package")
+    return _WRITERS[fmt](iter_rows(town, financials, years))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="export", description="Export DDS provider leads")
+    parser.add_argument("--format", choices=list(_WRITERS), default=FORMAT_CSV)
+    parser.add_argument("--town", help="One town instead of the whole state")
+    parser.add_argument("--no-financials", action="store_true")
+    parser.add_argument("--output", "-o", help="File to write (default: stdout)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream(args.format, args.town, not args.no_financials):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Page-Selective Form 990 Text Extraction
+
+Form 990 PDFs run to dozens of pages, but analysis usually needs three
+parts of them:
+
+- `part1`: Part I Summary (mission, revenue/expense totals)
+- `part7`: Part VII compensation of officers, directors and key employees
+- `scheduleO`: Schedule O supplemental narrative
+
+`extract_sections` streams the PDF to an anonymous temp file and opens it
+memory-mapped, so the document sits in the OS page cache rather than the
+heap. Page text is extracted lazily while looking for each part's start
+and end headings (the next Part or Schedule): Part I and Part VII are
+searched from the front, Schedule O from the back (it follows the core
+form), so pages outside the requested ranges are mostly never parsed.
+
+Extracted sections are stored in the local store keyed by EIN, tax
+period and section; a request for already-extracted sections makes no
+upstream call at all. Bump SECTIONS_VERSION when the extraction changes.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import re
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import localstore
+import propublica
+import timing
+from metrics import CACHE_HITS, CACHE_MISSES, PDF_PARSE_SECONDS
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+SECTIONS_VERSION = 1
+
+MAX_SECTION_PAGES = 12  # a part never runs longer than this
+PART1_SCAN_PAGES = 5  # Part I is on the first page of the form, after any cover sheets
+SCHEDULE_O_SCAN_PAGES = 25  # how far back from the end to look for Schedule O
+MIN_TEXT_CHARS = 40  # less text than this on the first pages means a scanned PDF
+
+SECTIONS: Dict[str, Dict[str, Any]] = {
+    "part1": {
+        "title": "Part I Summary",
+        "start": re.compile(r"^\s*Part I\b(?!I|V)[\s.:-]*Summary", re.IGNORECASE | re.MULTILINE),
+        "end": re.compile(r"^\s*(?:Part (?!I\b)[IVX]+\b|SCHEDULE [A-Z]\b)", re.IGNORECASE | re.MULTILINE),
+    },
+    "part7": {
+        "title": "Part VII Compensation",
+        "start": re.compile(r"^\s*Part VII\b(?!I)", re.IGNORECASE | re.MULTILINE),
+        "end": re.compile(r"^\s*(?:Part (?!VII\b)[IVX]+\b|SCHEDULE [A-Z]\b)", re.IGNORECASE | re.MULTILINE),
+    },
+    "scheduleO": {
+        "title": "Schedule O Supplemental Information",
+        "start": re.compile(r"^\s*SCHEDULE O\b", re.MULTILINE),
+        "end": re.compile(r"^\s*SCHEDULE (?!O\b)[A-Z]\b", re.MULTILINE),
+    },
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS form990_sections (
+    ein TEXT NOT NULL,
+    tax_period TEXT NOT NULL,
+    section TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (ein, tax_period, section)
+);
+"""
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("form990", SCHEMA)
+    return conn
+
+
+# -----------------------------------------------------------------------------
+# Page ranges
+# -----------------------------------------------------------------------------
+
+
+class _LazyPages:
+    """Page text extracted on first access and kept for the rest of the document."""
+
+    def __init__(self, pdf: Any) -> None:
+        self._pdf = pdf
+        self._text: Dict[int, str] = {}
+        self.count = len(pdf.pages)
+
+    def __getitem__(self, index: int) -> str:
+        if index not in self._text:
+            page = self._pdf.pages[index]
+            self._text[index] = page.extract_text() or ""
+            page.close()  # drop pdfplumber's per-page object cache
+        return self._text[index]
+
+    @property
+    def read(self) -> int:
+        return len(self._text)
+
+
+def _collect(pages: _LazyPages, name: str, start: int) -> Dict[str, Any]:
+    """Text of a section whose start heading is on page `start`, up to its end heading."""
+    spec = SECTIONS[name]
+    first = pages[start]
+    chunks = [first[spec["start"].search(first).start():]]
+    numbers = [start + 1]
+    end = spec["end"].search(chunks[0], 1)
+    if end is not None:
+        chunks[0] = chunks[0][: end.start()]
+    else:
+        for index in range(start + 1, min(pages.count, start + MAX_SECTION_PAGES)):
+            text = pages[index]
+            end = spec["end"].search(text)
+            if end is not None:
+                if text[: end.start()].strip():
+                    chunks.append(text[: end.start()])
+                    numbers.append(index + 1)
+                break
+            chunks.append(text)
+            numbers.append(index + 1)
+    return {"title": spec["title"], "found": True, "pages": numbers, "text": "\n".join(c.strip() for c in chunks)}
+
+
+def _not_found(name: str) -> Dict[str, Any]:
+    return {"title": SECTIONS[name]["title"], "found": False, "pages": [], "text": ""}
+
+
+def _find_forward(pages: _LazyPages, name: str, first: int, last: int) -> Optional[int]:
+    for index in range(first, min(pages.count, last)):
+        if SECTIONS[name]["start"].search(pages[index]):
+            return index
+    return None
+
+
+def _find_schedule_o(pages: _LazyPages) -> Optional[int]:
+    """First page of Schedule O, scanning back from the end of the document."""
+    start = None
+    for index in range(pages.count - 1, max(-1, pages.count - 1 - SCHEDULE_O_SCAN_PAGES), -1):
+        if SECTIONS["scheduleO"]["start"].search(pages[index]):
+            start = index  # keep going: multi-page Schedule O repeats the heading
+        elif start is not None:
+            break
+    return start
+
+
+def _extract_from_pdf(fileobj: Any, wanted: Sequence[str]) -> Dict[str, Any]:
+    with lazy_import("pdfplumber").open(fileobj) as pdf:
+        pages = _LazyPages(pdf)
+        sections: Dict[str, Dict[str, Any]] = {}
+        part1 = None
+        if "part1" in wanted or "part7" in wanted:
+            part1 = _find_forward(pages, "part1", 0, PART1_SCAN_PAGES)
+        if "part1" in wanted:
+            sections["part1"] = _collect(pages, "part1", part1) if part1 is not None else _not_found("part1")
+        if "part7" in wanted:
+            part7 = _find_forward(pages, "part7", (part1 or 0) + 1, pages.count)
+            sections["part7"] = _collect(pages, "part7", part7) if part7 is not None else _not_found("part7")
+        if "scheduleO" in wanted:
+            schedule_o = _find_schedule_o(pages)
+            sections["scheduleO"] = (
+                _collect(pages, "scheduleO", schedule_o) if schedule_o is not None else _not_found("scheduleO")
+            )
+        scanned = pages.count > 0 and sum(len(pages[i].strip()) for i in range(min(2, pages.count))) < MIN_TEXT_CHARS
+        return {"sections": sections, "pageCount": pages.count, "pagesRead": pages.read, "scanned": scanned}
+
+
+def _spool_and_extract(download: Callable[[Any], int], wanted: Sequence[str]) -> Dict[str, Any]:
+    """Stream a PDF to an anonymous temp file and extract `wanted` from it memory-mapped."""
+    with tempfile.TemporaryFile(prefix="form990-") as fh:
+        size = download(fh)
+        fh.flush()
+        if size == 0:
+            raise ValueError("Empty Form 990 PDF")
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            result = _extract_from_pdf(mapped, wanted)
+    result["bytes"] = size
+    return result
+
+
+# -----------------------------------------------------------------------------
+# Public API
+# -----------------------------------------------------------------------------
+
+
+def parse_sections(value: Optional[str]) -> List[str]:
+    """
+    Parse a comma-separated `sections` parameter (default: all sections).
+
+    Raises ValueError naming any unknown section.
+    """
+    if not value:
+        return list(SECTIONS)
+    wanted = list(dict.fromkeys(s.strip() for s in value.split(",") if s.strip()))
+    unknown = [s for s in wanted if s not in SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown section(s): {', '.join(unknown)}; expected {', '.join(SECTIONS)}")
+    return wanted or list(SECTIONS)
+
+
+def extract_sections(
+    ein: str,
+    year: Optional[int] = None,
+    sections: Optional[Sequence[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Text of the requested Form 990 parts for an organization's filing.
+
+    Args:
+        ein: 9-digit EIN
+        year: Tax year (default: most recent filing with a PDF)
+        sections: Section names from SECTIONS (default: all)
+
+    Returns:
+        Dict with `sections` ({name: {title, found, pages, text}}), the
+        filing's tax period and PDF URL, and page stats when the PDF had to
+        be read; None when there is no Form 990 PDF for the filing.
+        Raises on download or PDF errors.
+    """
+    ein = ein.replace("-", "")
+    wanted = list(sections or SECTIONS)
+    filing = propublica.find_form990_filing(ein, year)
+    if filing is None:
+        return None
+
+    conn = _connect()
+    placeholders = ",".join("?" * len(wanted))
+    rows = conn.execute(
+        f"SELECT section, result FROM form990_sections WHERE ein = ? AND tax_period = ? AND version = ? "
+        f"AND section IN ({placeholders})",
+        (ein, filing.tax_period, SECTIONS_VERSION, *wanted),
+    ).fetchall()
+    found = {r["section"]: json.loads(r["result"]) for r in rows}
+    missing = [name for name in wanted if name not in found]
+
+    response: Dict[str, Any] = {
+        "ein": ein,
+        "taxPeriod": filing.tax_period,
+        "pdfUrl": filing.pdf_url,
+        "cached": not missing,
+    }
+    if missing:
+        CACHE_MISSES.inc(namespace="form990-sections")
+        timing.record_cache(False)
+        with PDF_PARSE_SECONDS.time(doc_type="form990-sections"), timing.span("form990-sections"):
+            extracted = _spool_and_extract(lambda fh: propublica.download_form990(filing, fh), missing)
+        now = time.time()
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO form990_sections (ein, tax_period, section, version, result, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ein, tax_period, section) DO UPDATE SET
+                    version = excluded.version, result = excluded.result, created_at = excluded.created_at
+                """,
+                [
+                    (ein, filing.tax_period, name, SECTIONS_VERSION, json.dumps(result), now)
+                    for name, result in extracted["sections"].items()
+                ],
+            )
+        found.update(extracted["sections"])
+        response.update(
+            pageCount=extracted["pageCount"],
+            pagesRead=extracted["pagesRead"],
+            scanned=extracted["scanned"],
+            bytes=extracted["bytes"],
+        )
+        logger.info(
+            "Extracted Form 990 sections %s for %s/%s (%d of %d pages read)",
+            ",".join(missing), ein, filing.tax_period, extracted["pagesRead"], extracted["pageCount"],
+        )
+    else:
+        CACHE_HITS.inc(namespace="form990-sections")
+        timing.record_cache(True)
+
+    response["sections"] = {name: found[name] for name in wanted}
+    return response
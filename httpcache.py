@@ -0,0 +1,156 @@
+"""
+HTTP Caching for Cached JSON Endpoints
+
+Endpoints whose payload comes straight from a scraper/ProPublica cache
+entry (`/api/towns`, `/api/providers`, `/api/propublica/financials/{ein}`)
+answer through `cached_json`, which adds:
+
+- a strong ETag (hash of the body) and 304 Not Modified on If-None-Match
+- Cache-Control `max-age` equal to the entry's remaining TTL, plus
+  Last-Modified from when it was loaded
+- gzip, or brotli when the optional `brotli` package is installed, for
+  bodies over COMPRESS_MIN_BYTES
+
+The serialized and compressed bodies are memoized per cache entry
+version, so repeat requests skip the loader, JSON encoding and
+compression entirely until the entry is reloaded.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import timing
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 8
+MAX_MEMOIZED = 512
+
+CacheInfo = Tuple[int, float, float]  # (version, loaded_at, expires_at)
+
+
+@dataclass
+class _Body:
+    version: int
+    loaded_at: float
+    expires_at: float
+    etag: str
+    raw: bytes
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+
+_BODIES: "OrderedDict[str, _Body]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in {"q=0", "q=0.0"}:
+            continue
+        if name:
+            accepted.add(name.lower())
+    return accepted
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Compare ignoring weak prefixes (proxies may weaken a strong ETag)
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def _build_body(payload: Any, info: Optional[CacheInfo]) -> _Body:
+    raw = JSONResponse(jsonable_encoder(payload)).body
+    etag = f'"{hashlib.sha1(raw).hexdigest()[:24]}"'
+    version, loaded_at, expires_at = info if info else (0, time.time(), time.time())
+    body = _Body(version, loaded_at, expires_at, etag, raw)
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        body.gzip = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            body.br = brotli.compress(raw, quality=BROTLI_QUALITY)
+    return body
+
+
+def _respond(request: Request, body: _Body, cacheable: bool) -> Response:
+    max_age = max(0, int(body.expires_at - time.time())) if cacheable else 0
+    headers: Dict[str, str] = {
+        "ETag": body.etag,
+        "Cache-Control": f"public, max-age={max_age}" if max_age else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if cacheable:
+        headers["Last-Modified"] = formatdate(body.loaded_at, usegmt=True)
+    if _etag_matches(request, body.etag):
+        return Response(status_code=304, headers=headers)
+
+    content, accepted = body.raw, _accepted_encodings(request)
+    if body.br is not None and "br" in accepted:
+        content, headers["Content-Encoding"] = body.br, "br"
+    elif body.gzip is not None and "gzip" in accepted:
+        content, headers["Content-Encoding"] = body.gzip, "gzip"
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def cached_json(
+    request: Request,
+    memo_key: str,
+    cache_info: Callable[[], Optional[CacheInfo]],
+    load: Callable[[], Any],
+) -> Response:
+    """
+    Respond with `load()` as JSON, validated and memoized by cache version.
+
+    Args:
+        request: The incoming request (for If-None-Match / Accept-Encoding)
+        memo_key: Identifies the response body (route plus anything in the
+            payload taken from the request)
+        cache_info: Returns (version, loaded_at, expires_at) of the backing
+            cache entry, or None if there is none (or it expired)
+        load: Produces the payload; may raise HTTPException
+
+    Returns:
+        A 200 (possibly compressed) or 304 response.
+    """
+    info = cache_info()
+    if info is not None:
+        with _lock:
+            body = _BODIES.get(memo_key)
+            if body is not None and body.version == info[0]:
+                _BODIES.move_to_end(memo_key)
+                timing.record_cache(True)
+                return _respond(request, body, cacheable=True)
+
+    payload = load()
+    info = cache_info()  # the loader may have filled or refreshed the entry
+    body = _build_body(payload, info)
+    if info is not None:
+        with _lock:
+            _BODIES[memo_key] = body
+            _BODIES.move_to_end(memo_key)
+            while len(_BODIES) > MAX_MEMOIZED:
+                _BODIES.popitem(last=False)
+    return _respond(request, body, cacheable=info is not None)
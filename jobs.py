@@ -0,0 +1,491 @@
+"""
+Durable Background Jobs for Bulk Lead Generation
+
+A job is a list of towns or EINs processed on the server instead of by a
+browser tab driving hundreds of API calls:
+
+- `towns`: each town's DDS provider roster (`scraper.get_providers_for_town`)
+- `eins`: each organization's details, financial summary, latest Form 990
+  year and matched DDS provider (what `fetch-docs` assembles, minus PDFs)
+- `matches`: re-match DDS provider profile URLs to EINs (see `matches`)
+- `quality`: index provider profile URLs' quality report links (see
+  `quality_index`)
+
+Jobs and their items live in the local store. Each item's result is
+written as soon as it finishes, so progress survives restarts: on startup
+items left `running` by a dead process go back to `pending` and the job
+carries on where it stopped. A failed item is retried up to MAX_ATTEMPTS
+times, waiting RETRY_BACKOFF (then 4x longer) first; unknown EINs and 404s
+fail at once. Workers take items oldest job first (user jobs before the
+ones the crawl queues for matching and indexing), and upstream throughput
+is bounded by the existing ProPublica rate limiter and scraper caches, not
+by the worker count.
+
+JOB_WORKERS sets the in-process worker pool size (default 2, 0 disables it,
+e.g. when a separate `python -m jobs worker` process runs the queue).
+
+Usage:
+    python -m jobs submit --towns Hartford "New Haven"
+    python -m jobs submit --eins 061000001 061000002
+    python -m jobs status <job_id>
+    python -m jobs worker                          # run workers in the foreground
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import localstore
+
+logger = logging.getLogger(__name__)
+
+KIND_TOWNS = "towns"
+KIND_EINS = "eins"
+KIND_MATCHES = "matches"
+KIND_QUALITY = "quality"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+
+ITEM_PENDING = "pending"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_ERROR = "error"
+ITEM_CANCELLED = "cancelled"
+
+# Claimed lowest first: crawl-driven jobs only run when no user job is waiting
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+MAX_JOB_ITEMS = 2000
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 30.0  # seconds before the first retry, x4 for each later one
+MAX_RESULTS_PAGE = 500
+POLL_SECONDS = 2.0
+JOB_RETENTION = 7 * 24 * 60 * 60  # finished jobs are pruned after 7 days
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    priority INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated_at REAL,
+    not_before REAL,
+    PRIMARY KEY (job_id, position)
+);
+CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, job_id, position);
+"""
+ADDED_COLUMNS = {
+    "jobs": {"priority": "INTEGER NOT NULL DEFAULT 0"},
+    "job_items": {"not_before": "REAL"},
+}
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("jobs", SCHEMA, ADDED_COLUMNS)
+    return conn
+
+
+# -----------------------------------------------------------------------------
+# Item handlers
+# -----------------------------------------------------------------------------
+
+
+def _run_town(town: str) -> Dict[str, Any]:
+    import scraper
+
+    providers = scraper.get_providers_for_town(town)
+    return {"town": town, "providers": [p.to_dict() for p in providers], "count": len(providers)}
+
+
+def _run_ein(ein: str) -> Dict[str, Any]:
+    import matches
+    import propublica
+
+    details = propublica.get_nonprofit_details(ein)
+    if details is None:
+        raise LookupError(f"Organization not found for EIN: {ein}")
+
+    form990_year = next((f.tax_period for f in details.filings if f.pdf_url), None)
+    return {
+        "ein": details.ein,
+        "name": details.name,
+        "city": details.city,
+        "state": details.state,
+        "financials": propublica.get_financial_summary(ein),
+        "form990Year": form990_year,
+        "ddsProvider": matches.provider_for_org(details.ein, details.name, details.city),
+    }
+
+
+def _run_match(url: str) -> Dict[str, Any]:
+    import matches
+
+    return matches.match_listing(url)
+
+
+def _run_quality(url: str) -> Dict[str, Any]:
+    import quality_index
+
+    return quality_index.index_provider(url)
+
+
+_HANDLERS: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    KIND_TOWNS: _run_town,
+    KIND_EINS: _run_ein,
+    KIND_MATCHES: _run_match,
+    KIND_QUALITY: _run_quality,
+}
+
+
+# -----------------------------------------------------------------------------
+# Queue
+# -----------------------------------------------------------------------------
+
+
+def submit(kind: str, keys: Sequence[str], priority: int = PRIORITY_USER) -> Dict[str, Any]:
+    """
+    Queue a job over `keys` (town names or EINs, duplicates dropped).
+
+    Jobs queued by the crawl itself pass PRIORITY_BACKGROUND, so their items
+    are only claimed while no PRIORITY_USER job has pending items.
+
+    Raises ValueError for an unknown kind, no keys or more than MAX_JOB_ITEMS.
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if kind == KIND_EINS:
+        keys = [k.replace("-", "").strip() for k in keys]
+    keys = list(dict.fromkeys(k.strip() for k in keys if k and k.strip()))
+    if not keys:
+        raise ValueError("A job needs at least one town or EIN")
+    if len(keys) > MAX_JOB_ITEMS:
+        raise ValueError(f"A job can hold at most {MAX_JOB_ITEMS} items, got {len(keys)}")
+
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, total, created_at, priority) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, STATUS_QUEUED, len(keys), now, priority),
+        )
+        conn.executemany(
+            "INSERT INTO job_items (job_id, position, key, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, position, key, ITEM_PENDING, now) for position, key in enumerate(keys)],
+        )
+    logger.info("Queued %s job %s with %d items", kind, job_id, len(keys))
+    _wake.set()
+    return get_job(job_id)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Status and progress of a job, or None if unknown."""
+    conn = _connect()
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+    counts = {
+        r["status"]: r["n"]
+        for r in conn.execute(
+            "SELECT status, COUNT(*) AS n FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+        )
+    }
+    finished = counts.get(ITEM_DONE, 0) + counts.get(ITEM_ERROR, 0)
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": counts.get(ITEM_DONE, 0),
+        "failed": counts.get(ITEM_ERROR, 0),
+        "pending": counts.get(ITEM_PENDING, 0) + counts.get(ITEM_RUNNING, 0),
+        "progress": round(finished / job["total"], 4) if job["total"] else 1.0,
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"],
+    }
+
+
+def list_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent jobs first."""
+    rows = _connect().execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [job for job in (get_job(r["id"]) for r in rows) if job is not None]
+
+
+def get_results(job_id: str, after: int = -1, limit: int = 100) -> Dict[str, Any]:
+    """
+    Finished items of a job in submission order.
+
+    Args:
+        job_id: Job id
+        after: Only items after this position (the previous `nextCursor`)
+        limit: Maximum items (capped at MAX_RESULTS_PAGE)
+
+    Returns:
+        Dict with `items` ({key, status, result, error}) and `nextCursor`.
+    """
+    limit = max(1, min(limit, MAX_RESULTS_PAGE))
+    rows = _connect().execute(
+        """
+        SELECT position, key, status, result, error FROM job_items
+        WHERE job_id = ? AND position > ? AND status IN (?, ?)
+        ORDER BY position LIMIT ?
+        """,
+        (job_id, after, ITEM_DONE, ITEM_ERROR, limit),
+    ).fetchall()
+    return {
+        "items": [
+            {
+                "position": r["position"],
+                "key": r["key"],
+                "status": r["status"],
+                "result": json.loads(r["result"]) if r["result"] else None,
+                "error": r["error"],
+            }
+            for r in rows
+        ],
+        "nextCursor": rows[-1]["position"] if rows else after,
+    }
+
+
+def cancel(job_id: str) -> Optional[Dict[str, Any]]:
+    """Stop handing out a job's pending items; items already running finish."""
+    conn = _connect()
+    with conn:
+        updated = conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED, STATUS_RUNNING),
+        ).rowcount
+        if updated:
+            conn.execute(
+                "UPDATE job_items SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                (ITEM_CANCELLED, time.time(), job_id, ITEM_PENDING),
+            )
+    return get_job(job_id)
+
+
+def resume() -> int:
+    """
+    Requeue items a previous process left running, and prune old jobs.
+
+    Returns:
+        Number of items put back to pending.
+    """
+    conn = _connect()
+    with conn:
+        requeued = conn.execute(
+            """
+            UPDATE job_items SET status = ?, updated_at = ?
+            WHERE status = ? AND job_id IN (SELECT id FROM jobs WHERE status IN (?, ?))
+            """,
+            (ITEM_PENDING, time.time(), ITEM_RUNNING, STATUS_QUEUED, STATUS_RUNNING),
+        ).rowcount
+        cutoff = time.time() - JOB_RETENTION
+        conn.execute(
+            "DELETE FROM job_items WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)", (cutoff,)
+        )
+        conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+    if requeued:
+        logger.info("Resumed %d interrupted job items", requeued)
+    return requeued
+
+
+def _claim() -> Optional[Dict[str, Any]]:
+    """Mark the next pending item running and return it (None when idle)."""
+    conn = _connect()
+    while True:
+        row = conn.execute(
+            """
+            SELECT i.job_id, i.position, i.key, j.kind FROM job_items i JOIN jobs j ON j.id = i.job_id
+            WHERE i.status = ? AND j.status IN (?, ?) AND (i.not_before IS NULL OR i.not_before <= ?)
+            ORDER BY j.priority, j.created_at, i.position LIMIT 1
+            """,
+            (ITEM_PENDING, STATUS_QUEUED, STATUS_RUNNING, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        with conn:
+            claimed = conn.execute(
+                """
+                UPDATE job_items SET status = ?, attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ? AND position = ? AND status = ?
+                """,
+                (ITEM_RUNNING, now, row["job_id"], row["position"], ITEM_PENDING),
+            ).rowcount
+            if claimed:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?) WHERE id = ? AND status = ?",
+                    (STATUS_RUNNING, now, row["job_id"], STATUS_QUEUED),
+                )
+        if claimed:  # else another worker got there first
+            return dict(row)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Failures a retry cannot fix: unknown EINs, 404s."""
+    if isinstance(error, LookupError):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 404
+
+
+def _finish(
+    item: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[str], permanent: bool = False
+) -> None:
+    """Store an item's outcome; a failed item is retried after a backoff unless `permanent`."""
+    conn = _connect()
+    now = time.time()
+    with conn:
+        if error is None:
+            conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = NULL, updated_at = ? WHERE job_id = ? AND position = ?",
+                (ITEM_DONE, json.dumps(result), now, item["job_id"], item["position"]),
+            )
+        else:
+            attempts = conn.execute(
+                "SELECT attempts FROM job_items WHERE job_id = ? AND position = ?",
+                (item["job_id"], item["position"]),
+            ).fetchone()["attempts"]
+            status = ITEM_ERROR if permanent or attempts >= MAX_ATTEMPTS else ITEM_PENDING
+            not_before = now + RETRY_BACKOFF * 4 ** (attempts - 1) if status == ITEM_PENDING else None
+            conn.execute(
+                """
+                UPDATE job_items SET status = ?, error = ?, updated_at = ?, not_before = ?
+                WHERE job_id = ? AND position = ?
+                """,
+                (status, error, now, not_before, item["job_id"], item["position"]),
+            )
+        remaining = conn.execute(
+            "SELECT 1 FROM job_items WHERE job_id = ? AND status IN (?, ?) LIMIT 1",
+            (item["job_id"], ITEM_PENDING, ITEM_RUNNING),
+        ).fetchone()
+        if remaining is None:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (STATUS_DONE, now, item["job_id"], STATUS_RUNNING),
+            )
+    if remaining is None:
+        logger.info("Job %s finished", item["job_id"])
+
+
+def run_next() -> bool:
+    """
+    Process one pending item on the calling thread.
+
+    Returns:
+        False when there was nothing to do.
+    """
+    item = _claim()
+    if item is None:
+        return False
+    permanent = False
+    try:
+        result, error = _HANDLERS[item["kind"]](item["key"]), None
+    except Exception as e:  # noqa: BLE001
+        logger.warning("Job %s item %s failed: %s", item["job_id"], item["key"], e)
+        result, error, permanent = None, str(e) or type(e).__name__, _is_permanent(e)
+    _finish(item, result, error, permanent)
+    return True
+
+
+# -----------------------------------------------------------------------------
+# Worker pool
+# -----------------------------------------------------------------------------
+
+_wake = threading.Event()
+_stop = threading.Event()
+_workers: List[threading.Thread] = []
+
+
+def _worker_loop() -> None:
+    while not _stop.is_set():
+        try:
+            busy = run_next()
+        except Exception:  # noqa: BLE001 - keep the worker alive on store errors
+            logger.exception("Job worker error")
+            busy = False
+        if not busy:
+            _wake.wait(POLL_SECONDS)
+            _wake.clear()
+
+
+def start(workers: int = JOB_WORKERS) -> None:
+    """Resume interrupted jobs and start `workers` daemon worker threads."""
+    if workers <= 0 or _workers:
+        return
+    resume()
+    _stop.clear()
+    for n in range(workers):
+        thread = threading.Thread(target=_worker_loop, name=f"job-worker-{n}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+    logger.info("Started %d job workers", workers)
+
+
+def stop(timeout: float = 5.0) -> None:
+    """Ask workers to exit after their current item; interrupted items resume on next start."""
+    _stop.set()
+    _wake.set()
+    for thread in _workers:
+        thread.join(timeout)
+    _workers.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="jobs", description="Background lead generation jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    submit_cmd = sub.add_parser("submit", help="Queue a job")
+    group = submit_cmd.add_mutually_exclusive_group(required=True)
+    group.add_argument("--towns", nargs="+")
+    group.add_argument("--eins", nargs="+")
+    status_cmd = sub.add_parser("status", help="Print a job's progress (or recent jobs)")
+    status_cmd.add_argument("job_id", nargs="?")
+    worker_cmd = sub.add_parser("worker", help="Run job workers until interrupted")
+    worker_cmd.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "submit":
+        job = submit(KIND_TOWNS, args.towns) if args.towns else submit(KIND_EINS, args.eins)
+        print(json.dumps(job, indent=2))
+    elif args.command == "status":
+        print(json.dumps(get_job(args.job_id) if args.job_id else list_jobs(), indent=2))
+    elif args.command == "worker":
+        start(args.workers)
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""
+Local SQLite Store for Bulk Nonprofit Data
+
+Loads the IRS Exempt Organizations Business Master File (BMF) and the
+IRS SOI Form 990 extract files into an indexed SQLite database so that
+search and financial lookups can be answered from local disk. The live
+ProPublica API is only needed for organizations or years missing here.
+
+Usage:
+    python -m localstore import-bmf eo_ct.csv --state CT
+    python -m localstore import-990 22eoextract990.csv
+    python -m localstore stats
+
+Data sources:
+    BMF:          https://www.irs.gov/charities-non-profits/exempt-organizations-business-master-file-extract-eo-bmf
+    990 extracts: https://www.irs.gov/statistics/soi-tax-stats-annual-extract-of-tax-exempt-organization-financial-data
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = Path(os.environ.get("LEADGEN_DB", BASE_DIR / "data" / "leadgen.db"))
+
+# Re-check ProPublica for orgs whose local history looks incomplete at most this often
+LIVE_SYNC_INTERVAL = 30 * 24 * 60 * 60  # 30 days
+
+SEARCH_PAGE_SIZE = 25  # Matches ProPublica's search page size
+IMPORT_BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nonprofits (
+    ein TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    city TEXT,
+    state TEXT,
+    ntee_code TEXT,
+    subsection_code TEXT,
+    source TEXT NOT NULL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS nonprofits_state_name ON nonprofits (state, name);
+
+CREATE TABLE IF NOT EXISTS filings (
+    ein TEXT NOT NULL,
+    tax_period TEXT NOT NULL,
+    pdf_url TEXT,
+    total_revenue INTEGER,
+    total_expenses INTEGER,
+    total_assets INTEGER,
+    net_assets INTEGER,
+    source TEXT NOT NULL,
+    PRIMARY KEY (ein, tax_period)
+);
+
+-- States whose organizations were bulk-loaded from a full BMF extract
+CREATE TABLE IF NOT EXISTS bmf_imports (
+    state TEXT PRIMARY KEY,
+    organizations INTEGER NOT NULL,
+    imported_at REAL NOT NULL
+);
+"""
+
+# Column aliases across BMF / SOI extract vintages and form types (990, 990-EZ)
+EXTRACT_COLUMNS = {
+    "total_revenue": ("totrevenue", "totrevnue"),
+    "total_expenses": ("totfuncexpns", "totexpns"),
+    "total_assets": ("totassetsend",),
+    "net_assets": ("totnetassetend", "totnetassetsend", "networthend"),
+}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schemas_applied: set = set()
+
+
+def _thread_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Get this thread's connection to the local database.
+
+    The database file (and its directory) is created on first use. Other
+    modules keep their own tables in the same file via `ensure_schema`.
+    """
+    conn = _thread_connection()
+    ensure_schema("localstore", SCHEMA)
+    return conn
+
+
+def ensure_schema(name: str, ddl: str, added_columns: Optional[Dict[str, Dict[str, str]]] = None) -> None:
+    """
+    Apply a module's CREATE ... IF NOT EXISTS statements once per process.
+
+    Args:
+        name: Identifies the module's schema
+        ddl: CREATE statements (for new databases, with every column)
+        added_columns: {table: {column: declaration}} added since a table
+            was first released; added to existing tables that lack them
+    """
+    if name in _schemas_applied:
+        return
+    with _schema_lock:
+        if name in _schemas_applied:
+            return
+        conn = _thread_connection()
+        conn.executescript(ddl)
+        for table, columns in (added_columns or {}).items():
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, declaration in columns.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+        conn.commit()
+        # Mark as applied only once the tables exist: other threads skip the lock
+        _schemas_applied.add(name)
+
+
+def enabled() -> bool:
+    """True once a local database exists (after an import or a cached write)."""
+    return DB_PATH.exists()
+
+
+def normalize_ein(ein: str) -> str:
+    """Strip hyphens and restore leading zeros dropped by spreadsheet tools."""
+    digits = re.sub(r"\D", "", str(ein))
+    return digits.zfill(9) if digits else ""
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if value is None:
+        return None
+    text = str(value).strip().replace(",", "")
+    if not text:
+        return None
+    try:
+        return int(float(text))
+    except ValueError:
+        return None
+
+
+def _tax_year(row: Dict[str, str]) -> Optional[str]:
+    """
+    Derive the tax year the way ProPublica's `tax_prd_yr` does.
+
+    SOI extracts carry `tax_pd` as YYYYMM of the fiscal year end; a
+    fiscal year ending before December belongs to the previous tax year.
+    """
+    year = (row.get("tax_yr") or "").strip()
+    if year:
+        return year
+    period = (row.get("tax_pd") or row.get("tax_prd") or "").strip()
+    if len(period) < 6 or not period[:6].isdigit():
+        return None
+    yyyy, mm = int(period[:4]), int(period[4:6])
+    return str(yyyy if mm == 12 else yyyy - 1)
+
+
+def _read_rows(path: Path) -> Iterator[Dict[str, str]]:
+    """
+    Yield rows with lowercased keys from a CSV, TSV, or whitespace-delimited file.
+
+    Older SOI extracts are published as space-delimited .dat files; newer
+    ones (and the BMF) are CSV.
+    """
+    with open(path, "r", encoding="utf-8", errors="ignore", newline="") as fh:
+        header = fh.readline()
+        if "," in header:
+            reader: Iterable[List[str]] = csv.reader(fh)
+            columns = next(csv.reader(io.StringIO(header)))
+        elif "\t" in header:
+            reader = csv.reader(fh, delimiter="\t")
+            columns = header.rstrip("\r\n").split("\t")
+        else:
+            reader = (line.split() for line in fh)
+            columns = header.split()
+        columns = [c.strip().lower() for c in columns]
+        for values in reader:
+            if values:
+                yield dict(zip(columns, values))
+
+
+def import_bmf(path: Path, state: str = "CT") -> int:
+    """
+    Import organizations for one state from an IRS EO BMF CSV.
+
+    Returns:
+        Number of organizations written
+    """
+    state = state.upper()
+    conn = connect()
+    count = 0
+    batch: List[tuple] = []
+
+    def flush() -> None:
+        # Keep synced_at and live-sourced names from ProPublica if already present
+        conn.executemany(
+            """
+            INSERT INTO nonprofits (ein, name, city, state, ntee_code, subsection_code, source)
+            VALUES (?, ?, ?, ?, ?, ?, 'bmf')
+            ON CONFLICT (ein) DO UPDATE SET
+                ntee_code = COALESCE(nonprofits.ntee_code, excluded.ntee_code),
+                subsection_code = COALESCE(nonprofits.subsection_code, excluded.subsection_code),
+                name = CASE WHEN nonprofits.source = 'bmf' THEN excluded.name ELSE nonprofits.name END,
+                city = CASE WHEN nonprofits.source = 'bmf' THEN excluded.city ELSE nonprofits.city END,
+                state = CASE WHEN nonprofits.source = 'bmf' THEN excluded.state ELSE nonprofits.state END
+            """,
+            batch,
+        )
+        batch.clear()
+
+    with conn:
+        for row in _read_rows(path):
+            if (row.get("state") or "").strip().upper() != state:
+                continue
+            ein = normalize_ein(row.get("ein", ""))
+            name = (row.get("name") or "").strip()
+            if not ein or not name:
+                continue
+            batch.append((
+                ein,
+                name,
+                (row.get("city") or "").strip(),
+                state,
+                (row.get("ntee_cd") or "").strip() or None,
+                (row.get("subsection") or "").strip() or None,
+            ))
+            count += 1
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        if count:
+            conn.execute(
+                "INSERT OR REPLACE INTO bmf_imports (state, organizations, imported_at) VALUES (?, ?, ?)",
+                (state, count, time.time()),
+            )
+
+    logger.info("Imported %d %s organizations from %s", count, state, path)
+    return count
+
+
+def import_990_extract(path: Path, all_states: bool = False) -> int:
+    """
+    Import per-year financials from an IRS SOI 990 / 990-EZ extract file.
+
+    Extract files have no state column, so by default only EINs already
+    loaded from the BMF are imported.
+
+    Returns:
+        Number of filing years written
+    """
+    conn = connect()
+    known = None
+    if not all_states:
+        known = {r["ein"] for r in conn.execute("SELECT ein FROM nonprofits")}
+        if not known:
+            logger.warning("No organizations loaded yet; run import-bmf first (or pass --all)")
+            return 0
+
+    def pick(row: Dict[str, str], field: str) -> Optional[int]:
+        for column in EXTRACT_COLUMNS[field]:
+            if column in row:
+                return _to_int(row[column])
+        return None
+
+    count = 0
+    batch: List[tuple] = []
+    upsert = """
+        INSERT INTO filings (ein, tax_period, total_revenue, total_expenses,
+                             total_assets, net_assets, source)
+        VALUES (?, ?, ?, ?, ?, ?, 'irs')
+        ON CONFLICT (ein, tax_period) DO UPDATE SET
+            total_revenue = COALESCE(filings.total_revenue, excluded.total_revenue),
+            total_expenses = COALESCE(filings.total_expenses, excluded.total_expenses),
+            total_assets = COALESCE(filings.total_assets, excluded.total_assets),
+            net_assets = COALESCE(filings.net_assets, excluded.net_assets)
+    """
+
+    with conn:
+        for row in _read_rows(path):
+            ein = normalize_ein(row.get("ein", ""))
+            if not ein or (known is not None and ein not in known):
+                continue
+            year = _tax_year(row)
+            if not year:
+                continue
+            batch.append((
+                ein,
+                year,
+                pick(row, "total_revenue"),
+                pick(row, "total_expenses"),
+                pick(row, "total_assets"),
+                pick(row, "net_assets"),
+            ))
+            count += 1
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                conn.executemany(upsert, batch)
+                batch.clear()
+        if batch:
+            conn.executemany(upsert, batch)
+
+    logger.info("Imported %d filing years from %s", count, path)
+    return count
+
+
+def covers_state(state: str) -> bool:
+    """
+    True if a full BMF extract was imported for `state`.
+
+    Only then is the local store a complete index of the state's
+    organizations; otherwise it holds just the orgs looked up live.
+    """
+    if not enabled():
+        return False
+    row = connect().execute("SELECT 1 FROM bmf_imports WHERE state = ?", (state.upper(),)).fetchone()
+    return row is not None
+
+
+def search_nonprofits(query: str, state: str, page: int = 0) -> List[Dict[str, Any]]:
+    """
+    Search local organizations whose name contains every word of the query.
+
+    Returns:
+        Organization rows as dicts (empty if nothing matches locally)
+    """
+    if not enabled():
+        return []
+    words = [w for w in re.split(r"\s+", query.strip()) if w]
+    if not words:
+        return []
+    clauses = " AND ".join("name LIKE ?" for _ in words)
+    params: List[Any] = [state.upper()] + [f"%{w}%" for w in words]
+    params += [SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE]
+    rows = connect().execute(
+        f"""
+        SELECT ein, name, city, state, ntee_code, subsection_code FROM nonprofits
+        WHERE state = ? AND {clauses}
+        ORDER BY name LIMIT ? OFFSET ?
+        """,
+        params,
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def get_organization(ein: str) -> Optional[Dict[str, Any]]:
+    """
+    Get an organization and its filings (most recent first) from the local store.
+
+    Returns:
+        Dict with organization fields, `synced_at`, and a `filings` list,
+        or None if the EIN is not stored locally
+    """
+    if not enabled():
+        return None
+    ein = normalize_ein(ein)
+    conn = connect()
+    org = conn.execute("SELECT * FROM nonprofits WHERE ein = ?", (ein,)).fetchone()
+    if org is None:
+        return None
+    filings = conn.execute(
+        """
+        SELECT tax_period, pdf_url, total_revenue, total_expenses, total_assets, net_assets, source
+        FROM filings WHERE ein = ? ORDER BY tax_period DESC
+        """,
+        (ein,),
+    ).fetchall()
+    result = dict(org)
+    result["filings"] = [dict(f) for f in filings]
+    return result
+
+
+def get_financial_series(eins: List[str], years: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Bulk-load the most recent `years` filings for many organizations.
+
+    Returns:
+        {ein: {"name": ..., "filings": [rows, most recent first]}} for EINs
+        that have filings locally
+    """
+    if not enabled() or not eins:
+        return {}
+    conn = connect()
+    normalized = sorted({normalize_ein(e) for e in eins if normalize_ein(e)})
+    series: Dict[str, Dict[str, Any]] = {}
+    # Stay well under SQLite's bound-parameter limit
+    for start in range(0, len(normalized), 500):
+        chunk = normalized[start:start + 500]
+        placeholders = ",".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"""
+            SELECT f.ein, n.name, f.tax_period, f.total_revenue, f.total_expenses,
+                   f.total_assets, f.net_assets
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY ein ORDER BY tax_period DESC) AS rn
+                FROM filings WHERE ein IN ({placeholders})
+            ) f JOIN nonprofits n ON n.ein = f.ein
+            WHERE f.rn <= ?
+            ORDER BY f.ein, f.tax_period DESC
+            """,
+            chunk + [years],
+        ).fetchall()
+        for row in rows:
+            entry = series.setdefault(row["ein"], {"name": row["name"], "filings": []})
+            entry["filings"].append(dict(row))
+    return series
+
+
+def is_bulk_imported(org: Dict[str, Any]) -> bool:
+    """
+    True if `org` came from the BMF with IRS extract filings and was never
+    overwritten by live data.
+
+    Such rows are authoritative as stored: the IRS files only change with a
+    re-import, so there is nothing for a TTL-based live refresh to pick up.
+    """
+    return org.get("source") == "bmf" and any(f.get("source") == "irs" for f in org.get("filings") or ())
+
+
+def needs_live_sync(org: Dict[str, Any], max_age: float = LIVE_SYNC_INTERVAL) -> bool:
+    """True if ProPublica hasn't been consulted for this org within `max_age` seconds."""
+    synced_at = org.get("synced_at")
+    return not synced_at or time.time() - synced_at > max_age
+
+
+def save_organization(org: Dict[str, Any], filings: List[Dict[str, Any]]) -> None:
+    """
+    Merge live ProPublica data for an organization into the local store.
+
+    Live values win over bulk-imported ones; years only present locally
+    are kept.
+    """
+    ein = normalize_ein(org["ein"])
+    conn = connect()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO nonprofits (ein, name, city, state, ntee_code, subsection_code, source, synced_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'propublica', ?)
+            ON CONFLICT (ein) DO UPDATE SET
+                name = excluded.name, city = excluded.city, state = excluded.state,
+                ntee_code = COALESCE(excluded.ntee_code, nonprofits.ntee_code),
+                subsection_code = COALESCE(excluded.subsection_code, nonprofits.subsection_code),
+                source = 'propublica', synced_at = excluded.synced_at
+            """,
+            (
+                ein,
+                org.get("name") or "",
+                org.get("city") or "",
+                org.get("state") or "",
+                org.get("ntee_code"),
+                org.get("subsection_code"),
+                time.time(),
+            ),
+        )
+        conn.executemany(
+            """
+            INSERT INTO filings (ein, tax_period, pdf_url, total_revenue, total_expenses,
+                                 total_assets, net_assets, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'propublica')
+            ON CONFLICT (ein, tax_period) DO UPDATE SET
+                pdf_url = COALESCE(excluded.pdf_url, filings.pdf_url),
+                total_revenue = COALESCE(excluded.total_revenue, filings.total_revenue),
+                total_expenses = COALESCE(excluded.total_expenses, filings.total_expenses),
+                total_assets = COALESCE(excluded.total_assets, filings.total_assets),
+                net_assets = COALESCE(excluded.net_assets, filings.net_assets),
+                source = 'propublica'
+            """,
+            [
+                (
+                    ein,
+                    f["tax_period"],
+                    f.get("pdf_url"),
+                    f.get("total_revenue"),
+                    f.get("total_expenses"),
+                    f.get("total_assets"),
+                    f.get("net_assets"),
+                )
+                for f in filings
+                if f.get("tax_period")
+            ],
+        )
+
+
+def stats() -> Dict[str, int]:
+    """Row counts for the nonprofit tables."""
+    conn = connect()
+    return {
+        "nonprofits": conn.execute("SELECT COUNT(*) FROM nonprofits").fetchone()[0],
+        "filings": conn.execute("SELECT COUNT(*) FROM filings").fetchone()[0],
+        "synced": conn.execute(
+            "SELECT COUNT(*) FROM nonprofits WHERE synced_at IS NOT NULL"
+        ).fetchone()[0],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="localstore", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bmf = sub.add_parser("import-bmf", help="Import an IRS EO BMF CSV")
+    bmf.add_argument("path", type=Path)
+    bmf.add_argument("--state", default="CT")
+
+    extract = sub.add_parser("import-990", help="Import an IRS SOI 990/990-EZ extract")
+    extract.add_argument("path", type=Path, nargs="+")
+    extract.add_argument("--all", action="store_true", help="Don't restrict to BMF-loaded EINs")
+
+    sub.add_parser("stats", help="Show row counts")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "import-bmf":
+        import_bmf(args.path, args.state)
+    elif args.command == "import-990":
+        for path in args.path:
+            import_990_extract(path, all_states=args.all)
+    print(stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,40 @@
 from __future__ import annotations
 
 import base64
+import datetime
 import logging
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
+import admin
+import admission
+import capture
+import changefeed
+import export
+import form990
+import httpcache
+import jobs
+import matches
+import metrics
+import pdfextract
+import prefetch
 import scraper
 import propublica
+import proximity
+import quality_index
+import searches
+import static_assets
+import suggest
+import timing
+import upstream
+from startup import lazy_import, readiness
 
 # Configure logging
 logging.basicConfig(
@@ -38,22 +59,75 @@ ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", DEFAULT_ORIGINS).split(",")
 # You can restrict this by setting ALLOWED_ORIGINS env var to your frontend URL
 ALLOW_ALL_ORIGINS = os.environ.get("RAILWAY_ENVIRONMENT") or os.environ.get("ALLOW_ALL_ORIGINS")
 
-app = FastAPI(title="DDS Provider Scraper")
+# Optional cache warm-up gating /api/ready: "" (off), "towns", or "all"
+WARM_CACHE = os.environ.get("WARM_CACHE", "").strip().lower()
 
+
+def _warmup_steps() -> list:
+    if WARM_CACHE in ("", "0", "false", "off"):
+        return []
+    steps = [
+        ("towns", scraper.get_towns),
+        ("pdfplumber", lambda: lazy_import("pdfplumber")),
+    ]
+    if WARM_CACHE == "all":
+        steps.append(("all_providers", scraper.get_all_providers_flat))
+    return steps
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    readiness.app_started()
+    admission.reserve_threads()
+    readiness.warm_up(_warmup_steps())
+    jobs.start()
+    yield
+    jobs.stop()
+
+
+app = FastAPI(title="DDS Provider Scraper", lifespan=lifespan)
+
+# Innermost, so 429/503 rejections still get CORS headers and are timed
+app.add_middleware(admission.AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"] if ALLOW_ALL_ORIGINS else ALLOWED_ORIGINS,
     allow_credentials=False,
-    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["Server-Timing", "X-Cache-Status", "ETag", "Retry-After"],
 )
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.add_middleware(metrics.MetricsMiddleware)
+if capture.enabled():
+    # Inside TimingMiddleware so the request's cache status is available
+    app.add_middleware(capture.CaptureMiddleware)
+app.add_middleware(timing.TimingMiddleware)
+
+# Precompressed once here; served from memory by index() and static_file()
+static_assets.load(STATIC_DIR)
 
+# Keep the typeahead index current as scraper/ProPublica caches refresh
+suggest.register()
+# Snapshot each town roster as it loads and log provider changes
+changefeed.register()
+# Re-match added/renamed providers to EINs in the background
+matches.register()
+# Index quality report links of crawled providers in the background
+quality_index.register()
 
-@app.get("/")
-def index() -> FileResponse:
-    return FileResponse(STATIC_DIR / "index.html")
+
+@app.api_route("/", methods=["GET", "HEAD"])
+async def index(request: Request) -> Response:
+    return static_assets.respond(request, "index.html")
+
+
+@app.api_route("/static/{name:path}", methods=["GET", "HEAD"])
+async def static_file(request: Request, name: str) -> Response:
+    response = static_assets.respond(request, name)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
 
 
 @app.get("/api/health")
@@ -62,21 +136,108 @@ def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/api/ready")
+def ready() -> Response:
+    """
+    Readiness probe, separate from /api/health (liveness).
+
+    Returns 503 until the optional WARM_CACHE warm-up has finished, along
+    with startup timings, lazy-import costs, admission lane occupancy and
+    the upstream circuit breakers (informational: an open breaker does not
+    make us unready, since cached data is still served).
+    """
+    status_code = 200 if readiness.is_ready else 503
+    body = {**readiness.to_dict(), "admission": admission.stats(), "upstreams": upstream.host_states()}
+    return JSONResponse(body, status_code=status_code)
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics() -> Response:
+    """Prometheus scrape endpoint: cache, upstream, parse and per-route latency."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(admin.require_admin)])
+def get_request_profile(profile_id: str) -> dict:
+    """Sampled profile of a request made with `X-Profile: 1` (admin only)."""
+    profile = timing.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or expired")
+    return profile
+
+
 @app.get("/api/towns")
-def towns() -> dict:
+def towns(request: Request) -> Response:
     logger.info("Fetching towns list")
-    return {"towns": scraper.get_towns()}
+    return httpcache.cached_json(
+        request,
+        "towns",
+        lambda: scraper.cache_info("towns"),
+        lambda: {"towns": scraper.get_towns()},
+    )
 
 
 @app.get("/api/providers")
-def providers(town: str = Query(..., min_length=1)) -> dict:
+def providers(request: Request, town: str = Query(..., min_length=1)) -> Response:
     logger.info("Fetching providers for town: %s", town)
-    results = scraper.get_providers_for_town(town)
-    if not results:
-        logger.warning("No providers found for town: %s", town)
-        raise HTTPException(status_code=404, detail="Town not found or no providers parsed.")
-    logger.info("Returning %d providers for town: %s", len(results), town)
-    return {"town": town, "providers": results}
+
+    def load() -> dict:
+        results = scraper.get_providers_for_town(town)
+        if not results:
+            logger.warning("No providers found for town: %s", town)
+            raise HTTPException(status_code=404, detail="Town not found or no providers parsed.")
+        logger.info("Returning %d providers for town: %s", len(results), town)
+        return {"town": town, "providers": [p.to_dict() for p in results]}
+
+    return httpcache.cached_json(
+        request,
+        f"providers|{town}",
+        lambda: scraper.cache_info(scraper.providers_cache_key(town)),
+        load,
+    )
+
+
+@app.get("/api/providers/nearby")
+def nearby_providers(
+    request: Request,
+    town: str = Query(..., min_length=1),
+    radius: float = Query(proximity.DEFAULT_RADIUS, gt=0, le=proximity.MAX_RADIUS, description="Miles"),
+) -> Response:
+    """Providers from every DDS town within `radius` miles of `town`, deduplicated, nearest first."""
+    logger.info("Fetching providers within %s miles of %s", radius, town)
+
+    def load() -> dict:
+        result = proximity.nearby_providers(town, radius)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Unknown Connecticut town.")
+        return result
+
+    return httpcache.cached_json(
+        request,
+        f"nearby|{town.strip().lower()}|{radius:g}",
+        lambda: proximity.cache_info(town, radius),
+        load,
+    )
+
+
+@app.get("/api/providers/changes")
+def provider_changes(
+    since: str = Query(..., min_length=1, description="Epoch seconds or ISO date/datetime"),
+    town: Optional[str] = None,
+    cursor: Optional[int] = Query(None, description="nextCursor from the previous page"),
+    limit: int = Query(1000, ge=1, le=changefeed.MAX_CHANGES),
+) -> dict:
+    """
+    DDS providers added, removed or renamed since a point in time.
+
+    Changes are logged as town rosters are refreshed (on request or by
+    `python -m changefeed crawl`). Page with `cursor` while `truncated`.
+    """
+    try:
+        since_ts = changefeed.parse_since(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be epoch seconds or an ISO date/datetime")
+    return changefeed.changes_since(since_ts, town=town, after_id=cursor, limit=limit)
 
 
 @app.get("/api/fetch-pdf")
@@ -107,6 +268,12 @@ def fetch_pdf(url: str = Query(..., min_length=10), name: str | None = None) ->
 # =============================================================================
 
 
+def _b64(data: bytes) -> str:
+    """Base64-encode a PDF for a JSON response (timed as its own span)."""
+    with timing.span("base64"):
+        return base64.b64encode(data).decode("utf-8")
+
+
 class FetchDocsRequest(BaseModel):
     """Request body for fetching all documents for an organization."""
     ein: str
@@ -126,64 +293,88 @@ class FetchDocsResponse(BaseModel):
 
 
 @app.get("/api/search/unified")
-def unified_search(q: str = Query(..., min_length=2), state: str = "CT") -> dict:
+def unified_search(
+    q: str = Query(..., min_length=2),
+    state: str = "CT",
+    progressive: bool = False,
+) -> dict:
     """
     Search for organizations via ProPublica with DDS matching.
 
-    DDS matching is done per-city (not all towns) for fast results.
+    DDS providers come from the precomputed match table (see `matches`);
+    orgs not in it yet are matched against their own city's roster. With
+    `progressive=true` the ProPublica hits are returned at once and those
+    matches arrive later via /api/search/unified/{search_token}.
     """
-    logger.info("Unified search: q='%s', state='%s'", q, state)
+    logger.info("Unified search: q='%s', state='%s', progressive=%s", q, state, progressive)
+    if progressive:
+        found = searches.start(q, state)
+        prefetch.schedule(r["ein"] for r in found["results"])
+        return found
 
     # Search ProPublica
     propublica_results = propublica.search_nonprofits(q, state)
 
-    # Cache of DDS providers by city (to avoid re-fetching same city)
-    dds_cache: dict = {}
-
     results = []
     for org in propublica_results:
-        result = {
-            "ein": org.ein,
-            "name": org.name,
-            "city": org.city,
-            "state": org.state,
-            "ntee_code": org.ntee_code,
-            "propublica_url": f"https://projects.propublica.org/nonprofits/organizations/{org.ein}",
-            "dds_provider": None,
-            "has_form990": True,
-        }
-
-        # Try to match DDS provider for this city
-        if org.city:
-            try:
-                # Get providers for this city (cached within this request)
-                if org.city not in dds_cache:
-                    dds_cache[org.city] = scraper.get_providers_for_town(org.city)
-
-                providers = dds_cache[org.city]
-                if providers:
-                    match = propublica.match_to_dds_provider(org.name, providers)
-                    if match:
-                        result["dds_provider"] = {
-                            "name": match["name"],
-                            "url": match["url"],
-                            "town": org.city,
-                        }
-            except Exception as e:
-                logger.debug("DDS lookup failed for %s: %s", org.city, str(e))
+        result = searches.result_row(org)
+
+        # DDS provider from the match table (falls back to matching in this city)
+        try:
+            result["dds_provider"] = matches.provider_for_org(org.ein, org.name, org.city)
+        except Exception as e:
+            logger.debug("DDS lookup failed for %s: %s", org.ein, str(e))
 
         results.append(result)
 
     logger.info("Unified search returned %d results", len(results))
+    prefetch.schedule(r["ein"] for r in results)
     return {"results": results, "query": q, "state": state}
 
 
+@app.get("/api/search/unified/{search_token}")
+def unified_search_updates(search_token: str, after: int = Query(0, ge=0)) -> dict:
+    """DDS matches for a progressive search that arrived after cursor `after`."""
+    found = searches.updates(search_token, after)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired search token")
+    return found
+
+
+@app.get("/api/search/unified/{search_token}/stream")
+async def unified_search_stream(request: Request, search_token: str, after: int = Query(0, ge=0)) -> StreamingResponse:
+    """The same updates as server-sent events (`match`, then `done`)."""
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    return StreamingResponse(
+        searches.stream_events(search_token, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/suggest")
+def suggestions(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=suggest.MAX_SUGGESTIONS),
+    kind: Optional[str] = Query(None, pattern="^(nonprofit|dds)$"),
+) -> dict:
+    """
+    Typeahead over nonprofits we've seen and every crawled DDS provider.
+
+    Answered from the local FTS5 index only - no upstream calls.
+    """
+    return {"query": q, "suggestions": suggest.suggest(q, limit, kind)}
+
+
 @app.get("/api/organization/{ein}")
 def get_organization(ein: str) -> dict:
     """
     Get detailed organization info from ProPublica by EIN.
     """
     logger.info("Fetching organization details: %s", ein)
+    prefetch.note_used(ein, "organization")
 
     details = propublica.get_nonprofit_details(ein)
     if not details:
@@ -193,7 +384,7 @@ def get_organization(ein: str) -> dict:
 
 
 @app.get("/api/propublica/financials/{ein}")
-def get_propublica_financials(ein: str, years: int = 5) -> dict:
+def get_propublica_financials(request: Request, ein: str, years: int = 5) -> Response:
     """
     Get structured 5-year financial history directly from ProPublica API.
 
@@ -216,13 +407,48 @@ def get_propublica_financials(ein: str, years: int = 5) -> dict:
 
     # Limit years to prevent excessive API calls
     years = min(years, 10)
+    prefetch.note_used(ein, "financials")
+
+    def load() -> dict:
+        summary = propublica.get_financial_summary(ein)
+        if "error" in summary:
+            raise HTTPException(status_code=404, detail=summary["error"])
+        return summary
+
+    ein_key = ein.replace("-", "")
+    return httpcache.cached_json(
+        request,
+        f"financials|{ein_key}",
+        lambda: propublica.cache_info(f"org:{ein_key}"),
+        load,
+    )
+
+
+MAX_BENCHMARK_PEERS = 500  # Mirrors peers.MAX_PEERS without importing numpy at startup
+
+
+class PeerBenchmarkRequest(BaseModel):
+    """Request body for benchmarking a set of organizations."""
+    eins: List[str]
+    years: int = 5
 
-    summary = propublica.get_financial_summary(ein)
 
-    if "error" in summary:
-        raise HTTPException(status_code=404, detail=summary["error"])
+@app.post("/api/peers/benchmark")
+def benchmark_peers(request: PeerBenchmarkRequest) -> dict:
+    """
+    Compare many organizations' financials in one call.
 
-    return summary
+    Computes revenue CAGR, expense ratio, operating margins and net asset
+    trends for every EIN, plus percentiles and peer ranks. Lists in the
+    response are column-oriented and aligned with `eins`.
+    """
+    if not request.eins:
+        raise HTTPException(status_code=400, detail="At least one EIN is required")
+    if len(request.eins) > MAX_BENCHMARK_PEERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BENCHMARK_PEERS} EINs per request")
+    logger.info("Benchmarking %d organizations (%d years)", len(request.eins), request.years)
+    peers = lazy_import("peers")  # pulls in numpy
+    return peers.benchmark(request.eins, request.years)
 
 
 class ProviderWithQualityResponse(BaseModel):
@@ -242,8 +468,10 @@ def fetch_provider_with_quality(
     """
     Fetch a provider profile PDF and its associated Quality Report.
 
-    The Quality Report URL is extracted from the provider profile PDF.
-    Both PDFs are returned as base64-encoded strings.
+    The Quality Report URL comes from the quality index (see
+    `quality_index`), or is extracted from the provider profile PDF when
+    the provider is not indexed yet. Both PDFs are returned as
+    base64-encoded strings.
     """
     logger.info("Fetching provider with quality: %s", name)
 
@@ -252,11 +480,9 @@ def fetch_provider_with_quality(
         provider_name=name
     )
 
-    # 1. Fetch the provider profile PDF
+    # Provider profile and Quality Report; concurrently when the quality URL is indexed
     try:
-        provider_bytes = scraper.fetch_pdf(url)
-        response.provider_pdf = base64.b64encode(provider_bytes).decode("utf-8")
-        logger.info("Provider PDF fetched: %d bytes", len(provider_bytes))
+        fetched = quality_index.fetch_with_quality(url)
     except ValueError as exc:
         logger.warning("Provider PDF fetch blocked: %s", str(exc))
         raise HTTPException(status_code=400, detail=str(exc)) from exc
@@ -264,41 +490,153 @@ def fetch_provider_with_quality(
         logger.error("Provider PDF fetch failed: %s", str(exc))
         raise HTTPException(status_code=502, detail="Failed to fetch provider PDF") from exc
 
-    # 2. Extract and fetch Quality Report from provider profile
+    response.provider_pdf = _b64(fetched["provider"])
+    response.quality_url = fetched["qualityUrl"]
+    if fetched["quality"] is not None:
+        response.quality_pdf = _b64(fetched["quality"])
+        logger.info("Quality report fetched: %d bytes", len(fetched["quality"]))
+    else:
+        response.error = fetched["error"]
+
+    return response
+
+
+@app.get("/api/fetch-quality-report")
+def fetch_quality_report(url: str = Query(..., min_length=10)) -> dict:
+    """
+    The Quality Report for a provider profile URL, without downloading or
+    parsing the profile when its quality URL is already indexed.
+    """
     try:
-        quality_url = scraper.extract_quality_profile_url(provider_bytes)
-        if quality_url:
-            response.quality_url = quality_url
-            logger.info("Extracted quality URL: %s", quality_url)
-
-            if scraper._is_allowed_pdf(quality_url):
-                quality_bytes = scraper.fetch_pdf(quality_url)
-                response.quality_pdf = base64.b64encode(quality_bytes).decode("utf-8")
-                logger.info("Quality report fetched: %d bytes", len(quality_bytes))
-            else:
-                response.error = "Quality report URL not from allowed domain"
-                logger.warning("Quality URL blocked: %s", quality_url)
-        else:
-            response.error = "No quality report URL found in provider profile"
-            logger.debug("No quality URL found for: %s", name)
-    except Exception as e:
-        logger.error("Error fetching quality report: %s", str(e))
-        response.error = f"Quality report fetch error: {str(e)}"
+        fetched = quality_index.fetch_with_quality(url, include_profile=False)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:
+        logger.error("Provider PDF fetch failed: %s", str(exc))
+        raise HTTPException(status_code=502, detail="Failed to fetch provider PDF") from exc
+    if fetched["quality"] is None:
+        status_code = 404 if fetched["error"] == quality_index.NO_QUALITY_URL else 502
+        raise HTTPException(status_code=status_code, detail=fetched["error"])
+    return {"provider_url": url, "quality_url": fetched["qualityUrl"], "quality_pdf": _b64(fetched["quality"])}
+
 
+def _fetch_dds_pdf(url: str) -> bytes:
+    try:
+        return scraper.fetch_pdf(url)
+    except ValueError as exc:
+        logger.warning("PDF fetch blocked (invalid URL): %s - %s", url, str(exc))
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        logger.error("PDF fetch failed: %s - %s", url, str(exc))
+        raise HTTPException(status_code=502, detail="Failed to fetch PDF.") from exc
+
+
+def _extract_dds_pdf(pdf_bytes: bytes, kind: str) -> dict:
+    try:
+        return pdfextract.extract(pdf_bytes, kind)
+    except Exception as exc:  # noqa: BLE001 - pdfminer raises assorted errors on non-PDF bodies
+        logger.error("PDF extraction failed (%s): %s", kind, str(exc))
+        raise HTTPException(status_code=502, detail="Upstream document is not a readable PDF.") from exc
+
+
+def _without_text(result: Optional[dict], include_text: bool) -> Optional[dict]:
+    if result is None or include_text:
+        return result
+    return {k: v for k, v in result.items() if k != "text"}
+
+
+@app.get("/api/extract/provider")
+def extract_provider(
+    url: str = Query(..., min_length=10),
+    quality: bool = True,
+    include_text: bool = True,
+) -> dict:
+    """
+    Structured fields from a provider profile PDF and, by default, its Quality Report.
+
+    Returns contact details, DDS service types, QSR review dates and focus-area
+    scores plus cleaned text, so analysis can work from a few KB of JSON
+    instead of base64 PDFs. Extractions are cached by PDF content hash.
+    """
+    provider_bytes = _fetch_dds_pdf(url)
+    provider = _extract_dds_pdf(provider_bytes, pdfextract.KIND_PROVIDER)
+    response: dict = {
+        "url": url,
+        "provider": _without_text(provider, include_text),
+        "qualityUrl": None,
+        "quality": None,
+        "error": None,
+    }
+    if not quality:
+        return response
+
+    quality_url = quality_index.quality_url_for(url, provider_bytes, provider["qualityUrl"])
+    response["qualityUrl"] = quality_url
+    if not quality_url:
+        response["error"] = "No quality report URL found in provider profile"
+    elif not scraper._is_allowed_pdf(quality_url):
+        response["error"] = "Quality report URL not from allowed domain"
+    else:
+        try:
+            quality_bytes = scraper.fetch_pdf(quality_url)
+            response["quality"] = _without_text(
+                pdfextract.extract(quality_bytes, pdfextract.KIND_QUALITY), include_text
+            )
+        except Exception as e:  # noqa: BLE001
+            logger.error("Error extracting quality report: %s", str(e))
+            response["error"] = f"Quality report fetch error: {str(e)}"
     return response
 
 
+@app.get("/api/extract/quality")
+def extract_quality(url: str = Query(..., min_length=10), include_text: bool = True) -> dict:
+    """Review dates, focus-area scores and cleaned text from a Quality Service Review PDF."""
+    quality_bytes = _fetch_dds_pdf(url)
+    return {
+        "url": url,
+        "quality": _without_text(_extract_dds_pdf(quality_bytes, pdfextract.KIND_QUALITY), include_text),
+    }
+
+
+@app.get("/api/organization/{ein}/form990/sections")
+def get_form990_sections(
+    ein: str,
+    sections: Optional[str] = Query(None, description="Comma-separated: part1, part7, scheduleO (default: all)"),
+    year: Optional[int] = None,
+) -> dict:
+    """
+    Text of selected Form 990 parts: Part I summary, Part VII compensation, Schedule O.
+
+    Only the pages of the requested parts are parsed, and extracted sections
+    are cached per filing, so analysis gets a few KB of text instead of the
+    whole base64 PDF.
+    """
+    try:
+        wanted = form990.parse_sections(sections)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    try:
+        result = form990.extract_sections(ein, year, wanted)
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Form 990 section extraction failed for %s: %s", ein, exc)
+        raise HTTPException(status_code=502, detail="Failed to fetch or parse Form 990 PDF.") from exc
+    if result is None:
+        raise HTTPException(status_code=404, detail="No Form 990 PDF available")
+    return result
+
+
 @app.post("/api/organization/fetch-docs")
 def fetch_all_docs(request: FetchDocsRequest) -> FetchDocsResponse:
     """
     Fetch all available documents for an organization:
     - Form 990 from ProPublica
     - Provider Profile from DDS (found by matching org name in city's town PDF)
-    - Quality Report from DDS (extracted from provider profile)
+    - Quality Report from DDS (link from the quality index or the provider profile)
 
     Returns base64-encoded PDFs.
     """
     logger.info("Fetching all docs for EIN: %s", request.ein)
+    prefetch.note_used(request.ein, "fetch-docs")
 
     response = FetchDocsResponse()
     errors = []
@@ -321,7 +659,7 @@ def fetch_all_docs(request: FetchDocsRequest) -> FetchDocsResponse:
 
         pdf_bytes = propublica.fetch_form990_pdf(request.ein)
         if pdf_bytes:
-            response.form990 = base64.b64encode(pdf_bytes).decode("utf-8")
+            response.form990 = _b64(pdf_bytes)
             logger.info("Form 990 fetched: %d bytes (year: %s)", len(pdf_bytes), response.form990_year)
         else:
             errors.append("Form 990 not available from ProPublica")
@@ -334,56 +672,175 @@ def fetch_all_docs(request: FetchDocsRequest) -> FetchDocsResponse:
     if not provider_url and city and org_name:
         logger.info("Searching for DDS provider: %s in %s", org_name, city)
         try:
-            # Get providers for this town/city
-            providers = scraper.get_providers_for_town(city)
-            if providers:
-                # Find best match by name
-                match = propublica.match_to_dds_provider(org_name, providers)
-                if match:
-                    provider_url = match["url"]
-                    logger.info("Found DDS match: %s -> %s", org_name, match["name"])
-                else:
-                    errors.append(f"No DDS provider match found in {city}")
+            match = matches.provider_for_org(request.ein, org_name, city)
+            if match:
+                provider_url = match["url"]
+                logger.info("Found DDS match: %s -> %s", org_name, match["name"])
             else:
-                errors.append(f"No DDS providers found for town: {city}")
+                errors.append(f"No DDS provider match found in {city}")
         except Exception as e:
             logger.warning("DDS provider search failed: %s", str(e))
             errors.append(f"DDS search error: {str(e)}")
 
-    # 3. Fetch Provider Profile from DDS
-    provider_pdf_bytes = None
+    # 3. Fetch Provider Profile and Quality Report from DDS (concurrently when indexed)
     if provider_url:
         try:
-            provider_pdf_bytes = scraper.fetch_pdf(provider_url)
-            if provider_pdf_bytes:
-                response.provider_profile = base64.b64encode(provider_pdf_bytes).decode("utf-8")
-                logger.info("Provider profile fetched: %d bytes", len(provider_pdf_bytes))
+            fetched = quality_index.fetch_with_quality(provider_url)
+            response.provider_profile = _b64(fetched["provider"])
+            logger.info("Provider profile fetched: %d bytes", len(fetched["provider"]))
+            if fetched["quality"] is not None:
+                response.quality_report = _b64(fetched["quality"])
+                logger.info("Quality report fetched: %d bytes", len(fetched["quality"]))
+            else:
+                errors.append(fetched["error"])
         except Exception as e:
             logger.error("Error fetching provider profile: %s", str(e))
             errors.append(f"Provider profile fetch error: {str(e)}")
 
-    # 4. Extract and fetch Quality Report from provider profile
-    if provider_pdf_bytes:
-        try:
-            quality_url = scraper.extract_quality_profile_url(provider_pdf_bytes)
-            if quality_url:
-                logger.info("Extracted quality URL: %s", quality_url)
-                # Validate URL before fetching
-                if scraper._is_allowed_pdf(quality_url):
-                    quality_pdf_bytes = scraper.fetch_pdf(quality_url)
-                    if quality_pdf_bytes:
-                        response.quality_report = base64.b64encode(quality_pdf_bytes).decode("utf-8")
-                        logger.info("Quality report fetched: %d bytes", len(quality_pdf_bytes))
-                else:
-                    logger.warning("Quality URL blocked: %s", quality_url)
-                    errors.append("Quality report URL not from allowed domain")
-            else:
-                errors.append("Quality report URL not found in provider profile")
-        except Exception as e:
-            logger.error("Error fetching quality report: %s", str(e))
-            errors.append(f"Quality report fetch error: {str(e)}")
-
     response.errors = errors
     return response
 
 
+# =============================================================================
+# DDS-to-EIN Matches
+# =============================================================================
+
+
+@app.get("/api/matches")
+def get_matches(ein: Optional[str] = None, provider_url: Optional[str] = None) -> dict:
+    """Stored DDS provider matches for an EIN, or the match of one provider URL."""
+    if bool(ein) == bool(provider_url):
+        raise HTTPException(status_code=400, detail="Provide either ein or provider_url")
+    if ein:
+        return {"ein": matches.normalize_ein(ein), "matches": matches.for_ein(ein)}
+    match = matches.for_provider(provider_url)
+    return {"providerUrl": provider_url, "matches": [match] if match else []}
+
+
+class MatchOverrideRequest(BaseModel):
+    """Manual match: pin a provider to an EIN, or to none when ein is null."""
+    provider_url: str
+    ein: Optional[str] = None
+    note: Optional[str] = None
+
+
+@app.put("/api/admin/matches", dependencies=[Depends(admin.require_admin)])
+def override_match(request: MatchOverrideRequest) -> dict:
+    match = matches.set_override(request.provider_url, request.ein, request.note)
+    if match is None:
+        raise HTTPException(status_code=404, detail="Provider not found in any crawled town")
+    return match
+
+
+@app.delete("/api/admin/matches", dependencies=[Depends(admin.require_admin)])
+def clear_match_override(provider_url: str) -> dict:
+    """Remove a manual override and queue the provider for automatic matching."""
+    if not matches.clear_override(provider_url):
+        raise HTTPException(status_code=404, detail="No manual override for this provider")
+    return {"cleared": provider_url, "job": jobs.submit(jobs.KIND_MATCHES, [provider_url])}
+
+
+@app.post("/api/admin/matches/rebuild", status_code=202, dependencies=[Depends(admin.require_admin)])
+def rebuild_matches(force: bool = False) -> dict:
+    """Queue matching of every provider with no (or an expired) automatic match."""
+    urls = matches.stale_urls(scraper.get_all_providers_flat(), force)
+    queued = [
+        jobs.submit(jobs.KIND_MATCHES, urls[i:i + jobs.MAX_JOB_ITEMS], jobs.PRIORITY_BACKGROUND)
+        for i in range(0, len(urls), jobs.MAX_JOB_ITEMS)
+    ]
+    return {"providers": len(urls), "jobs": queued}
+
+
+# =============================================================================
+# Lead Export
+# =============================================================================
+
+
+@app.get("/api/export/leads")
+def export_leads(
+    format: str = Query(export.FORMAT_CSV, pattern="^(csv|ndjson|parquet)$"),
+    town: Optional[str] = None,
+    financials: bool = True,
+    years: int = Query(5, ge=1, le=10),
+) -> StreamingResponse:
+    """
+    Stream DDS providers joined with their matched EIN and latest financials.
+
+    Statewide by default, or one `town`. Rows are written in chunks as they
+    are produced, so the download starts immediately and memory stays flat.
+    """
+    if town and not scraper.get_town_pdf_url(town):
+        raise HTTPException(status_code=404, detail="Town not found")
+    try:
+        chunks = export.stream(format, town, financials, years)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    scope = town.lower().replace(" ", "-") if town else "ct"
+    filename = f"dds-leads-{scope}-{datetime.date.today():%Y%m%d}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# =============================================================================
+# Background Jobs
+# =============================================================================
+
+
+class JobRequest(BaseModel):
+    """Request body for a bulk job: either towns or EINs."""
+    towns: Optional[List[str]] = None
+    eins: Optional[List[str]] = None
+
+
+@app.post("/api/jobs", status_code=202)
+def create_job(request: JobRequest) -> dict:
+    """
+    Queue a bulk job over towns (DDS rosters) or EINs (details, financials,
+    DDS match). Poll `/api/jobs/{id}` for progress and `/api/jobs/{id}/results`
+    for finished items.
+    """
+    if bool(request.towns) == bool(request.eins):
+        raise HTTPException(status_code=400, detail="Provide either towns or eins")
+    try:
+        if request.towns:
+            return jobs.submit(jobs.KIND_TOWNS, request.towns)
+        return jobs.submit(jobs.KIND_EINS, request.eins)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@app.get("/api/jobs")
+def list_jobs(limit: int = Query(20, ge=1, le=100)) -> dict:
+    return {"jobs": jobs.list_jobs(limit)}
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str) -> dict:
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/results")
+def get_job_results(
+    job_id: str,
+    cursor: int = -1,
+    limit: int = Query(100, ge=1, le=jobs.MAX_RESULTS_PAGE),
+) -> dict:
+    """Finished items in submission order; pass `nextCursor` back as `cursor` to page."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job": job, **jobs.get_results(job_id, cursor, limit)}
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> dict:
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,345 @@
+"""
+DDS Provider to EIN Join Table
+
+Matches each DDS provider (keyed by profile URL) to the CT nonprofit it
+most likely is, once, and stores the scored result in the local store.
+Request paths then resolve a provider from an EIN or an EIN from a
+provider with an index lookup instead of fuzzy-matching a town's roster
+on every call, and get the same answer every time.
+
+- `python -m matches build` (or `POST /api/admin/matches/rebuild`) matches
+  every provider in `scraper.get_all_providers_flat`.
+- Roster changes (`providers.changed`) queue a background job re-matching
+  added and renamed providers; removed ones are dropped.
+- Operators can pin a provider to an EIN, or to no EIN, with a manual
+  override. Overrides are never replaced by automatic matching.
+
+A lookup that misses the table falls back to the old per-town matching and
+stores what it finds (source `city`), so the table fills in even before
+the first build; the next build replaces those with batch matches.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import changefeed
+import events
+import localstore
+import propublica
+import timing
+
+logger = logging.getLogger(__name__)
+
+SOURCE_AUTO = "auto"  # batch / change-driven: provider name searched in ProPublica
+SOURCE_CITY = "city"  # request-path fallback: org name matched against its city's roster
+SOURCE_MANUAL = "manual"
+
+MATCH_THRESHOLD = 0.6  # same cut-off as propublica.match_to_dds_provider
+MATCH_TTL = 30 * 24 * 60 * 60  # automatic matches are redone by `build` after 30 days
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dds_matches (
+    provider_url TEXT PRIMARY KEY,
+    provider_name TEXT NOT NULL,
+    town TEXT,
+    ein TEXT,
+    org_name TEXT,
+    score REAL,
+    source TEXT NOT NULL,
+    note TEXT,
+    matched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dds_matches_ein ON dds_matches (ein);
+"""
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("matches", SCHEMA)
+    return conn
+
+
+def normalize_ein(ein: Any) -> str:
+    return str(ein).replace("-", "").strip().zfill(9)
+
+
+def _to_dict(row) -> Dict[str, Any]:
+    return {
+        "providerUrl": row["provider_url"],
+        "providerName": row["provider_name"],
+        "town": row["town"],
+        "ein": row["ein"],
+        "orgName": row["org_name"],
+        "score": row["score"],
+        "source": row["source"],
+        "note": row["note"],
+        "matchedAt": row["matched_at"],
+    }
+
+
+# -----------------------------------------------------------------------------
+# Matching
+# -----------------------------------------------------------------------------
+
+
+def find_org(provider_name: str) -> Tuple[Optional[propublica.NonprofitSearchResult], float]:
+    """
+    Best-scoring CT nonprofit for a DDS provider name.
+
+    Returns:
+        (organization, score); the organization is None when nothing
+        scores at least MATCH_THRESHOLD.
+    """
+    query = propublica.normalize_org_name(provider_name)  # "Arc, Inc." finds "ARC INC" too
+    if not query:
+        return None, 0.0
+    best, best_score = None, 0.0
+    for org in propublica.search_nonprofits(query, "CT"):
+        score = propublica.match_score(org.name, provider_name)
+        if score > best_score:
+            best, best_score = org, score
+    if best_score < MATCH_THRESHOLD:
+        return None, best_score
+    return best, best_score
+
+
+def _store(
+    provider: Dict[str, str],
+    ein: Optional[str],
+    org_name: Optional[str],
+    score: Optional[float],
+    source: str = SOURCE_AUTO,
+    note: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Upsert a match; automatic results never replace a manual override."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO dds_matches (provider_url, provider_name, town, ein, org_name, score, source, note, matched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (provider_url) DO UPDATE SET
+                provider_name = excluded.provider_name, town = excluded.town, ein = excluded.ein,
+                org_name = excluded.org_name, score = excluded.score, source = excluded.source,
+                note = excluded.note, matched_at = excluded.matched_at
+            WHERE dds_matches.source != 'manual' OR excluded.source = 'manual'
+            """,
+            (
+                provider["url"], provider["name"], provider.get("town"), ein, org_name,
+                None if score is None else round(score, 3), source, note, time.time(),
+            ),
+        )
+    return for_provider(provider["url"])
+
+
+def match_provider(provider: Dict[str, str]) -> Dict[str, Any]:
+    """Match one provider ({"name", "url", "town"}) now and store the result."""
+    with timing.span("dds-match"):
+        org, score = find_org(provider["name"])
+    if org is None:
+        return _store(provider, None, None, score)
+    return _store(provider, normalize_ein(org.ein), org.name, score)
+
+
+def match_listing(url: str) -> Dict[str, Any]:
+    """Match a provider by profile URL, taking its name and town from the crawled rosters."""
+    provider = changefeed.listing(url)
+    if provider is None:
+        raise LookupError(f"Provider not listed in any crawled town: {url}")
+    return match_provider(provider)
+
+
+def stale_urls(providers: Iterable[Dict[str, str]], force: bool = False) -> List[str]:
+    """Unique provider URLs without a manual override or a batch match newer than MATCH_TTL."""
+    urls = list(dict.fromkeys(p["url"] for p in providers))
+    if force:
+        known = {r["provider_url"] for r in _connect().execute(
+            "SELECT provider_url FROM dds_matches WHERE source = ?", (SOURCE_MANUAL,)
+        )}
+    else:
+        known = {r["provider_url"] for r in _connect().execute(
+            "SELECT provider_url FROM dds_matches WHERE source = ? OR (source = ? AND matched_at > ?)",
+            (SOURCE_MANUAL, SOURCE_AUTO, time.time() - MATCH_TTL),
+        )}
+    return [url for url in urls if url not in known]
+
+
+def build(force: bool = False) -> Dict[str, int]:
+    """
+    Match every DDS provider statewide on the calling thread.
+
+    Returns:
+        Counts of providers checked, matched and left unmatched.
+    """
+    import scraper
+
+    providers = {p["url"]: p for p in scraper.get_all_providers_flat()}
+    todo = stale_urls(providers.values(), force)
+    matched = 0
+    for i, url in enumerate(todo, 1):
+        try:
+            matched += match_provider(providers[url])["ein"] is not None
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Matching %s failed: %s", url, e)
+        if i % 50 == 0:
+            logger.info("Matched %d/%d providers", i, len(todo))
+    return {"providers": len(providers), "checked": len(todo), "matched": matched, "unmatched": len(todo) - matched}
+
+
+# -----------------------------------------------------------------------------
+# Lookups
+# -----------------------------------------------------------------------------
+
+
+def for_provider(url: str) -> Optional[Dict[str, Any]]:
+    """The stored match for a provider profile URL (ein is None for "no match")."""
+    row = _connect().execute("SELECT * FROM dds_matches WHERE provider_url = ?", (url,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def for_ein(ein: Any) -> List[Dict[str, Any]]:
+    """Providers matched to an EIN: manual overrides, then batch matches, then by score."""
+    rows = _connect().execute(
+        "SELECT * FROM dds_matches WHERE ein = ? ORDER BY source = 'manual' DESC, source = 'auto' DESC, score DESC",
+        (normalize_ein(ein),),
+    ).fetchall()
+    return [_to_dict(r) for r in rows]
+
+
+def stored_provider(ein: Any) -> Optional[Dict[str, str]]:
+    """The DDS provider ({"name", "url", "town"}) the join table has for an EIN, without any fallback."""
+    stored = for_ein(ein)
+    if not stored:
+        return None
+    best = stored[0]
+    return {"name": best["providerName"], "url": best["providerUrl"], "town": best["town"]}
+
+
+def provider_for_org(ein: Any, org_name: str, city: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    The DDS provider ({"name", "url", "town"}) for a ProPublica organization.
+
+    Answered from the join table; on a miss, falls back to matching
+    `org_name` against the roster of `city`. The match is stored unless
+    the table already assigns that provider to an EIN, and is not
+    returned if a manual override assigns it elsewhere (or to no EIN).
+    """
+    stored = stored_provider(ein)
+    if stored is not None:
+        return stored
+    if not city:
+        return None
+
+    import scraper
+
+    providers = scraper.get_providers_for_town(city)
+    if not providers:
+        return None
+    with timing.span("dds-match"):
+        match = propublica.match_to_dds_provider(org_name, providers)
+    if match is None:
+        return None
+    existing = for_provider(match["url"])
+    if existing is not None and existing["source"] == SOURCE_MANUAL:
+        if existing["ein"] != normalize_ein(ein):
+            return None  # an override assigns this provider elsewhere (or to no EIN)
+    elif existing is None or existing["ein"] is None:
+        # Unmatched so far (or an automatic "no match"): record this one
+        _store(match, normalize_ein(ein), org_name, propublica.match_score(org_name, match["name"]), SOURCE_CITY)
+    return {"name": match["name"], "url": match["url"], "town": match["town"]}
+
+
+# -----------------------------------------------------------------------------
+# Overrides
+# -----------------------------------------------------------------------------
+
+
+def set_override(url: str, ein: Optional[str], note: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Pin a provider to an EIN, or to no EIN when `ein` is None.
+
+    Returns:
+        The stored match, or None if the provider is unknown.
+    """
+    provider = changefeed.listing(url)
+    if provider is None:
+        existing = for_provider(url)
+        if existing is None:
+            return None
+        provider = {"name": existing["providerName"], "url": url, "town": existing["town"]}
+    org_name = None
+    if ein:
+        ein = normalize_ein(ein)
+        details = propublica.get_nonprofit_details(ein)
+        org_name = details.name if details else None
+    return _store(provider, ein, org_name, None, SOURCE_MANUAL, note)
+
+
+def clear_override(url: str) -> bool:
+    """Drop a manual override (the provider is re-matched automatically later)."""
+    conn = _connect()
+    with conn:
+        deleted = conn.execute(
+            "DELETE FROM dds_matches WHERE provider_url = ? AND source = ?", (url, SOURCE_MANUAL)
+        ).rowcount
+    return bool(deleted)
+
+
+# -----------------------------------------------------------------------------
+# Roster changes
+# -----------------------------------------------------------------------------
+
+
+def _on_providers_changed(town: str, added: list, removed: list, renamed: list, **_: Any) -> None:
+    import jobs
+
+    gone = [c["url"] for c in removed if changefeed.listing(c["url"]) is None]
+    if gone:
+        conn = _connect()
+        with conn:
+            conn.executemany(
+                "DELETE FROM dds_matches WHERE provider_url = ? AND source != ?",
+                [(url, SOURCE_MANUAL) for url in gone],
+            )
+    urls = [c["url"] for c in added + renamed]
+    if urls:
+        jobs.submit(jobs.KIND_MATCHES, urls, jobs.PRIORITY_BACKGROUND)
+        logger.info("Queued re-matching of %d changed providers in %s", len(urls), town)
+
+
+def register() -> None:
+    """Re-match providers whenever a roster changes (needs changefeed.register)."""
+    events.subscribe("providers.changed", _on_providers_changed)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="matches", description="DDS provider to EIN matches")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Match every DDS provider statewide")
+    build_cmd.add_argument("--force", action="store_true", help="Redo fresh automatic matches too")
+    show = sub.add_parser("show", help="Print the matches for an EIN or provider URL")
+    show.add_argument("key", help="EIN or provider profile URL")
+    override = sub.add_parser("override", help="Pin a provider to an EIN (omit --ein for no match)")
+    override.add_argument("url")
+    override.add_argument("--ein")
+    override.add_argument("--note")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "build":
+        changefeed.register()  # listings for overrides and change-driven re-matching
+        print(json.dumps(build(args.force), indent=2))
+    elif args.command == "show":
+        found = for_provider(args.key) if "/" in args.key else for_ein(args.key)
+        print(json.dumps(found, indent=2))
+    elif args.command == "override":
+        print(json.dumps(set_override(args.url, args.ein, args.note), indent=2))
+
+
+if __name__ == "__main__":
+    main()
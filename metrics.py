@@ -0,0 +1,236 @@
+"""
+Prometheus Metrics
+
+Minimal, dependency-free counters and histograms rendered in the
+Prometheus text exposition format at `/metrics`. Modules define their
+metrics at import time and update them with keyword labels:
+
+    CACHE_HITS.inc(namespace="towns")
+    with PDF_PARSE_SECONDS.time(doc_type="town"):
+        ...
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values (seconds by convention)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label key -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        names = self.labelnames + ("le",)
+        for key, state in items:
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                labels = _format_labels(names, key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            plain = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{plain} {repr(state[-2])}"
+            yield f"{self.name}_count{plain} {_format_value(state[-1])}"
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text format."""
+    return "\n".join(metric.render() for metric in _REGISTRY) + "\n"
+
+
+# -----------------------------------------------------------------------------
+# Shared metrics (updated from scraper, propublica, upstream, admission, prefetch and main)
+# -----------------------------------------------------------------------------
+
+CACHE_HITS = Counter("leadgen_cache_hits_total", "Cache lookups served from cache.", ["namespace"])
+CACHE_MISSES = Counter("leadgen_cache_misses_total", "Cache lookups that had to load.", ["namespace"])
+CACHE_EVICTIONS = Counter(
+    "leadgen_cache_evictions_total", "Expired cache entries replaced or dropped.", ["namespace"]
+)
+NEGATIVE_CACHE_HITS = Counter(
+    "leadgen_negative_cache_hits_total", "Lookups answered by a cached miss.", ["namespace"]
+)
+STALE_SERVED = Counter(
+    "leadgen_stale_served_total", "Expired cache values served because the reload failed.", ["namespace"]
+)
+
+UPSTREAM_SECONDS = Histogram(
+    "leadgen_upstream_request_seconds", "Upstream HTTP request latency.", ["host", "status"]
+)
+UPSTREAM_SHORT_CIRCUITS = Counter(
+    "leadgen_upstream_short_circuits_total", "Upstream requests refused by an open circuit breaker.", ["host"]
+)
+UPSTREAM_BREAKER_OPENED = Counter(
+    "leadgen_upstream_breaker_opened_total", "Times a host's circuit breaker opened.", ["host"]
+)
+UPSTREAM_HEDGES = Counter(
+    "leadgen_upstream_hedges_total", "Hedged upstream requests (fired, and won by the hedge).", ["host", "outcome"]
+)
+PDF_PARSE_SECONDS = Histogram(
+    "leadgen_pdf_parse_seconds", "pdfplumber parse duration by document type.", ["doc_type"]
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "leadgen_rate_limit_wait_seconds",
+    "Time spent waiting on the ProPublica rate limiter.",
+    ["priority"],
+    buckets=(0.0, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "leadgen_http_request_seconds", "API request latency by route.", ["method", "route", "status"]
+)
+PREFETCHES = Counter(
+    "leadgen_prefetches_total",
+    "Speculative organization prefetches by outcome (queued, fetched, failed, dropped, expired).",
+    ["outcome"],
+)
+PREFETCHES_USED = Counter(
+    "leadgen_prefetches_used_total", "Prefetched organizations later opened by a user.", ["endpoint"]
+)
+ADMISSION_REJECTED = Counter(
+    "leadgen_admission_rejected_total", "Requests turned away by admission control.", ["lane", "reason"]
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "leadgen_admission_wait_seconds", "Time queued requests waited for a lane slot.", ["lane"]
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency into HTTP_REQUEST_SECONDS."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the (shared) scope; use its
+            # template so /api/organization/{ein} is one series, not one per EIN.
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                route=path,
+                status=str(status["code"]),
+            )
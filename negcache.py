@@ -0,0 +1,59 @@
+"""
+Negative Caches
+
+Short-lived records of lookups that found nothing or failed, kept apart
+from the value caches in `scraper` and `propublica` so a miss never
+shadows (or is mistaken for) a real cached value. Each module owns one
+`NegativeCache` with its own TTL table; hits are counted per key
+namespace in `leadgen_negative_cache_hits_total`.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Mapping
+
+import timing
+from metrics import NEGATIVE_CACHE_HITS
+
+
+class NegativeCache:
+    """Recently missed keys with an expiry time each.
+
+    Args:
+        ttls: seconds to remember a miss, by kind ("town", "org", ...)
+        separator: splits the metrics namespace off the front of a key
+        max_entries: most keys kept; the oldest are dropped beyond it
+    """
+
+    def __init__(self, ttls: Mapping[str, float], separator: str = ":", max_entries: int = 10_000):
+        self.ttls = dict(ttls)
+        self.separator = separator
+        self.max_entries = max_entries
+        self._expires: OrderedDict[str, float] = OrderedDict()  # key -> expires_at, oldest first
+
+    def hit(self, key: str) -> bool:
+        """True if a recent lookup for `key` missed (counted as a cache hit)."""
+        expires_at = self._expires.get(key)
+        if expires_at is None:
+            return False
+        if expires_at > time.time():
+            NEGATIVE_CACHE_HITS.inc(namespace=key.split(self.separator, 1)[0])
+            timing.record_cache(True)
+            return True
+        self._expires.pop(key, None)
+        return False
+
+    def add(self, key: str, kind: str) -> None:
+        """Remember a missed lookup for `ttls[kind]` seconds."""
+        self._expires.pop(key, None)
+        self._expires[key] = time.time() + self.ttls[kind]
+        while len(self._expires) > self.max_entries:
+            self._expires.popitem(last=False)
+
+    def clear(self) -> None:
+        self._expires.clear()
+
+    def __len__(self) -> int:
+        return len(self._expires)
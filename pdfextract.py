@@ -0,0 +1,255 @@
+"""
+Structured Extraction from DDS PDFs
+
+Turns provider profile and Quality Service Review (QSR) PDFs into compact
+JSON: contact details, DDS service types, review dates, focus-area scores
+and cleaned text. Analysis can then send a few kilobytes of text instead of
+base64 PDFs.
+
+Results are stored in the local store keyed by the PDF's SHA-1, so each
+distinct document is parsed once no matter which URL or request it comes
+from. Bump EXTRACT_VERSION when the extraction changes to re-parse.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import localstore
+import timing
+from metrics import CACHE_HITS, CACHE_MISSES, PDF_PARSE_SECONDS
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_VERSION = 1
+KIND_PROVIDER = "provider"
+KIND_QUALITY = "quality"
+
+MAX_TEXT_CHARS = 20_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_extracts (
+    digest TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (digest, kind)
+);
+"""
+
+# DDS service types as they appear on provider profiles (longest first so
+# "Individual Supported Employment" wins over "Supported Employment")
+DDS_SERVICE_TYPES = sorted(
+    [
+        "Adult Companion", "Adult Day Health", "Assisted Living", "Behavioral Support",
+        "Clinical Behavioral Support", "Community Companion Homes", "Community Living Arrangement",
+        "Continuous Residential Supports", "Customized Employment", "Day Support Options",
+        "Environmental Modifications", "Group Supported Employment", "Health Care Coordination",
+        "Independent Support Broker", "Individual Goods and Services", "Individual Supported Employment",
+        "Individualized Day Supports", "Individualized Home Supports", "Interpreter", "Job Coaching",
+        "Live-in Caregiver", "Nutrition", "Peer Support", "Personal Emergency Response System",
+        "Personal Support", "Prevocational Services", "Remote Supports", "Residential Habilitation",
+        "Respite", "Senior Supports", "Specialized Medical Equipment", "Supported Employment",
+        "Supported Living", "Transportation", "Vehicle Modifications",
+    ],
+    key=len,
+    reverse=True,
+)
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_RE = re.compile(r"\(?\b\d{3}\)?[-.\s]?\d{3}[-.\s]\d{4}\b")
+WEBSITE_RE = re.compile(r"\b(?:https?://|www\.)[^\s,;]+", re.IGNORECASE)
+ADDRESS_RE = re.compile(r"\d+[^,\n]*,\s*[A-Za-z .'-]+,\s*CT\.?\s+\d{5}(?:-\d{4})?")
+DATE_RE = re.compile(r"\b\d{1,2}/\d{1,2}/\d{2,4}\b")
+PERCENT_LINE_RE = re.compile(r"^(?P<label>[A-Za-z][^%]*?)[\s:.-]*(?P<pct>\d{1,3}(?:\.\d+)?)\s*%")
+LABEL_RE = re.compile(r"^\s*(?P<label>[A-Za-z][A-Za-z /&]+?)\s*:\s*(?P<value>.+)$")
+PAGE_NUMBER_RE = re.compile(r"^(?:page\s*)?\d+(?:\s*(?:of|/)\s*\d+)?$", re.IGNORECASE)
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("pdfextract", SCHEMA)
+    return conn
+
+
+# -----------------------------------------------------------------------------
+# Text
+# -----------------------------------------------------------------------------
+
+
+def _page_lines(pdf_bytes: bytes) -> List[List[str]]:
+    pages = []
+    with lazy_import("pdfplumber").open(io.BytesIO(pdf_bytes)) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            pages.append([re.sub(r"\s+", " ", line).strip() for line in text.splitlines() if line.strip()])
+    return pages
+
+
+def clean_text(pages: List[List[str]]) -> str:
+    """
+    Page text with page numbers and running headers/footers removed.
+
+    A line is treated as a running header when it repeats on more than
+    half of the pages of a document with three or more pages.
+    """
+    repeated = set()
+    if len(pages) >= 3:
+        counts = Counter(line for lines in pages for line in set(lines))
+        repeated = {line for line, n in counts.items() if n > len(pages) / 2}
+    kept = [
+        line
+        for lines in pages
+        for line in lines
+        if line not in repeated and not PAGE_NUMBER_RE.match(line)
+    ]
+    return "\n".join(kept)[:MAX_TEXT_CHARS]
+
+
+def _labelled(lines: List[str], *labels: str) -> Optional[str]:
+    wanted = {label.lower() for label in labels}
+    for line in lines:
+        match = LABEL_RE.match(line)
+        if match and match.group("label").strip().lower() in wanted:
+            return match.group("value").strip()
+    return None
+
+
+def _unique(values) -> List[str]:
+    return list(dict.fromkeys(values))
+
+
+# -----------------------------------------------------------------------------
+# Extractors
+# -----------------------------------------------------------------------------
+
+
+def _services(text: str) -> List[str]:
+    found = []
+    remaining = text.lower()
+    for service in DDS_SERVICE_TYPES:
+        needle = service.lower()
+        if needle in remaining:
+            found.append(service)
+            remaining = remaining.replace(needle, " ")
+    return sorted(found)
+
+
+def _extract_provider(pdf_bytes: bytes) -> Dict[str, Any]:
+    pages = _page_lines(pdf_bytes)
+    lines = [line for page in pages for line in page]
+    text = clean_text(pages)
+    websites = [w.rstrip(".") for w in WEBSITE_RE.findall(text) if not w.lower().endswith(".pdf")]
+    quality = re.search(r"https?://\S+(?:qsr|quality)\S*\.pdf", text, re.IGNORECASE)
+    address = ADDRESS_RE.search(text)
+    return {
+        "name": _labelled(lines, "Provider Name", "Provider", "Agency Name", "Agency"),
+        "address": address.group(0) if address else _labelled(lines, "Address"),
+        "phones": _unique(PHONE_RE.findall(text)),
+        "emails": _unique(e.rstrip(".") for e in EMAIL_RE.findall(text)),
+        "websites": _unique(websites),
+        "services": _services(text),
+        "qualityUrl": quality.group(0) if quality else None,
+        "pages": len(pages),
+        "text": text,
+    }
+
+
+def _status(percent: float) -> str:
+    """Bucket a focus-area score the way the analysis prompt does."""
+    if percent >= 90:
+        return "high"
+    if percent >= 80:
+        return "medium"
+    return "low"
+
+
+def _extract_quality(pdf_bytes: bytes) -> Dict[str, Any]:
+    pages = _page_lines(pdf_bytes)
+    lines = [line for page in pages for line in page]
+    text = clean_text(pages)
+
+    focus_areas = []
+    for line in lines:
+        match = PERCENT_LINE_RE.match(line)
+        if not match:
+            continue
+        percent = float(match.group("pct"))
+        if percent > 100:
+            continue
+        focus_areas.append({
+            "description": match.group("label").strip(" :-"),
+            "percentMet": percent,
+            "status": _status(percent),
+        })
+
+    dates = _unique(DATE_RE.findall(text))
+    labelled = DATE_RE.search(_labelled(lines, "Review Date", "Date of Review", "QSR Date") or "")
+    overall = (
+        round(sum(a["percentMet"] for a in focus_areas) / len(focus_areas), 1) if focus_areas else None
+    )
+    return {
+        "reviewDate": labelled.group(0) if labelled else (dates[0] if dates else None),
+        "dates": dates,
+        "focusAreas": focus_areas,
+        "averagePercentMet": overall,
+        "strengths": [a["description"] for a in focus_areas if a["status"] == "high"],
+        "concerns": [a["description"] for a in focus_areas if a["status"] == "low"],
+        "pages": len(pages),
+        "text": text,
+    }
+
+
+_EXTRACTORS: Dict[str, Callable[[bytes], Dict[str, Any]]] = {
+    KIND_PROVIDER: _extract_provider,
+    KIND_QUALITY: _extract_quality,
+}
+
+
+def extract(pdf_bytes: bytes, kind: str) -> Dict[str, Any]:
+    """
+    Structured fields and clean text from a DDS PDF, cached by content hash.
+
+    Args:
+        pdf_bytes: The PDF content
+        kind: KIND_PROVIDER (provider profile) or KIND_QUALITY (QSR)
+
+    Returns:
+        Extracted fields plus `sha1`, `pages` and `text`.
+    """
+    digest = hashlib.sha1(pdf_bytes).hexdigest()
+    conn = _connect()
+    row = conn.execute(
+        "SELECT result FROM pdf_extracts WHERE digest = ? AND kind = ? AND version = ?",
+        (digest, kind, EXTRACT_VERSION),
+    ).fetchone()
+    if row is not None:
+        CACHE_HITS.inc(namespace=f"extract-{kind}")
+        timing.record_cache(True)
+        return json.loads(row["result"])
+    CACHE_MISSES.inc(namespace=f"extract-{kind}")
+    timing.record_cache(False)
+
+    with PDF_PARSE_SECONDS.time(doc_type=f"{kind}-extract"), timing.span(f"extract-{kind}"):
+        result = _EXTRACTORS[kind](pdf_bytes)
+    result["sha1"] = digest
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO pdf_extracts (digest, kind, version, result, created_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (digest, kind) DO UPDATE SET
+                version = excluded.version, result = excluded.result, created_at = excluded.created_at
+            """,
+            (digest, kind, EXTRACT_VERSION, json.dumps(result), time.time()),
+        )
+    logger.info("Extracted %s PDF %s (%d pages)", kind, digest[:12], result["pages"])
+    return result
@@ -0,0 +1,247 @@
+"""
+Peer Benchmarking
+
+Compares many organizations' Form 990 financials at once. Filing series
+are loaded into (organizations x years) numpy arrays - from the local
+store in one query where possible - and every metric, percentile and
+rank is computed column-wise rather than one EIN at a time.
+"""
+
+from __future__ import annotations
+
+import logging
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import localstore
+import propublica
+
+logger = logging.getLogger(__name__)
+
+MAX_PEERS = 500
+MAX_YEARS = 10
+MAX_LIVE_LOOKUPS = 20  # uncached EINs fetched from ProPublica per request (~0.5 s each)
+
+# Metric name -> True if higher is better (used for ranking)
+METRICS = {
+    "revenue": True,
+    "revenueCagr": True,
+    "expenseRatio": False,
+    "operatingMargin": True,
+    "avgOperatingMargin": True,
+    "netAssets": True,
+    "netAssetsCagr": True,
+    "netAssetsChange": True,
+}
+
+
+def _load_series(eins: List[str], years: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Filing rows per EIN, most recent first.
+
+    Organizations found in the local store are loaded in bulk; the rest
+    go through `propublica.get_financial_history` (cache, then live API).
+    At most MAX_LIVE_LOOKUPS uncached EINs are fetched live per call, and
+    an EIN whose lookup fails is left out (reported as missing) rather
+    than failing the whole benchmark.
+    """
+    series = localstore.get_financial_series(eins, years)
+    live_lookups = 0
+    for ein in eins:
+        if ein in series:
+            continue
+        if propublica.cache_info(f"org:{ein}") is None:
+            if live_lookups >= MAX_LIVE_LOOKUPS:
+                continue
+            live_lookups += 1
+        try:
+            history = propublica.get_financial_history(ein, years)
+            details = propublica.get_nonprofit_details(ein) if history else None
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Peer lookup failed for %s: %s", ein, e)
+            continue
+        if not history:
+            continue
+        series[ein] = {
+            "name": details.name if details else "",
+            "filings": [
+                {
+                    "tax_period": fy.year,
+                    "total_revenue": fy.revenue,
+                    "total_expenses": fy.expenses,
+                    "total_assets": fy.total_assets,
+                    "net_assets": fy.net_assets,
+                }
+                for fy in history
+            ],
+        }
+    if live_lookups >= MAX_LIVE_LOOKUPS:
+        logger.info("Peer benchmark hit the live lookup cap (%d)", MAX_LIVE_LOOKUPS)
+    return series
+
+
+def _to_columns(eins: List[str], series: Dict[str, Dict[str, Any]], years: int) -> Dict[str, np.ndarray]:
+    """Pack filing rows into (n, years) float arrays; column 0 is each org's latest year."""
+    n = len(eins)
+    columns = {
+        name: np.full((n, years), np.nan)
+        for name in ("year", "total_revenue", "total_expenses", "net_assets")
+    }
+    for i, ein in enumerate(eins):
+        for j, filing in enumerate(series[ein]["filings"][:years]):
+            try:
+                columns["year"][i, j] = int(str(filing["tax_period"])[:4])
+            except ValueError:
+                continue
+            for name in ("total_revenue", "total_expenses", "net_assets"):
+                value = filing[name]
+                if value is not None:
+                    columns[name][i, j] = value
+    return columns
+
+
+def _latest(values: np.ndarray) -> np.ndarray:
+    """Most recent non-NaN value per row."""
+    valid = ~np.isnan(values)
+    first = np.argmax(valid, axis=1)
+    out = values[np.arange(len(values)), first]
+    out[~valid.any(axis=1)] = np.nan
+    return out
+
+
+def _oldest(values: np.ndarray) -> np.ndarray:
+    """Oldest non-NaN value per row."""
+    return _latest(values[:, ::-1])
+
+
+def _cagr(values: np.ndarray, year: np.ndarray) -> np.ndarray:
+    """Compound annual growth between each row's oldest and latest positive values."""
+    positive = np.where(values > 0, values, np.nan)
+    usable_years = np.where(np.isnan(positive), np.nan, year)
+    span = _latest(usable_years) - _oldest(usable_years)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (_latest(positive) / _oldest(positive)) ** (1.0 / span) - 1.0
+    growth[~(span > 0)] = np.nan
+    return growth
+
+
+def _tied_ranks(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """0-based (lowest, average) rank of each value in ascending order; equal values share ranks."""
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    first = np.cumsum(counts) - counts
+    lowest = first[inverse].astype(float)
+    return lowest, lowest + (counts[inverse] - 1) / 2.0
+
+
+def _percentiles(values: np.ndarray) -> np.ndarray:
+    """Percentile rank (0-100) of each value among the non-NaN peers; ties share their average rank."""
+    valid = ~np.isnan(values)
+    out = np.full(values.shape, np.nan)
+    count = int(valid.sum())
+    if count == 0:
+        return out
+    if count == 1:
+        out[valid] = 100.0
+        return out
+    _, average = _tied_ranks(values[valid])
+    out[valid] = average / (count - 1) * 100.0
+    return out
+
+
+def _ranks(values: np.ndarray, higher_is_better: bool) -> np.ndarray:
+    """1-based peer rank (1 = best, ties share the best rank); NaN for orgs without the metric."""
+    valid = ~np.isnan(values)
+    out = np.full(values.shape, np.nan)
+    if not valid.any():
+        return out
+    keyed = -values[valid] if higher_is_better else values[valid]
+    lowest, _ = _tied_ranks(keyed)
+    out[valid] = lowest + 1
+    return out
+
+
+def _compute_metrics(cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    revenue = cols["total_revenue"]
+    expenses = cols["total_expenses"]
+    net_assets = cols["net_assets"]
+    # Only years with both figures count toward margins
+    paired = ~np.isnan(revenue) & ~np.isnan(expenses) & (revenue != 0)
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # Orgs with no paired year get NaN, not a "Mean of empty slice" warning
+        warnings.simplefilter("ignore", RuntimeWarning)
+        margin = np.where(paired, (revenue - expenses) / revenue, np.nan)
+        expense_ratio = np.where(paired, expenses / revenue, np.nan)
+        avg_margin = np.nanmean(margin, axis=1)
+
+    return {
+        "revenue": _latest(revenue),
+        "revenueCagr": _cagr(revenue, cols["year"]),
+        "expenseRatio": _latest(expense_ratio),
+        "operatingMargin": _latest(margin),
+        "avgOperatingMargin": avg_margin,
+        "netAssets": _latest(net_assets),
+        "netAssetsCagr": _cagr(net_assets, cols["year"]),
+        "netAssetsChange": _latest(net_assets) - _oldest(net_assets),
+    }
+
+
+def _json_list(values: np.ndarray, digits: int = 4) -> List[Optional[float]]:
+    """NaN-safe, rounded list for JSON output."""
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def benchmark(eins: List[str], years: int = 5) -> Dict[str, Any]:
+    """
+    Benchmark a set of organizations against each other.
+
+    Args:
+        eins: EINs to compare (with or without hyphens)
+        years: Filing years per organization to consider (max 10)
+
+    Returns:
+        Column-oriented result: `eins`/`names`/`latestYear` lists aligned with
+        each list in `metrics`, `percentiles` and `ranks`; `peerStats` holds
+        min/p25/median/p75/max per metric; `missing` lists EINs with no data
+        (or not fetched: see MAX_LIVE_LOOKUPS).
+    """
+    years = max(1, min(years, MAX_YEARS))
+    requested = []
+    for ein in eins:
+        normalized = localstore.normalize_ein(ein)
+        if normalized and normalized not in requested:
+            requested.append(normalized)
+    requested = requested[:MAX_PEERS]
+
+    series = _load_series(requested, years)
+    found = [ein for ein in requested if ein in series and series[ein]["filings"]]
+    missing = [ein for ein in requested if ein not in found]
+    logger.info("Benchmarking %d organizations (%d missing)", len(found), len(missing))
+
+    cols = _to_columns(found, series, years)
+    metrics = _compute_metrics(cols) if found else {name: np.array([]) for name in METRICS}
+
+    peer_stats = {}
+    for name, values in metrics.items():
+        valid = values[~np.isnan(values)]
+        if len(valid):
+            q = np.percentile(valid, [0, 25, 50, 75, 100])
+            peer_stats[name] = dict(zip(("min", "p25", "median", "p75", "max"), _json_list(q)))
+        else:
+            peer_stats[name] = None
+
+    return {
+        "eins": found,
+        "names": [series[ein]["name"] for ein in found],
+        "latestYear": [None if np.isnan(y) else int(y) for y in _latest(cols["year"])] if found else [],
+        "years": years,
+        "metrics": {name: _json_list(values) for name, values in metrics.items()},
+        "percentiles": {name: _json_list(_percentiles(values), 1) for name, values in metrics.items()},
+        "ranks": {
+            name: [None if np.isnan(r) else int(r) for r in _ranks(values, METRICS[name])]
+            for name, values in metrics.items()
+        },
+        "peerStats": peer_stats,
+        "missing": missing,
+    }
@@ -0,0 +1,141 @@
+"""
+Speculative Organization Prefetch
+
+Users nearly always open one of the first few unified search results,
+which calls `/api/organization/{ein}`, `/api/propublica/financials/{ein}`
+and often `fetch-docs`; all of them start with `get_nonprofit_details`,
+a rate-limited ProPublica call when the EIN is cold. `schedule` queues
+the top PREFETCH_TOP_N results of a search for a background worker that
+warms that cache at low priority: its requests only take a rate-limiter
+slot when no user request is waiting for one (see
+`propublica.low_priority`).
+
+Bounds: at most QUEUE_MAX EINs wait (further ones are dropped), an EIN
+not fetched within MAX_AGE seconds of its search is skipped, and EINs
+already queued or cached are not queued again.
+
+`note_used(ein, endpoint)` is called by the detail endpoints; the first
+use of a prefetched EIN counts towards `leadgen_prefetches_used_total`,
+which against `leadgen_prefetches_total{outcome="fetched"}` gives the
+share of prefetches that paid off. PREFETCH_TOP_N=0 turns prefetching off.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+import propublica
+from metrics import PREFETCHES, PREFETCHES_USED
+
+logger = logging.getLogger(__name__)
+
+TOP_N = int(os.environ.get("PREFETCH_TOP_N", "3"))
+QUEUE_MAX = 50
+MAX_AGE = 60  # seconds; a prefetch this late would no longer beat the click
+TRACKED_MAX = 1_000  # prefetched EINs remembered for usage accounting
+
+_queue: Deque[Tuple[str, float]] = deque()  # (ein, queued_at)
+_queued: set = set()
+_prefetched: "OrderedDict[str, float]" = OrderedDict()  # ein -> fetched_at, until first used
+_lock = threading.Lock()
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def _normalize(ein: Any) -> str:
+    # Same form as the detail endpoints' cache keys: search hits carry EINs as
+    # numbers, and the frontend requests them unpadded
+    return str(ein).replace("-", "").strip()
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run, name="prefetch", daemon=True)
+        _worker.start()
+
+
+def schedule(eins: Iterable[Any]) -> int:
+    """
+    Queue the first TOP_N EINs of a result list for background prefetch.
+
+    Returns:
+        Number of EINs queued.
+    """
+    if TOP_N <= 0:
+        return 0
+    queued = 0
+    now = time.time()
+    with _lock:
+        for ein in list(eins)[:TOP_N]:
+            ein = _normalize(ein)
+            if ein in _queued or propublica.cache_info(f"org:{ein}") is not None:
+                continue
+            if len(_queue) >= QUEUE_MAX:
+                PREFETCHES.inc(outcome="dropped")
+                continue
+            _queue.append((ein, now))
+            _queued.add(ein)
+            queued += 1
+        if queued:
+            PREFETCHES.inc(queued, outcome="queued")
+            _ensure_worker()
+    if queued:
+        _wake.set()
+    return queued
+
+
+def note_used(ein: Any, endpoint: str) -> None:
+    """Record that a user opened `ein` (counted once per prefetch)."""
+    with _lock:
+        fetched_at = _prefetched.pop(_normalize(ein), None)
+    if fetched_at is not None:
+        PREFETCHES_USED.inc(endpoint=endpoint)
+
+
+def _next() -> Optional[Tuple[str, float]]:
+    with _lock:
+        if not _queue:
+            return None
+        ein, queued_at = _queue.popleft()
+        _queued.discard(ein)
+        return ein, queued_at
+
+
+def _prefetch(ein: str, queued_at: float) -> None:
+    if time.time() - queued_at > MAX_AGE:
+        PREFETCHES.inc(outcome="expired")
+        return
+    if propublica.cache_info(f"org:{ein}") is not None:
+        return  # the user (or another search) got there first
+    try:
+        with propublica.low_priority():
+            details = propublica.get_nonprofit_details(ein)
+    except Exception as e:  # noqa: BLE001
+        logger.debug("Prefetch of %s failed: %s", ein, e)
+        details = None
+    if details is None:
+        PREFETCHES.inc(outcome="failed")
+        return
+    PREFETCHES.inc(outcome="fetched")
+    with _lock:
+        _prefetched[ein] = time.time()
+        while len(_prefetched) > TRACKED_MAX:
+            _prefetched.popitem(last=False)
+
+
+def _run() -> None:
+    while True:
+        _wake.wait()
+        _wake.clear()
+        while True:
+            item = _next()
+            if item is None:
+                break
+            _prefetch(*item)
+
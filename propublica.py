@@ -10,16 +10,34 @@ API Documentation: https://projects.propublica.org/nonprofits/api
 from __future__ import annotations
 
 import io
+import itertools
 import logging
 import re
+import sys
+import threading
 import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
 from difflib import SequenceMatcher
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import requests
 
+import events
+import localstore
+import negcache
+import timing
+import upstream
+from metrics import (
+    CACHE_EVICTIONS,
+    CACHE_HITS,
+    CACHE_MISSES,
+    RATE_LIMIT_WAIT_SECONDS,
+    STALE_SERVED,
+)
+
 logger = logging.getLogger(__name__)
 
 # ProPublica API endpoints
@@ -27,12 +45,19 @@ PROPUBLICA_API_BASE = "https://projects.propublica.org/nonprofits/api/v2"
 PROPUBLICA_SEARCH_URL = f"{PROPUBLICA_API_BASE}/search.json"
 PROPUBLICA_ORG_URL = f"{PROPUBLICA_API_BASE}/organizations/{{ein}}.json"
 
-# Rate limiting
+# Rate limiting: each request reserves the next free slot, RATE_LIMIT_DELAY apart.
+# Low-priority requests (see `low_priority`) only take a slot once the limiter
+# has been idle for LOW_PRIORITY_IDLE, so they never queue ahead of user requests.
 RATE_LIMIT_DELAY = 0.5  # seconds between requests
-_last_request_time = 0.0
+LOW_PRIORITY_IDLE = 0.5  # seconds
+_next_slot = 0.0
+_rate_lock = threading.Lock()
+_low_priority: ContextVar[bool] = ContextVar("propublica_low_priority", default=False)
 
-# Cache for search results and org details
+# Cache for search results and org details. Each set gets a new version
+# (used by httpcache to memoize and validate responses built from it).
 _CACHE: Dict[str, Any] = {}
+_VERSIONS = itertools.count(1)
 CACHE_TTL = {
     "search": 60 * 60,  # 1 hour
     "org": 24 * 60 * 60,  # 24 hours
@@ -40,7 +65,17 @@ CACHE_TTL = {
 }
 
 
-@dataclass
+# Failed lookups; see negcache.
+NEGATIVE_CACHE = negcache.NegativeCache(
+    {
+        "search": 2 * 60,  # 2 minutes - upstream errors, not empty result sets
+        "org": 60 * 60,  # 1 hour - EIN not found (404)
+        "org_error": 60,  # 1 minute - other upstream failures
+    }
+)
+
+
+@dataclass(slots=True)
 class NonprofitSearchResult:
     """A nonprofit organization from ProPublica search results."""
     ein: str
@@ -61,7 +96,7 @@ class NonprofitSearchResult:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class Filing:
     """A Form 990 filing from ProPublica."""
     tax_period: str
@@ -82,7 +117,7 @@ class Filing:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class FinancialYear:
     """Financial data for a single year."""
     year: str
@@ -118,7 +153,7 @@ class FinancialYear:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class NonprofitDetails:
     """Full nonprofit details including filings."""
     ein: str
@@ -140,14 +175,49 @@ class NonprofitDetails:
         }
 
 
+def _intern(value: Any) -> Any:
+    """
+    Share repeated short strings (cities, states, NTEE codes, tax years)
+    across the thousands of cached results instead of one copy per object.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@contextmanager
+def low_priority() -> Iterator[None]:
+    """Make ProPublica requests in this block yield to all other traffic (for prefetching)."""
+    token = _low_priority.set(True)
+    try:
+        yield
+    finally:
+        _low_priority.reset(token)
+
+
 def _rate_limit():
     """Ensure we don't exceed ProPublica's rate limits."""
-    global _last_request_time
-    now = time.time()
-    elapsed = now - _last_request_time
-    if elapsed < RATE_LIMIT_DELAY:
-        time.sleep(RATE_LIMIT_DELAY - elapsed)
-    _last_request_time = time.time()
+    global _next_slot
+    if _low_priority.get():
+        started = time.time()
+        while True:
+            with _rate_lock:
+                now = time.time()
+                idle_at = _next_slot + LOW_PRIORITY_IDLE
+                if idle_at <= now:
+                    _next_slot = now + RATE_LIMIT_DELAY
+                    break
+            time.sleep(idle_at - now)
+        RATE_LIMIT_WAIT_SECONDS.observe(now - started, priority="low")
+        return
+
+    with _rate_lock:
+        now = time.time()
+        slot = max(now, _next_slot)
+        _next_slot = slot + RATE_LIMIT_DELAY
+    wait = slot - now
+    if wait:
+        with timing.span("ratelimit"):
+            time.sleep(wait)
+    RATE_LIMIT_WAIT_SECONDS.observe(wait, priority="normal")
 
 
 def _get_cached(key: str, ttl_key: str):
@@ -155,25 +225,57 @@ def _get_cached(key: str, ttl_key: str):
     if key in _CACHE:
         entry = _CACHE[key]
         if time.time() < entry["expires_at"]:
+            CACHE_HITS.inc(namespace=ttl_key)
+            timing.record_cache(True)
             return entry["value"]
+    CACHE_MISSES.inc(namespace=ttl_key)
+    timing.record_cache(False)
     return None
 
 
+def _get_stale(key: str, ttl_key: str):
+    """
+    An expired cached value still within upstream.STALE_IF_ERROR, else None.
+
+    For error paths: the response is flagged stale (see timing.record_stale).
+    """
+    entry = _CACHE.get(key)
+    if entry is None or entry["expires_at"] + upstream.STALE_IF_ERROR <= time.time():
+        return None
+    logger.warning("Serving stale %s from %.0fs ago", key, time.time() - entry["loaded_at"])
+    STALE_SERVED.inc(namespace=ttl_key)
+    timing.record_stale()
+    return entry["value"]
+
+
 def _set_cached(key: str, value: Any, ttl_key: str):
     """Cache a value with TTL."""
+    if key in _CACHE and time.time() >= _CACHE[key]["expires_at"]:
+        CACHE_EVICTIONS.inc(namespace=ttl_key)
+    now = time.time()
     _CACHE[key] = {
         "value": value,
-        "expires_at": time.time() + CACHE_TTL[ttl_key],
+        "expires_at": now + CACHE_TTL[ttl_key],
+        "loaded_at": now,
+        "version": next(_VERSIONS),
     }
 
 
+def cache_info(key: str) -> Optional[Tuple[int, float, float]]:
+    """(version, loaded_at, expires_at) of an unexpired cache entry, else None."""
+    entry = _CACHE.get(key)
+    if entry is None or entry["expires_at"] <= time.time():
+        return None
+    return entry["version"], entry["loaded_at"], entry["expires_at"]
+
+
 def _http_get(url: str, params: Optional[Dict] = None) -> Dict:
     """Make a rate-limited HTTP GET request."""
     _rate_limit()
     logger.debug("ProPublica API request: %s", url)
 
     try:
-        resp = requests.get(
+        resp = upstream.get(
             url,
             params=params,
             headers={"User-Agent": "DDSScraper/1.0"},
@@ -203,11 +305,24 @@ def search_nonprofits(
         List of matching nonprofit organizations
     """
     cache_key = f"search:{query.lower()}:{state}:{page}"
+    if NEGATIVE_CACHE.hit(cache_key):
+        logger.debug("Negative cache hit for search: %s", query)
+        return []
     cached = _get_cached(cache_key, "search")
     if cached is not None:
         logger.debug("Cache hit for search: %s", query)
         return cached
 
+    # The store only answers searches for states loaded from a full BMF
+    # extract; elsewhere it holds just the orgs looked up so far
+    local_rows = localstore.search_nonprofits(query, state, page)
+    if local_rows and localstore.covers_state(state):
+        results = [_search_result_from_row(row) for row in local_rows]
+        logger.debug("Local store hit for search: %s (%d results)", query, len(results))
+        _set_cached(cache_key, results, "search")
+        events.publish("nonprofits.seen", orgs=[r.to_dict() for r in results])
+        return results
+
     logger.info("Searching ProPublica for: %s (state=%s)", query, state)
 
     params = {
@@ -220,24 +335,26 @@ def search_nonprofits(
         data = _http_get(PROPUBLICA_SEARCH_URL, params)
     except Exception as e:
         logger.error("ProPublica search failed: %s", str(e))
+        stale = _get_stale(cache_key, "search")
+        if stale is not None:
+            return stale
+        if local_rows:
+            # Partial, but better than nothing while ProPublica is down
+            STALE_SERVED.inc(namespace="search")
+            timing.record_stale()
+            return [_search_result_from_row(row) for row in local_rows]
+        NEGATIVE_CACHE.add(cache_key, "search")
         return []
 
     organizations = data.get("organizations", [])
     results = []
 
     for org in organizations:
-        result = NonprofitSearchResult(
-            ein=org.get("ein", ""),
-            name=org.get("name", ""),
-            city=org.get("city", ""),
-            state=org.get("state", ""),
-            ntee_code=org.get("ntee_code"),
-            subsection_code=org.get("subsection_code"),
-        )
-        results.append(result)
+        results.append(_search_result_from_row(org))
 
     logger.info("Found %d results for: %s", len(results), query)
     _set_cached(cache_key, results, "search")
+    events.publish("nonprofits.seen", orgs=[r.to_dict() for r in results])
     return results
 
 
@@ -255,11 +372,38 @@ def get_nonprofit_details(ein: str) -> Optional[NonprofitDetails]:
     ein = ein.replace("-", "")
 
     cache_key = f"org:{ein}"
+    if NEGATIVE_CACHE.hit(cache_key):
+        logger.debug("Negative cache hit for org: %s", ein)
+        return None
     cached = _get_cached(cache_key, "org")
     if cached is not None:
         logger.debug("Cache hit for org: %s", ein)
         return cached
 
+    # Bulk-imported orgs are served as stored (missing years are filled by
+    # get_financial_history). Rows written through from ProPublica are only
+    # as fresh as the in-memory cache would be: past the org TTL, ProPublica
+    # is asked again for new filings
+    local = localstore.get_organization(ein)
+    if local and local["filings"] and (
+        localstore.is_bulk_imported(local) or not localstore.needs_live_sync(local, CACHE_TTL["org"])
+    ):
+        logger.debug("Local store hit for org: %s", ein)
+        details = _details_from_local(local)
+        _set_cached(cache_key, details, "org")
+        return details
+
+    return _fetch_live_details(ein, local)
+
+
+def _fetch_live_details(ein: str, local: Optional[Dict[str, Any]] = None) -> Optional[NonprofitDetails]:
+    """
+    Fetch org details from the ProPublica API and merge them into the local store.
+
+    If the request fails, `local` (a `localstore.get_organization` row) is
+    served flagged stale, after any stale cache entry.
+    """
+    cache_key = f"org:{ein}"
     logger.info("Fetching ProPublica details for EIN: %s", ein)
 
     url = PROPUBLICA_ORG_URL.format(ein=ein)
@@ -269,10 +413,18 @@ def get_nonprofit_details(ein: str) -> Optional[NonprofitDetails]:
     except requests.HTTPError as e:
         if e.response.status_code == 404:
             logger.warning("Organization not found: %s", ein)
+            NEGATIVE_CACHE.add(cache_key, "org")
             return None
+        stale = _get_stale(cache_key, "org") or _stale_local(local)
+        if stale is not None:
+            return stale
         raise
     except Exception as e:
         logger.error("ProPublica org fetch failed: %s", str(e))
+        stale = _get_stale(cache_key, "org") or _stale_local(local)
+        if stale is not None:
+            return stale
+        NEGATIVE_CACHE.add(cache_key, "org_error")
         return None
 
     org = data.get("organization", {})
@@ -303,7 +455,7 @@ def get_nonprofit_details(ein: str) -> Optional[NonprofitDetails]:
                 # So we'll just use what we have and mark expenses as N/A
                 logger.info(f"Adding latest year {org_year} from organization data (not yet in filings)")
                 latest_filing = Filing(
-                    tax_period=str(org_year),
+                    tax_period=_intern(str(org_year)),
                     pdf_url=None,
                     total_revenue=org_revenue,
                     total_expenses=None,  # Not available in org summary
@@ -316,7 +468,7 @@ def get_nonprofit_details(ein: str) -> Optional[NonprofitDetails]:
 
     for f in filings_data:
         filing = Filing(
-            tax_period=str(f.get("tax_prd_yr", "")),
+            tax_period=_intern(str(f.get("tax_prd_yr", ""))),
             pdf_url=f.get("pdf_url"),
             total_revenue=f.get("totrevenue"),
             total_expenses=f.get("totfuncexpns"),
@@ -331,40 +483,127 @@ def get_nonprofit_details(ein: str) -> Optional[NonprofitDetails]:
     details = NonprofitDetails(
         ein=org.get("ein", ein),
         name=org.get("name", ""),
-        city=org.get("city", ""),
-        state=org.get("state", ""),
-        ntee_code=org.get("ntee_code"),
+        city=_intern(org.get("city", "")),
+        state=_intern(org.get("state", "")),
+        ntee_code=_intern(org.get("ntee_code")),
         filings=filings,
     )
 
     _set_cached(cache_key, details, "org")
+    _save_local(details, org)
+    events.publish(
+        "nonprofits.seen",
+        orgs=[{"ein": details.ein, "name": details.name, "city": details.city, "state": details.state}],
+    )
     return details
 
 
-def fetch_form990_pdf(ein: str, year: Optional[int] = None) -> Optional[bytes]:
+def _search_result_from_row(row: Dict[str, Any]) -> NonprofitSearchResult:
+    """Build a search result from a ProPublica search hit or a local store row."""
+    return NonprofitSearchResult(
+        ein=row.get("ein", ""),
+        name=row.get("name", ""),
+        city=_intern(row.get("city", "")),
+        state=_intern(row.get("state", "")),
+        ntee_code=_intern(row.get("ntee_code")),
+        subsection_code=row.get("subsection_code"),
+    )
+
+
+def _details_from_local(local: Dict[str, Any]) -> NonprofitDetails:
+    """Build NonprofitDetails from a `localstore.get_organization` row."""
+    return NonprofitDetails(
+        ein=local["ein"],
+        name=local["name"],
+        city=_intern(local["city"] or ""),
+        state=_intern(local["state"] or ""),
+        ntee_code=_intern(local["ntee_code"]),
+        filings=[
+            Filing(
+                tax_period=_intern(f["tax_period"]),
+                pdf_url=f["pdf_url"],
+                total_revenue=f["total_revenue"],
+                total_expenses=f["total_expenses"],
+                total_assets=f["total_assets"],
+                net_assets=f["net_assets"],
+            )
+            for f in local["filings"]
+        ],
+    )
+
+
+def _stale_local(local: Optional[Dict[str, Any]]) -> Optional[NonprofitDetails]:
+    """Locally stored details to fall back on when ProPublica fails, flagged stale."""
+    if not local or not local["filings"]:
+        return None
+    logger.warning("Serving locally stored details for %s", local["ein"])
+    STALE_SERVED.inc(namespace="org")
+    timing.record_stale()
+    return _details_from_local(local)
+
+
+def _save_local(details: NonprofitDetails, org: Dict[str, Any]) -> None:
+    """Write live details through to the local store, if one is in use."""
+    if not localstore.enabled():
+        return
+    try:
+        localstore.save_organization(
+            {
+                "ein": details.ein,
+                "name": details.name,
+                "city": details.city,
+                "state": details.state,
+                "ntee_code": details.ntee_code,
+                "subsection_code": org.get("subsection_code"),
+            },
+            [f.to_dict() for f in details.filings],
+        )
+    except Exception as e:
+        logger.warning("Could not save %s to local store: %s", details.ein, str(e))
+
+
+def _refresh_from_live(ein: str, details: NonprofitDetails) -> NonprofitDetails:
     """
-    Download Form 990 PDF for an organization.
+    Fill years or PDF links missing from locally stored details.
+
+    ProPublica is consulted at most once per `localstore.LIVE_SYNC_INTERVAL`
+    per organization; otherwise the local details are returned as-is.
+    """
+    local = localstore.get_organization(ein)
+    if not local or not localstore.needs_live_sync(local):
+        return details
+    live = _fetch_live_details(ein)
+    if not live:
+        return details
+    # Re-read so years only present in the bulk import are kept
+    merged = localstore.get_organization(ein)
+    if merged and merged["filings"]:
+        live = _details_from_local(merged)
+        _set_cached(f"org:{ein}", live, "org")
+    return live
+
+
+def find_form990_filing(ein: str, year: Optional[int] = None) -> Optional[Filing]:
+    """
+    The filing whose Form 990 PDF should be used.
 
     Args:
         ein: 9-digit EIN
         year: Tax year (default: most recent available with PDF)
 
     Returns:
-        PDF bytes, or None if not available
+        Filing with a `pdf_url`, or None if there is none
     """
     ein = ein.replace("-", "")
-    cache_key = f"pdf:{ein}:{year or 'latest'}"
-    cached = _get_cached(cache_key, "pdf")
-    if cached is not None:
-        logger.debug("Cache hit for PDF: %s", ein)
-        return cached
-
-    # Get org details to find PDF URL
     details = get_nonprofit_details(ein)
     if not details or not details.filings:
         logger.warning("No filings found for EIN: %s", ein)
         return None
 
+    # Bulk IRS data has no PDF links; pick them up from ProPublica if needed
+    if not any(f.pdf_url for f in details.filings):
+        details = _refresh_from_live(ein, details)
+
     # Find the requested year or find most recent with a PDF URL
     filing = None
     if year:
@@ -392,15 +631,41 @@ def fetch_form990_pdf(ein: str, year: Optional[int] = None) -> Optional[bytes]:
     if not filing.pdf_url:
         logger.warning("No PDF URL for EIN: %s, year: %s", ein, filing.tax_period)
         return None
+    return filing
+
+
+def fetch_form990_pdf(ein: str, year: Optional[int] = None) -> Optional[bytes]:
+    """
+    Download Form 990 PDF for an organization.
+
+    Args:
+        ein: 9-digit EIN
+        year: Tax year (default: most recent available with PDF)
+
+    Returns:
+        PDF bytes, or None if not available
+    """
+    ein = ein.replace("-", "")
+    cache_key = f"pdf:{ein}:{year or 'latest'}"
+    cached = _get_cached(cache_key, "pdf")
+    if cached is not None:
+        logger.debug("Cache hit for PDF: %s", ein)
+        return cached
+
+    filing = find_form990_filing(ein, year)
+    if not filing:
+        return None
 
     logger.info("Fetching Form 990 PDF: %s (year %s)", ein, filing.tax_period)
 
     _rate_limit()
     try:
-        resp = requests.get(
+        resp = upstream.get(
             filing.pdf_url,
             headers={"User-Agent": "DDSScraper/1.0"},
             timeout=60,
+            hedge=True,
+            before_hedge=_rate_limit,  # a hedge is a second ProPublica request
         )
         resp.raise_for_status()
         pdf_bytes = resp.content
@@ -409,7 +674,35 @@ def fetch_form990_pdf(ein: str, year: Optional[int] = None) -> Optional[bytes]:
         return pdf_bytes
     except Exception as e:
         logger.error("PDF download failed: %s", str(e))
-        return None
+        return _get_stale(cache_key, "pdf")
+
+
+def download_form990(filing: Filing, fileobj: BinaryIO, chunk_size: int = 256 * 1024) -> int:
+    """
+    Stream a filing's Form 990 PDF into `fileobj` without buffering it in memory.
+
+    Rate-limited like every ProPublica request; raises on download errors.
+
+    Returns:
+        Number of bytes written
+    """
+    _rate_limit()
+    resp = upstream.get(
+        filing.pdf_url,
+        headers={"User-Agent": "DDSScraper/1.0"},
+        timeout=60,
+        stream=True,
+    )
+    try:
+        resp.raise_for_status()
+        written = 0
+        for chunk in resp.iter_content(chunk_size):
+            fileobj.write(chunk)
+            written += len(chunk)
+    finally:
+        resp.close()
+    logger.info("Streamed Form 990 PDF for %s: %d bytes", filing.tax_period, written)
+    return written
 
 
 def normalize_org_name(name: str) -> str:
@@ -437,6 +730,27 @@ def calculate_similarity(name1: str, name2: str) -> float:
     return SequenceMatcher(None, norm1, norm2).ratio()
 
 
+def match_score(propublica_name: str, dds_name: str) -> float:
+    """
+    How well a ProPublica organization name matches a DDS provider name (0.0 to 1.0).
+
+    Fuzzy similarity, boosted when one normalized name contains the other.
+    """
+    norm_propublica = normalize_org_name(propublica_name)
+    norm_dds = normalize_org_name(dds_name)
+
+    # Strategy 1: Fuzzy similarity
+    score = calculate_similarity(propublica_name, dds_name)
+
+    # Strategy 2: Check containment (DDS name in ProPublica name)
+    # This helps with "March Inc Of Manchester C/O Robert F Gorman" matching "March, Inc. of Manchester"
+    if norm_dds in norm_propublica or norm_propublica in norm_dds:
+        # Boost score if one name contains the other
+        containment_score = len(norm_dds) / max(len(norm_propublica), 1)
+        score = max(score, 0.75 + (containment_score * 0.2))
+    return score
+
+
 def match_to_dds_provider(
     propublica_name: str,
     dds_providers: List[Dict[str, str]],
@@ -460,21 +774,9 @@ def match_to_dds_provider(
     """
     best_match = None
     best_score = 0.0
-    norm_propublica = normalize_org_name(propublica_name)
 
     for provider in dds_providers:
-        norm_dds = normalize_org_name(provider["name"])
-
-        # Strategy 1: Fuzzy similarity
-        score = calculate_similarity(propublica_name, provider["name"])
-
-        # Strategy 2: Check containment (DDS name in ProPublica name)
-        # This helps with "March Inc Of Manchester C/O Robert F Gorman" matching "March, Inc. of Manchester"
-        if norm_dds in norm_propublica or norm_propublica in norm_dds:
-            # Boost score if one name contains the other
-            containment_score = len(norm_dds) / max(len(norm_propublica), 1)
-            score = max(score, 0.75 + (containment_score * 0.2))
-
+        score = match_score(propublica_name, provider["name"])
         if score > best_score:
             best_score = score
             best_match = provider
@@ -497,8 +799,10 @@ def get_financial_history(ein: str, years: int = 5) -> List[FinancialYear]:
     """
     Get structured financial history for an organization.
 
-    This function fetches financial data directly from ProPublica's API,
-    providing reliable data without requiring AI parsing.
+    Filings come from the local store when the organization is stored
+    there; ProPublica's API is consulted for organizations missing locally
+    and, at most once per `localstore.LIVE_SYNC_INTERVAL`, for years the
+    local store lacks.
 
     Args:
         ein: 9-digit EIN (with or without hyphen)
@@ -522,6 +826,10 @@ def get_financial_history(ein: str, years: int = 5) -> List[FinancialYear]:
         logger.warning("No filings found for EIN: %s", ein)
         return []
 
+    # Fill years missing locally from the live API
+    if len(details.filings) < years:
+        details = _refresh_from_live(ein, details)
+
     # Extract financial data from filings
     financial_years: List[FinancialYear] = []
 
@@ -0,0 +1,183 @@
+"""
+Town Proximity Index
+
+Reps cover regions, not single towns. `resources/ct_town_centroids.csv`
+bundles an approximate center point for each of Connecticut's 169 towns;
+on first use every town's neighbors within MAX_RADIUS miles are computed
+once and kept sorted by distance, so a radius query is a binary search
+rather than a scan over all towns.
+
+`nearby_providers` merges the cached rosters of every DDS town within a
+radius into one provider list, deduplicated by profile URL: each
+provider appears once, at the distance of the nearest town listing it,
+with every listing town in `towns`.
+
+Usage:
+    python -m proximity Hartford --radius 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import csv
+import json
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import scraper
+
+logger = logging.getLogger(__name__)
+
+CENTROIDS_PATH = Path(__file__).resolve().parent / "resources" / "ct_town_centroids.csv"
+
+EARTH_RADIUS_MILES = 3958.8
+MAX_RADIUS = 50.0  # miles; neighbors further apart are not indexed
+DEFAULT_RADIUS = 10.0
+
+
+@dataclass(frozen=True, slots=True)
+class Town:
+    name: str
+    county: str
+    lat: float
+    lon: float
+
+
+@dataclass(slots=True)
+class _Neighbors:
+    distances: List[float]  # ascending, for bisect
+    towns: List[str]
+
+
+_TOWNS: Dict[str, Town] = {}  # normalized name -> town
+_INDEX: Dict[str, _Neighbors] = {}  # normalized name -> neighbors within MAX_RADIUS (itself first)
+_index_lock = threading.Lock()
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.split()).lower()
+
+
+def distance_miles(a: Town, b: Town) -> float:
+    """Great-circle (haversine) distance between two town centers."""
+    lat1, lat2 = math.radians(a.lat), math.radians(b.lat)
+    dlat, dlon = lat2 - lat1, math.radians(b.lon - a.lon)
+    h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+
+def _load() -> None:
+    with _index_lock:
+        if _INDEX:
+            return
+        with open(CENTROIDS_PATH, newline="", encoding="utf-8") as fh:
+            towns = [Town(r["town"], r["county"], float(r["lat"]), float(r["lon"])) for r in csv.DictReader(fh)]
+        index: Dict[str, _Neighbors] = {}
+        for town in towns:
+            near = sorted(
+                (d, other.name) for other in towns
+                if (d := distance_miles(town, other)) <= MAX_RADIUS
+            )
+            index[_normalize(town.name)] = _Neighbors([d for d, _ in near], [name for _, name in near])
+        _TOWNS.update((_normalize(t.name), t) for t in towns)
+        _INDEX.update(index)
+        logger.info("Indexed %d town centroids", len(towns))
+
+
+def get_town(name: str) -> Optional[Town]:
+    _load()
+    return _TOWNS.get(_normalize(name))
+
+
+def neighbors(town: str, radius: float) -> Optional[List[Tuple[str, float]]]:
+    """
+    Towns within `radius` miles of `town` (itself first), nearest first.
+
+    Returns:
+        [(town name, distance in miles)], or None for an unknown town.
+    """
+    _load()
+    entry = _INDEX.get(_normalize(town))
+    if entry is None:
+        return None
+    end = bisect.bisect_right(entry.distances, min(radius, MAX_RADIUS))
+    return [(entry.towns[i], entry.distances[i]) for i in range(end)]
+
+
+# -----------------------------------------------------------------------------
+# Providers
+# -----------------------------------------------------------------------------
+
+
+def _dds_towns(town: str, radius: float) -> Optional[List[Tuple[str, float]]]:
+    """Nearby towns that have a DDS roster, by their DDS portal names."""
+    near = neighbors(town, radius)
+    if near is None:
+        return None
+    portal_names = {_normalize(t["name"]): t["name"] for t in scraper.get_towns()}
+    return [(portal_names[_normalize(name)], d) for name, d in near if _normalize(name) in portal_names]
+
+
+def cache_info(town: str, radius: float) -> Optional[Tuple[int, float, float]]:
+    """Combined (version, loaded_at, expires_at) of the rosters behind a query; None if any is not cached."""
+    near = _dds_towns(town, radius)
+    if near is None:
+        return None
+    infos = []
+    for name, _ in near:
+        info = scraper.cache_info(scraper.providers_cache_key(name))
+        if info is None:
+            return None
+        infos.append(info)
+    if not infos:
+        return None
+    return hash(tuple(i[0] for i in infos)), max(i[1] for i in infos), min(i[2] for i in infos)
+
+
+def nearby_providers(town: str, radius: float = DEFAULT_RADIUS) -> Optional[Dict[str, Any]]:
+    """
+    Providers listed in any DDS town within `radius` miles of `town`.
+
+    Returns:
+        Dict with the resolved `town`, `radius`, the `towns` searched
+        ({town, distance}) and `providers` ({name, url, town, distance,
+        towns}), nearest first; None for a town not in the centroid set.
+    """
+    near = _dds_towns(town, radius)
+    if near is None:
+        return None
+    found: Dict[str, Dict[str, Any]] = {}
+    for name, distance in near:
+        for provider in scraper.get_providers_for_town(name):
+            entry = found.get(provider["url"])
+            if entry is None:
+                found[provider["url"]] = {**provider.to_dict(), "distance": round(distance, 1), "towns": [name]}
+            elif name not in entry["towns"]:
+                entry["towns"].append(name)
+    return {
+        "town": get_town(town).name,
+        "radius": radius,
+        "towns": [{"town": name, "distance": round(d, 1)} for name, d in near],
+        "providers": list(found.values()),
+        "count": len(found),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="proximity", description="Towns near a Connecticut town")
+    parser.add_argument("town")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS, help="Miles (max %.0f)" % MAX_RADIUS)
+    args = parser.parse_args(argv)
+    near = neighbors(args.town, args.radius)
+    if near is None:
+        parser.error(f"Unknown town: {args.town}")
+    print(json.dumps([{"town": name, "distance": round(d, 1)} for name, d in near], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Quality Report URL Index
+
+A provider's Quality Service Review link is only printed inside its
+provider profile PDF, so fetching the quality report used to mean
+downloading and parsing the profile first. This index stores the link
+per provider profile URL (or that the profile has none) so request paths
+can fetch the profile and the quality report concurrently, or skip the
+profile entirely when only the quality report is wanted.
+
+The index fills in as the crawl runs: each loaded town roster
+(`providers.loaded`) queues a background job indexing its providers not
+yet in the index. Request paths also index every profile they parse.
+`python -m quality_index build` indexes every provider statewide.
+
+Entries older than INDEX_TTL are re-indexed. The profile is parsed again
+whenever a request downloads a profile whose hash differs from the
+indexed one, or an indexed quality URL fails to download.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import events
+import localstore
+import scraper
+
+logger = logging.getLogger(__name__)
+
+INDEX_TTL = 30 * 24 * 60 * 60  # quality reviews are republished at most a few times a year
+FETCH_WORKERS = 8
+
+NO_QUALITY_URL = "No quality report URL found in provider profile"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quality_urls (
+    provider_url TEXT PRIMARY KEY,
+    quality_url TEXT,
+    profile_sha1 TEXT,
+    indexed_at REAL NOT NULL
+);
+"""
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("quality_index", SCHEMA)
+    return conn
+
+
+# -----------------------------------------------------------------------------
+# Index
+# -----------------------------------------------------------------------------
+
+
+def lookup(provider_url: str) -> Optional[Dict[str, Any]]:
+    """
+    The indexed entry for a provider profile URL, or None if it is not
+    indexed (or its entry is older than INDEX_TTL).
+
+    `qualityUrl` is None when the profile has no quality report link.
+    """
+    row = _connect().execute(
+        "SELECT * FROM quality_urls WHERE provider_url = ? AND indexed_at > ?",
+        (provider_url, time.time() - INDEX_TTL),
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "providerUrl": row["provider_url"],
+        "qualityUrl": row["quality_url"],
+        "profileSha1": row["profile_sha1"],
+        "indexedAt": row["indexed_at"],
+    }
+
+
+def unindexed(provider_urls: Iterable[str]) -> List[str]:
+    """Unique provider URLs without a fresh index entry."""
+    urls = list(dict.fromkeys(provider_urls))
+    known = {r["provider_url"] for r in _connect().execute(
+        "SELECT provider_url FROM quality_urls WHERE indexed_at > ?", (time.time() - INDEX_TTL,)
+    )}
+    return [url for url in urls if url not in known]
+
+
+def index_pdf(provider_url: str, provider_pdf: bytes, quality_url: Optional[str] = None) -> Optional[str]:
+    """
+    Extract the quality report URL from an already downloaded profile and store it.
+
+    Callers that already found the link in the profile text pass it as
+    `quality_url` so the profile is not parsed again.
+    """
+    if quality_url is None:
+        quality_url = scraper.extract_quality_profile_url(provider_pdf)
+    conn = _connect()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO quality_urls (provider_url, quality_url, profile_sha1, indexed_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (provider_url) DO UPDATE SET
+                quality_url = excluded.quality_url, profile_sha1 = excluded.profile_sha1,
+                indexed_at = excluded.indexed_at
+            """,
+            (provider_url, quality_url, hashlib.sha1(provider_pdf).hexdigest(), time.time()),
+        )
+    return quality_url
+
+
+def quality_url_for(provider_url: str, provider_pdf: bytes, text_url: Optional[str] = None) -> Optional[str]:
+    """
+    The quality report URL of a downloaded profile, kept in the index.
+
+    An entry indexed from the same bytes is used as is. Otherwise the
+    profile is indexed now with `text_url`, the link `pdfextract` found in
+    its text; the profile is only parsed again when the text had none
+    (the link may be a hyperlink annotation).
+    """
+    entry = lookup(provider_url)
+    if entry is not None and entry["profileSha1"] == hashlib.sha1(provider_pdf).hexdigest():
+        return entry["qualityUrl"]
+    return index_pdf(provider_url, provider_pdf, text_url)
+
+
+def index_provider(provider_url: str) -> Dict[str, Any]:
+    """Index one provider (downloading its profile) unless it is already indexed."""
+    entry = lookup(provider_url)
+    if entry is None:
+        index_pdf(provider_url, scraper.fetch_pdf(provider_url))
+        entry = lookup(provider_url)
+    return entry
+
+
+def build(force: bool = False) -> Dict[str, int]:
+    """Index every DDS provider statewide on the calling thread."""
+    urls = list(dict.fromkeys(p["url"] for p in scraper.get_all_providers_flat()))
+    todo = urls if force else unindexed(urls)
+    found = failed = 0
+    for i, url in enumerate(todo, 1):
+        try:
+            found += index_pdf(url, scraper.fetch_pdf(url)) is not None
+        except Exception as e:  # noqa: BLE001
+            failed += 1
+            logger.warning("Indexing %s failed: %s", url, e)
+        if i % 50 == 0:
+            logger.info("Indexed %d/%d provider profiles", i, len(todo))
+    return {"providers": len(urls), "checked": len(todo), "withQualityUrl": found, "failed": failed}
+
+
+# -----------------------------------------------------------------------------
+# Request paths
+# -----------------------------------------------------------------------------
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="quality-fetch")
+    return _pool
+
+
+def _fetch_quality(quality_url: Optional[str]) -> Tuple[Optional[bytes], Optional[str]]:
+    """(quality PDF, None) or (None, error message)."""
+    if not quality_url:
+        return None, NO_QUALITY_URL
+    if not scraper._is_allowed_pdf(quality_url):
+        logger.warning("Quality URL blocked: %s", quality_url)
+        return None, "Quality report URL not from allowed domain"
+    try:
+        return scraper.fetch_pdf(quality_url), None
+    except Exception as e:  # noqa: BLE001
+        logger.error("Error fetching quality report: %s", e)
+        return None, f"Quality report fetch error: {e}"
+
+
+def fetch_with_quality(provider_url: str, include_profile: bool = True) -> Dict[str, Any]:
+    """
+    A provider profile PDF and its quality report PDF.
+
+    With an index entry both downloads run concurrently (and with
+    `include_profile=False` the profile is not downloaded at all);
+    otherwise the profile is fetched, parsed and indexed first.
+
+    Returns:
+        Dict with `provider` (bytes; None if not included and the index
+        already had the link),
+        `qualityUrl`, `quality` (bytes or None) and `error` (why the
+        quality report is missing). Errors fetching the profile itself
+        propagate (ValueError for a disallowed URL).
+    """
+    entry = lookup(provider_url)
+    if entry is None:
+        provider = scraper.fetch_pdf(provider_url)
+        quality_url = index_pdf(provider_url, provider)
+        quality, error = _fetch_quality(quality_url)
+        return {"provider": provider, "qualityUrl": quality_url, "quality": quality, "error": error}
+
+    quality_url = entry["qualityUrl"]
+    provider = None
+    if include_profile and quality_url:
+        # Each download runs in a copy of this request's context (timing spans)
+        profile_job = _executor().submit(contextvars.copy_context().run, scraper.fetch_pdf, provider_url)
+        quality, error = _fetch_quality(quality_url)
+        provider = profile_job.result()
+    else:
+        if include_profile:
+            provider = scraper.fetch_pdf(provider_url)
+        quality, error = _fetch_quality(quality_url)
+
+    # Re-read the link when the profile just downloaded differs from the
+    # indexed one (a link may have been added or moved), or the link failed
+    changed = provider is not None and hashlib.sha1(provider).hexdigest() != entry["profileSha1"]
+    if changed or (quality is None and quality_url):
+        provider_for_index = provider if provider is not None else scraper.fetch_pdf(provider_url)
+        fresh_url = index_pdf(provider_url, provider_for_index)
+        if fresh_url != quality_url:
+            quality_url = fresh_url
+            quality, error = _fetch_quality(fresh_url)
+    return {"provider": provider, "qualityUrl": quality_url, "quality": quality, "error": error}
+
+
+# -----------------------------------------------------------------------------
+# Crawl
+# -----------------------------------------------------------------------------
+
+
+def _on_providers_loaded(town: str, providers: list, unchanged: bool = False, **_: Any) -> None:
+    import jobs
+
+    if unchanged:
+        return  # its providers were queued when this roster was first parsed
+    urls = unindexed(p["url"] for p in providers)
+    if urls:
+        jobs.submit(jobs.KIND_QUALITY, urls, jobs.PRIORITY_BACKGROUND)
+        logger.info("Queued quality URL indexing of %d providers in %s", len(urls), town)
+
+
+def register() -> None:
+    """Index the providers of every roster the crawl loads, in the background."""
+    events.subscribe("providers.loaded", _on_providers_loaded)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="quality_index", description="Provider quality report URL index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Index every DDS provider statewide")
+    build_cmd.add_argument("--force", action="store_true", help="Re-index fresh entries too")
+    show = sub.add_parser("show", help="Print the entry for a provider profile URL")
+    show.add_argument("url")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "build":
+        print(json.dumps(build(args.force), indent=2))
+    elif args.command == "show":
+        print(json.dumps(lookup(args.url), indent=2))
+
+
+if __name__ == "__main__":
+    main()
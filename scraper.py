@@ -1,16 +1,24 @@
 from __future__ import annotations
 
+import hashlib
 import io
+import itertools
 import logging
 import re
+import sys
 import time
-from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 
-import pdfplumber
 import requests
-from bs4 import BeautifulSoup
+
+import events
+import negcache
+import timing
+import upstream
+from metrics import CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES, PDF_PARSE_SECONDS, STALE_SERVED
+from startup import lazy_import
 
 # Configure module logger
 logger = logging.getLogger(__name__)
@@ -31,32 +39,132 @@ HEADINGS = {
 }
 
 
+# Every cache load gets a new version so HTTP responses built from a value
+# can be memoized and validated (ETag) per version; see httpcache.
+_VERSIONS = itertools.count(1)
+
+
 @dataclass
 class CacheEntry:
     value: object
     expires_at: float
+    loaded_at: float = field(default_factory=time.time)
+    version: int = field(default_factory=lambda: next(_VERSIONS))
 
 
 _CACHE: Dict[str, CacheEntry] = {}
 
 
+def cache_info(key: str) -> Optional[Tuple[int, float, float]]:
+    """(version, loaded_at, expires_at) of an unexpired cache entry, else None."""
+    entry = _CACHE.get(key)
+    if entry is None or entry.expires_at <= time.time():
+        return None
+    return entry.version, entry.loaded_at, entry.expires_at
+
+
+class ProviderRecord:
+    """
+    Compact provider entry held in the town and statewide caches.
+
+    Reads like the {"name", "url", "town"} dicts callers already use (item
+    access, .get, dict(record)) but is slotted, and shares the town name and
+    the URL directory prefix between records as interned strings. A provider
+    listed in several towns keeps one copy of its name and URL tail.
+    """
+
+    __slots__ = ("name", "town", "_url_prefix", "_url_tail")
+
+    _KEYS = ("name", "url", "town")
+
+    def __init__(self, name: str, url: str, town: str) -> None:
+        cut = url.rfind("/") + 1
+        self.name = sys.intern(name)
+        self.town = sys.intern(town)
+        self._url_prefix = sys.intern(url[:cut])
+        self._url_tail = sys.intern(url[cut:])
+
+    @property
+    def url(self) -> str:
+        return self._url_prefix + self._url_tail
+
+    def keys(self) -> tuple:
+        return self._KEYS
+
+    def __getitem__(self, key: str) -> str:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self[key] if key in self._KEYS else default
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ProviderRecord):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.name, self._url_tail, self.town))
+
+    def __repr__(self) -> str:
+        return f"ProviderRecord(name={self.name!r}, url={self.url!r}, town={self.town!r})"
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"name": self.name, "url": self.url, "town": self.town}
+
+
+# Lookups that found nothing; see negcache.
+NEGATIVE_CACHE = negcache.NegativeCache(
+    {
+        "town": 15 * 60,  # 15 minutes - a new town only appears when the towns page changes
+        "quality": 60 * 60,  # 1 hour - same PDF bytes always parse the same way
+    },
+    separator="::",
+)
+
+
+def _namespace(key: str) -> str:
+    """Metrics namespace of a cache key: "providers::hartford" -> "providers"."""
+    return key.split("::", 1)[0]
+
+
 def _cached(key: str, ttl_seconds: int, loader: Callable[[], object]) -> object:
     now = time.time()
+    namespace = _namespace(key)
     entry = _CACHE.get(key)
     if entry and entry.expires_at > now:
+        CACHE_HITS.inc(namespace=namespace)
+        timing.record_cache(True)
+        return entry.value
+    CACHE_MISSES.inc(namespace=namespace)
+    timing.record_cache(False)
+    if entry:
+        CACHE_EVICTIONS.inc(namespace=namespace)
+    try:
+        value = loader()
+    except Exception as e:
+        if entry is None or entry.expires_at + upstream.STALE_IF_ERROR <= now:
+            raise
+        logger.warning("Reloading %s failed (%s); serving value from %.0fs ago", key, e, now - entry.loaded_at)
+        STALE_SERVED.inc(namespace=namespace)
+        timing.record_stale()
         return entry.value
-    value = loader()
     _CACHE[key] = CacheEntry(value=value, expires_at=now + ttl_seconds)
     return value
 
 
-def _http_get(url: str) -> bytes:
+def _http_get(url: str, hedge: bool = False) -> bytes:
     logger.debug("Fetching URL: %s", url)
     try:
-        resp = requests.get(
+        resp = upstream.get(
             url,
             headers={"User-Agent": "DDSScraper/1.0 (+https://portal.ct.gov)"},
             timeout=30,
+            hedge=hedge,
         )
         resp.raise_for_status()
         logger.debug("Successfully fetched %s (%d bytes)", url, len(resp.content))
@@ -74,7 +182,7 @@ def get_towns() -> List[Dict[str, str]]:
     def loader() -> List[Dict[str, str]]:
         logger.info("Fetching towns list from DDS portal")
         html = _http_get(BASE_URL).decode("utf-8", errors="ignore")
-        soup = BeautifulSoup(html, "html.parser")
+        soup = lazy_import("bs4").BeautifulSoup(html, "html.parser")
         towns = []
         for a in soup.find_all("a"):
             href = (a.get("href") or "").strip()
@@ -95,14 +203,23 @@ def get_towns() -> List[Dict[str, str]]:
     return _cached("towns", 24 * 60 * 60, loader)  # 24 hours
 
 
-def get_town_pdf_url(town: str) -> Optional[str]:
+def _find_town(town: str) -> Optional[Dict[str, str]]:
     town_key = _normalize_town(town)
+    negative_key = f"town::{town_key}"
+    if NEGATIVE_CACHE.hit(negative_key):
+        return None
     for item in get_towns():
         if _normalize_town(item["name"]) == town_key:
-            return item["pdf_url"]
+            return item
+    NEGATIVE_CACHE.add(negative_key, "town")
     return None
 
 
+def get_town_pdf_url(town: str) -> Optional[str]:
+    item = _find_town(town)
+    return item["pdf_url"] if item else None
+
+
 def _is_allowed_pdf(url: str) -> bool:
     if not url:
         return False
@@ -162,9 +279,14 @@ def _infer_name_from_url(url: str) -> str:
     return name.strip().title() if name else "provider"
 
 
+# Part of the stored roster digest: bump when parsing changes so unchanged
+# PDFs are parsed again rather than served from the change feed's roster.
+TOWN_PARSE_VERSION = 1
+
+
 def parse_providers_from_town_pdf(pdf_bytes: bytes, town_name: str) -> List[Dict[str, str]]:
     lines: List[str] = []
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+    with lazy_import("pdfplumber").open(io.BytesIO(pdf_bytes)) as pdf:
         for page in pdf.pages:
             text = page.extract_text() or ""
             for raw in text.splitlines():
@@ -207,19 +329,36 @@ def parse_providers_from_town_pdf(pdf_bytes: bytes, town_name: str) -> List[Dict
     return providers
 
 
-def get_providers_for_town(town: str) -> List[Dict[str, str]]:
+def providers_cache_key(town: str) -> str:
+    """Cache key of a town's roster (see `cache_info`)."""
+    return f"providers::{_normalize_town(town)}"
+
+
+def get_providers_for_town(town: str) -> List[ProviderRecord]:
     logger.info("Getting providers for town: %s", town)
-    pdf_url = get_town_pdf_url(town)
-    if not pdf_url:
+    town_item = _find_town(town)
+    if not town_item:
         logger.warning("No PDF URL found for town: %s", town)
         return []
-
-    cache_key = f"providers::{_normalize_town(town)}"
-
-    def loader() -> List[Dict[str, str]]:
-        pdf_bytes = _http_get(pdf_url)
-        providers = parse_providers_from_town_pdf(pdf_bytes, town)
-        logger.info("Parsed %d providers for town: %s", len(providers), town)
+    pdf_url = town_item["pdf_url"]
+
+    cache_key = providers_cache_key(town)
+
+    def loader() -> List[ProviderRecord]:
+        pdf_bytes = _http_get(pdf_url, hedge=True)
+        digest = f"{hashlib.sha1(pdf_bytes).hexdigest()}:v{TOWN_PARSE_VERSION}"
+        parsed = events.ask("roster.unchanged", town=town_item["name"], digest=digest)
+        unchanged = parsed is not None
+        if unchanged:
+            logger.info("Town PDF unchanged, reusing stored roster for: %s", town)
+        else:
+            with PDF_PARSE_SECONDS.time(doc_type="town"), timing.span("parse-town"):
+                parsed = parse_providers_from_town_pdf(pdf_bytes, town)
+            logger.info("Parsed %d providers for town: %s", len(parsed), town)
+        providers = [ProviderRecord(p["name"], p["url"], town_item["name"]) for p in parsed]
+        events.publish(
+            "providers.loaded", town=town_item["name"], providers=providers, digest=digest, unchanged=unchanged
+        )
         return providers
 
     return _cached(cache_key, 6 * 60 * 60, loader)  # 6 hours
@@ -230,7 +369,7 @@ def fetch_pdf(url: str) -> bytes:
         logger.warning("Blocked PDF fetch attempt for disallowed URL: %s", url)
         raise ValueError("URL not allowed")
     logger.info("Fetching PDF from: %s", url)
-    return _http_get(url)
+    return _http_get(url, hedge=True)
 
 
 def extract_quality_profile_url(provider_pdf_bytes: bytes) -> Optional[str]:
@@ -245,10 +384,33 @@ def extract_quality_profile_url(provider_pdf_bytes: bytes) -> Optional[str]:
     Returns:
         Quality profile URL if found, None otherwise
     """
+    digest = hashlib.sha1(provider_pdf_bytes).hexdigest()
+    cache_key = f"quality::{digest}"
+    if NEGATIVE_CACHE.hit(cache_key):
+        logger.debug("Negative cache hit for quality URL: %s", digest)
+        return None
+    entry = _CACHE.get(cache_key)
+    if entry and entry.expires_at > time.time():
+        CACHE_HITS.inc(namespace="quality")
+        timing.record_cache(True)
+        return entry.value
+    CACHE_MISSES.inc(namespace="quality")
+    timing.record_cache(False)
+
+    with PDF_PARSE_SECONDS.time(doc_type="provider"), timing.span("parse-provider"):
+        url = _parse_quality_profile_url(provider_pdf_bytes)
+    if url:
+        _CACHE[cache_key] = CacheEntry(value=url, expires_at=time.time() + 24 * 60 * 60)
+    else:
+        NEGATIVE_CACHE.add(cache_key, "quality")
+    return url
+
+
+def _parse_quality_profile_url(provider_pdf_bytes: bytes) -> Optional[str]:
     logger.debug("Extracting quality profile URL from provider PDF")
 
     try:
-        with pdfplumber.open(io.BytesIO(provider_pdf_bytes)) as pdf:
+        with lazy_import("pdfplumber").open(io.BytesIO(provider_pdf_bytes)) as pdf:
             # Check all pages, but quality link is usually on the last page
             for page in reversed(pdf.pages):
                 text = page.extract_text() or ""
@@ -275,29 +437,25 @@ def extract_quality_profile_url(provider_pdf_bytes: bytes) -> Optional[str]:
     return None
 
 
-def get_all_providers_flat() -> List[Dict[str, str]]:
+def get_all_providers_flat() -> List[ProviderRecord]:
     """
     Get all DDS providers from all towns as a flat list.
 
-    Cached for 6 hours to avoid repeated slow fetches.
+    Cached for 6 hours to avoid repeated slow fetches. The records are the
+    same objects held in each town's cache, so the flat list costs one
+    pointer per provider.
 
     Returns:
         List of all providers with name, url, and town fields
     """
-    def loader() -> List[Dict[str, str]]:
+    def loader() -> List[ProviderRecord]:
         logger.info("Building flat list of all DDS providers (this may take a while...)")
-        all_providers = []
+        all_providers: List[ProviderRecord] = []
 
         towns = get_towns()
         for i, town in enumerate(towns):
             logger.debug("Processing town %d/%d: %s", i + 1, len(towns), town["name"])
-            providers = get_providers_for_town(town["name"])
-            for provider in providers:
-                all_providers.append({
-                    "name": provider["name"],
-                    "url": provider["url"],
-                    "town": town["name"],
-                })
+            all_providers.extend(get_providers_for_town(town["name"]))
 
         logger.info("Total providers across all towns: %d", len(all_providers))
         return all_providers
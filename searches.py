@@ -0,0 +1,199 @@
+"""
+Progressive Unified Search
+
+The blocking unified search answers only after every ProPublica hit has
+been matched to a DDS provider, and matching an organization the join
+table does not know yet means loading (possibly parsing) its city's town
+PDF. `start` instead returns the ProPublica hits at once: providers the
+`matches` table already knows are filled in, and the rest are matched in
+the background, one task per city, under a search token.
+
+Clients then collect the outstanding matches with `updates` (polling) or
+`stream_events` (server-sent events, resumable with Last-Event-ID). Each
+update is `{"seq", "ein", "dds_provider"}`; `dds_provider` is None when
+the city has no matching provider. A search is done when every city has
+been matched.
+
+Searches live in memory for SEARCH_TTL seconds (at most MAX_SEARCHES),
+which is fine for the single web process this runs as.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import matches
+import propublica
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TTL = 10 * 60
+MAX_SEARCHES = 500
+MATCH_WORKERS = 4
+STREAM_POLL_INTERVAL = 0.25  # seconds between checks for new updates
+STREAM_MAX_SECONDS = 120
+
+
+class _Search:
+    def __init__(self, token: str, query: str, state: str, pending: Dict[str, List[Any]]) -> None:
+        self.token = token
+        self.query = query
+        self.state = state
+        self.created = time.time()
+        self.pending = pending  # city -> orgs still to match
+        self.updates: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return not self.pending
+
+    def add(self, city: str, found: Dict[str, Optional[Dict[str, str]]]) -> None:
+        with self._lock:
+            for ein, provider in found.items():
+                self.updates.append({"seq": len(self.updates) + 1, "ein": ein, "dds_provider": provider})
+            self.pending.pop(city, None)
+
+    def since(self, after: int) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "search_token": self.token,
+                "updates": self.updates[after:],
+                "cursor": len(self.updates),
+                "pending": [org.ein for orgs in self.pending.values() for org in orgs],
+                "done": self.done,
+            }
+
+
+_SEARCHES: "OrderedDict[str, _Search]" = OrderedDict()
+_searches_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _searches_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MATCH_WORKERS, thread_name_prefix="search-match")
+    return _pool
+
+
+def _remember(search: _Search) -> None:
+    now = time.time()
+    with _searches_lock:
+        _SEARCHES[search.token] = search
+        while _SEARCHES:
+            oldest = next(iter(_SEARCHES.values()))
+            if len(_SEARCHES) <= MAX_SEARCHES and oldest.created > now - SEARCH_TTL:
+                break
+            _SEARCHES.popitem(last=False)
+
+
+def _match_city(search: _Search, city: str) -> None:
+    found: Dict[str, Optional[Dict[str, str]]] = {}
+    for org in search.pending.get(city, []):
+        try:
+            found[org.ein] = matches.provider_for_org(org.ein, org.name, city)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("DDS matching for %s in %s failed: %s", org.ein, city, e)
+            found[org.ein] = None
+    search.add(city, found)
+
+
+def result_row(org: propublica.NonprofitSearchResult) -> Dict[str, Any]:
+    """A unified search result for a ProPublica hit, before DDS matching."""
+    return {
+        "ein": org.ein,
+        "name": org.name,
+        "city": org.city,
+        "state": org.state,
+        "ntee_code": org.ntee_code,
+        "propublica_url": f"https://projects.propublica.org/nonprofits/organizations/{org.ein}",
+        "dds_provider": None,
+        "has_form990": True,
+    }
+
+
+def start(query: str, state: str = "CT") -> Dict[str, Any]:
+    """
+    Search ProPublica and return its hits now; match the rest in the background.
+
+    Returns:
+        The unified search response (`results`, `query`, `state`) plus
+        `search_token`, `pending` (EINs whose DDS match will arrive as an
+        update) and `done`.
+    """
+    results = []
+    pending: Dict[str, List[Any]] = {}
+    for org in propublica.search_nonprofits(query, state):
+        row = result_row(org)
+        try:
+            row["dds_provider"] = matches.stored_provider(org.ein)
+        except Exception as e:  # noqa: BLE001
+            logger.debug("DDS lookup failed for %s: %s", org.ein, e)
+        if row["dds_provider"] is None and org.city:
+            pending.setdefault(org.city, []).append(org)
+        results.append(row)
+
+    search = _Search(uuid.uuid4().hex, query, state, pending)
+    _remember(search)
+    for city in list(pending):
+        _executor().submit(_match_city, search, city)
+    logger.info(
+        "Progressive search %s: %d results, %d to match in %d cities",
+        search.token[:8], len(results), sum(len(orgs) for orgs in pending.values()), len(pending),
+    )
+    return {"results": results, "query": query, "state": state, **search.since(0)}
+
+
+def updates(token: str, after: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    DDS matches that arrived after cursor `after` for a search token.
+
+    Returns:
+        Dict with `updates`, the next `cursor`, still-`pending` EINs and
+        `done`; None for an unknown or expired token.
+    """
+    search = _SEARCHES.get(token)
+    if search is None or search.created <= time.time() - SEARCH_TTL:
+        return None
+    return search.since(max(0, after))
+
+
+def _sse(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_events(token: str, after: int = 0) -> AsyncIterator[str]:
+    """
+    Server-sent events for a search: one `match` event per update (its id
+    is the update's seq), then `done`, or `expired` for an unknown token.
+
+    Runs on the event loop and only reads memory, so an open stream holds
+    no worker thread.
+    """
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while True:
+        found = updates(token, after)
+        if found is None:
+            yield _sse("expired", {"search_token": token})
+            return
+        for update in found["updates"]:
+            yield _sse("match", update, update["seq"])
+        after = found["cursor"]
+        if found["done"]:
+            yield _sse("done", {"search_token": token, "cursor": after})
+            return
+        if time.monotonic() > deadline:
+            return  # the client reconnects with Last-Event-ID
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
@@ -0,0 +1,146 @@
+"""
+Startup Instrumentation and Readiness
+
+Heavy optional dependencies (pdfplumber/pdfminer/PIL, BeautifulSoup,
+numpy) are imported through `lazy_import` on the code paths that need
+them, so the app can answer `/api/health` before they are loaded. Each
+lazy import is timed. Readiness (`/api/ready`) is tracked separately from
+liveness and turns green once the optional cache warm-up has finished.
+
+Import-time breakdown of the eager part: `python -X importtime -c "import main"`
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODULE_LOADED_AT = time.time()
+
+_import_lock = threading.Lock()
+_IMPORT_TIMES: Dict[str, float] = {}  # module -> milliseconds
+_LOADED: set = set()  # modules whose import has completed
+
+
+def _process_start_time() -> float:
+    """Wall-clock time the process started (Linux), else when this module loaded."""
+    try:
+        with open("/proc/self/stat", "rb") as fh:
+            # Field 22 (starttime) follows the parenthesised command name
+            fields = fh.read().rsplit(b")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/stat", "rb") as fh:
+            boot_time = next(int(line.split()[1]) for line in fh if line.startswith(b"btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return MODULE_LOADED_AT
+
+
+PROCESS_STARTED_AT = _process_start_time()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import a module on first use and record how long it took.
+
+    Returns the already-loaded module on later calls at dict-lookup cost.
+    """
+    if name in _LOADED:
+        return sys.modules[name]
+    with _import_lock:
+        # A module can be in sys.modules while another thread is still
+        # executing it; import_module waits for that import to finish.
+        already_imported = name in sys.modules
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        if not already_imported:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _IMPORT_TIMES[name] = round(elapsed_ms, 1)
+            logger.info("Lazy-loaded %s in %.0f ms", name, elapsed_ms)
+        _LOADED.add(name)
+        return module
+
+
+def import_times() -> Dict[str, float]:
+    """Milliseconds spent in each lazy import so far."""
+    return dict(_IMPORT_TIMES)
+
+
+class Readiness:
+    """Tracks the optional warm-up that gates `/api/ready`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.status = "starting"
+        self.app_started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def app_started(self) -> None:
+        """Record the moment the ASGI app began serving (health goes green)."""
+        self.app_started_at = time.time()
+        logger.info(
+            "App serving %.0f ms after process start",
+            (self.app_started_at - PROCESS_STARTED_AT) * 1000,
+        )
+
+    def warm_up(self, steps: List[Tuple[str, Callable[[], Any]]]) -> None:
+        """
+        Run warm-up steps on a background thread, then mark ready.
+
+        A failing step is recorded but doesn't block readiness - the app
+        can still serve (cold) requests.
+        """
+        if not steps:
+            self._mark_ready()
+            return
+
+        def run() -> None:
+            with self._lock:
+                self.status = "warming"
+            for name, step in steps:
+                start = time.perf_counter()
+                try:
+                    step()
+                    outcome: Dict[str, Any] = {"ok": True}
+                except Exception as e:  # noqa: BLE001
+                    logger.warning("Warm-up step %s failed: %s", name, str(e))
+                    outcome = {"ok": False, "error": str(e)}
+                outcome["ms"] = round((time.perf_counter() - start) * 1000, 1)
+                self.steps[name] = outcome
+            self._mark_ready()
+
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+    def _mark_ready(self) -> None:
+        with self._lock:
+            self.status = "ready"
+            self.ready_at = time.time()
+        logger.info("Ready %.0f ms after process start", (self.ready_at - PROCESS_STARTED_AT) * 1000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def since_start(ts: Optional[float]) -> Optional[float]:
+            return round((ts - PROCESS_STARTED_AT) * 1000, 1) if ts else None
+
+        return {
+            "status": self.status,
+            "servingAfterMs": since_start(self.app_started_at),
+            "readyAfterMs": since_start(self.ready_at),
+            "warmup": self.steps,
+            "lazyImportsMs": import_times(),
+        }
+
+
+readiness = Readiness()
@@ -0,0 +1,188 @@
+"""
+Precompressed, Fingerprinted Static Assets
+
+`load` reads the static directory once at startup and, for each file,
+keeps the raw bytes plus gzip (and brotli, when the optional `brotli`
+package is installed) encodings compressed at the highest level, since
+that cost is paid once per process rather than per request.
+
+Every asset except HTML is also published under a fingerprinted name
+(`app.js` -> `app.<hash>.js`) served with `Cache-Control: immutable` and
+a one-year max-age; `/static/...` references in HTML are rewritten to
+those names. HTML (including `/`) is served `no-cache` with an ETag, so a
+repeat page load over a slow link costs one small conditional request
+answered 304, and a deploy is picked up on the next load. Each encoding
+of an asset has its own ETag (`"<hash>-gz"`, `"<hash>-br"`), and the
+Last-Modified of HTML is that of the newest file it references.
+
+Plain asset names keep working (revalidated like HTML), as do
+fingerprints from a previous deploy, which map to the current content so
+a page loaded just before a restart can still fetch its assets.
+
+Changes to the static directory need a restart.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+import threading
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+import httpcache
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+FINGERPRINT_LEN = 12
+COMPRESS_MIN_BYTES = 256
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+_HTML_REF_RE = re.compile(r"""(?P<prefix>(?:src|href)\s*=\s*["'])/static/(?P<name>[^"'?#]+)""")
+_FINGERPRINTED_RE = re.compile(r"^(?P<stem>.+)\.[0-9a-f]{%d}(?P<suffix>\.[^./]+)$" % FINGERPRINT_LEN)
+
+
+@dataclass
+class _Asset:
+    name: str  # path relative to the static directory
+    media_type: str
+    etag: str
+    last_modified: float
+    raw: bytes
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+    fingerprinted: Optional[str] = None
+
+
+_ASSETS: Dict[str, _Asset] = {}  # plain name -> asset
+_FINGERPRINTS: Dict[str, _Asset] = {}  # fingerprinted name -> asset
+_load_lock = threading.Lock()
+
+
+def _media_type(name: str) -> str:
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def _build(name: str, raw: bytes, mtime: float) -> _Asset:
+    media_type = _media_type(name)
+    asset = _Asset(name, media_type, f'"{hashlib.sha1(raw).hexdigest()[:24]}"', mtime, raw)
+    if len(raw) >= COMPRESS_MIN_BYTES and media_type.startswith(COMPRESSIBLE):
+        asset.gzip = gzip.compress(raw, compresslevel=9, mtime=0)
+        if httpcache.brotli is not None:
+            asset.br = httpcache.brotli.compress(raw, quality=11)
+    return asset
+
+
+def _fingerprint(name: str, raw: bytes) -> str:
+    path = Path(name)
+    digest = hashlib.sha1(raw).hexdigest()[:FINGERPRINT_LEN]
+    return path.with_name(f"{path.stem}.{digest}{path.suffix}").as_posix()
+
+
+def load(directory: Path) -> None:
+    """(Re)build the in-memory asset table from `directory`."""
+    files = {
+        p.relative_to(directory).as_posix(): p
+        for p in sorted(directory.rglob("*"))
+        if p.is_file() and not any(part.startswith(".") for part in p.relative_to(directory).parts)
+    }
+    assets: Dict[str, _Asset] = {}
+    fingerprints: Dict[str, _Asset] = {}
+    for name, path in files.items():
+        if path.suffix == ".html":
+            continue
+        raw = path.read_bytes()
+        asset = _build(name, raw, path.stat().st_mtime)
+        asset.fingerprinted = _fingerprint(name, raw)
+        assets[name] = fingerprints[asset.fingerprinted] = asset
+
+    for name, path in files.items():
+        if path.suffix != ".html":
+            continue
+        # The rewritten page changes whenever a file it references does
+        mtimes = [path.stat().st_mtime]
+
+        def rewrite(match: re.Match) -> str:
+            asset = assets.get(match["name"])
+            if asset is None:
+                return match[0]
+            mtimes.append(asset.last_modified)
+            return f"{match['prefix']}/static/{asset.fingerprinted}"
+
+        html = _HTML_REF_RE.sub(rewrite, path.read_text(encoding="utf-8"))
+        assets[name] = _build(name, html.encode("utf-8"), max(mtimes))
+
+    with _load_lock:
+        _ASSETS.clear()
+        _ASSETS.update(assets)
+        _FINGERPRINTS.clear()
+        _FINGERPRINTS.update(fingerprints)
+    logger.info(
+        "Loaded %d static assets (%d bytes, %d gzipped)",
+        len(assets), sum(len(a.raw) for a in assets.values()),
+        sum(len(a.gzip or a.raw) for a in assets.values()),
+    )
+
+
+def _not_modified(request: Request, asset: _Asset, etag: str) -> bool:
+    if request.headers.get("if-none-match"):
+        return httpcache._etag_matches(request, etag)
+    since = request.headers.get("if-modified-since")
+    if not since:
+        return False
+    try:
+        return int(asset.last_modified) <= parsedate_to_datetime(since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def respond(request: Request, name: str) -> Optional[Response]:
+    """
+    Serve a static asset by plain or fingerprinted name.
+
+    Returns:
+        A 200 (possibly compressed) or 304 response; None for an unknown
+        asset.
+    """
+    cache_control = IMMUTABLE
+    asset = _FINGERPRINTS.get(name)
+    if asset is None:
+        cache_control = REVALIDATE
+        asset = _ASSETS.get(name)
+        if asset is None and (old := _FINGERPRINTED_RE.match(name)):
+            asset = _ASSETS.get(f"{old['stem']}{old['suffix']}")
+    if asset is None:
+        return None
+
+    # Strong ETags must differ per content-coding, so each body gets a suffix
+    content, encoding, etag = asset.raw, None, asset.etag
+    accepted = httpcache._accepted_encodings(request)
+    if asset.br is not None and "br" in accepted:
+        content, encoding, etag = asset.br, "br", f'{asset.etag[:-1]}-br"'
+    elif asset.gzip is not None and "gzip" in accepted:
+        content, encoding, etag = asset.gzip, "gzip", f'{asset.etag[:-1]}-gz"'
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Last-Modified": formatdate(asset.last_modified, usegmt=True),
+    }
+    if asset.gzip is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if _not_modified(request, asset, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type=asset.media_type, headers=headers)
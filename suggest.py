@@ -0,0 +1,210 @@
+"""
+Typeahead Suggestions
+
+SQLite FTS5 index over the nonprofits we have seen (ProPublica searches,
+org lookups, the bulk IRS import) and every DDS provider parsed from the
+town PDFs. The index is fed by `events` as the scraper and ProPublica
+caches refresh, so `/api/suggest` never has to leave the process.
+
+Usage:
+    python -m suggest rebuild            # index everything in the local store
+    python -m suggest rebuild --crawl    # ...and crawl every DDS town first
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+import events
+import localstore
+
+logger = logging.getLogger(__name__)
+
+KIND_NONPROFIT = "nonprofit"
+KIND_DDS = "dds"
+
+MAX_SUGGESTIONS = 25
+
+# External-content FTS table kept in sync with suggest_entries by triggers,
+# so entries can be replaced by (kind, key) without scanning the index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suggest_entries (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    city TEXT,
+    url TEXT,
+    UNIQUE (kind, key)
+);
+CREATE INDEX IF NOT EXISTS suggest_entries_city ON suggest_entries (kind, city);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS suggest_fts USING fts5(
+    name, city,
+    content = 'suggest_entries', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4'
+);
+
+CREATE TRIGGER IF NOT EXISTS suggest_entries_ai AFTER INSERT ON suggest_entries BEGIN
+    INSERT INTO suggest_fts (rowid, name, city) VALUES (new.id, new.name, new.city);
+END;
+CREATE TRIGGER IF NOT EXISTS suggest_entries_ad AFTER DELETE ON suggest_entries BEGIN
+    INSERT INTO suggest_fts (suggest_fts, rowid, name, city) VALUES ('delete', old.id, old.name, old.city);
+END;
+CREATE TRIGGER IF NOT EXISTS suggest_entries_au AFTER UPDATE ON suggest_entries BEGIN
+    INSERT INTO suggest_fts (suggest_fts, rowid, name, city) VALUES ('delete', old.id, old.name, old.city);
+    INSERT INTO suggest_fts (rowid, name, city) VALUES (new.id, new.name, new.city);
+END;
+"""
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _connect():
+    conn = localstore.connect()
+    localstore.ensure_schema("suggest", SCHEMA)
+    return conn
+
+
+def index_nonprofits(orgs: Iterable[Dict[str, Any]]) -> int:
+    """Add or refresh nonprofits (dicts with ein, name, city) in the index."""
+    rows = [
+        (KIND_NONPROFIT, str(o["ein"]), o["name"], o.get("city") or "", None)
+        for o in orgs
+        if o.get("ein") and o.get("name")
+    ]
+    if not rows:
+        return 0
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO suggest_entries (kind, key, name, city, url) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET name = excluded.name, city = excluded.city
+            WHERE suggest_entries.name != excluded.name OR suggest_entries.city IS NOT excluded.city
+            """,
+            rows,
+        )
+    return len(rows)
+
+
+def index_town_providers(town: str, providers: List[Dict[str, str]]) -> int:
+    """Replace the indexed DDS roster for one town."""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM suggest_entries WHERE kind = ? AND city = ?", (KIND_DDS, town))
+        conn.executemany(
+            """
+            INSERT INTO suggest_entries (kind, key, name, city, url) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET name = excluded.name, city = excluded.city
+            """,
+            [(KIND_DDS, f"{town}|{p['url']}", p["name"], town, p["url"]) for p in providers],
+        )
+    return len(providers)
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 prefix query: 'march man' -> '"march"* "man"*'."""
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def suggest(query: str, limit: int = 10, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Ranked prefix matches on name and city.
+
+    Args:
+        query: Partial text as typed (every word is treated as a prefix)
+        limit: Maximum suggestions to return (capped at MAX_SUGGESTIONS)
+        kind: Restrict to KIND_NONPROFIT or KIND_DDS
+
+    Returns:
+        Suggestions, best first. Nonprofits carry `ein`; DDS providers `url`.
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+    # Name hits outrank city hits; shorter names win ties
+    sql = """
+        SELECT e.kind, e.key, e.name, e.city, e.url
+        FROM suggest_fts JOIN suggest_entries e ON e.id = suggest_fts.rowid
+        WHERE suggest_fts MATCH ? {kind_filter}
+        ORDER BY bm25(suggest_fts, 10.0, 1.0), length(e.name)
+        LIMIT ?
+    """.format(kind_filter="AND e.kind = ?" if kind else "")
+    # Over-fetch so a provider listed in many towns can be collapsed to its best hit
+    params: List[Any] = [expression] + ([kind] if kind else []) + [limit * 4]
+
+    suggestions: List[Dict[str, Any]] = []
+    seen = set()
+    for row in _connect().execute(sql, params):
+        identity = row["url"] or row["key"]
+        if identity in seen:
+            continue
+        seen.add(identity)
+        item: Dict[str, Any] = {"kind": row["kind"], "name": row["name"], "city": row["city"]}
+        if row["kind"] == KIND_NONPROFIT:
+            item["ein"] = row["key"]
+        else:
+            item["url"] = row["url"]
+        suggestions.append(item)
+        if len(suggestions) >= limit:
+            break
+    return suggestions
+
+
+def rebuild_from_localstore() -> int:
+    """Index every nonprofit already in the local store."""
+    conn = _connect()
+    total = 0
+    cursor = conn.execute("SELECT ein, name, city FROM nonprofits")
+    while True:
+        batch = cursor.fetchmany(5000)
+        if not batch:
+            break
+        total += index_nonprofits(dict(r) for r in batch)
+    logger.info("Indexed %d nonprofits from local store", total)
+    return total
+
+
+def _on_providers_loaded(town: str, providers: List[Dict[str, str]], unchanged: bool = False, **_: Any) -> None:
+    if not unchanged:  # an unchanged roster is already indexed
+        index_town_providers(town, providers)
+
+
+def _on_nonprofits_seen(orgs: List[Dict[str, Any]]) -> None:
+    index_nonprofits(orgs)
+
+
+def register() -> None:
+    """Keep the index current as scraper and ProPublica caches refresh."""
+    events.subscribe("providers.loaded", _on_providers_loaded)
+    events.subscribe("nonprofits.seen", _on_nonprofits_seen)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="suggest", description="Typeahead index maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Index the local store (and optionally all DDS towns)")
+    rebuild.add_argument("--crawl", action="store_true", help="Also crawl every DDS town PDF")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "rebuild":
+        rebuild_from_localstore()
+        if args.crawl:
+            import scraper
+
+            register()
+            scraper.get_all_providers_flat()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Per-Request Timing Spans
+
+`span(name)` times a stage of the current API request (rate limiter wait,
+upstream download, PDF parse, base64 encoding, ...). `TimingMiddleware`
+collects the spans of each request and returns them in a `Server-Timing`
+header, which browser dev tools display next to the request.
+
+Admins can also ask for a sampled profile of a single request by sending
+`X-Profile: 1` with a valid `X-Admin-Token`; the response then carries an
+`X-Profile-Id` to fetch from `/api/admin/profiles/{id}`.
+
+`record_cache(hit)` notes each cache lookup made while handling the
+request; the middleware summarizes them in an `X-Cache-Status` header
+(HIT, MISS or PARTIAL) so load tests can report hit ratios per endpoint.
+`record_stale()` marks a response built from an expired cache value served
+because the upstream failed: it gets `X-Cache-Status: STALE` and a
+`Warning: 110` header.
+
+Outside a request (CLI, background threads started without a copied
+context), `span` and `record_cache` are no-ops.
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import admin
+
+PROFILE_INTERVAL = 0.002  # seconds between stack samples
+PROFILE_MAX_SAMPLES = 20_000
+PROFILES_KEPT = 20
+PROFILE_TOP_N = 30
+
+_SPAN_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class RequestTimings:
+    """Aggregated span durations for one request (shared across its threads)."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: "OrderedDict[str, List[float]]" = OrderedDict()  # name -> [seconds, count]
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stale = False
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def add_cache(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def cache_status(self) -> Optional[str]:
+        """STALE if any value was served stale, else HIT if every lookup hit, MISS if
+        none did, PARTIAL otherwise; None without lookups."""
+        if self.stale:
+            return "STALE"
+        if not self.cache_hits and not self.cache_misses:
+            return None
+        if not self.cache_misses:
+            return "HIT"
+        return "PARTIAL" if self.cache_hits else "MISS"
+
+    def header_value(self) -> str:
+        """Server-Timing value, e.g. `ratelimit;dur=412.0, parse-town;dur=88.1;desc="2x", total;dur=530.2`."""
+        parts = []
+        with self._lock:
+            items = list(self.spans.items())
+        for name, (seconds, count) in items:
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_CURRENT: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current() -> Optional[RequestTimings]:
+    """Timings of the request being handled, if any."""
+    return _CURRENT.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a stage of the current request; repeated names are summed."""
+    timings = _CURRENT.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(_SPAN_NAME_RE.sub("-", name), time.perf_counter() - start)
+
+
+def record_cache(hit: bool) -> None:
+    """Count a cache hit (including cached misses) or a load against the current request."""
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.add_cache(hit)
+
+
+def record_stale() -> None:
+    """Flag the current request as answered (in part) from an expired cache value."""
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.stale = True
+
+
+# -----------------------------------------------------------------------------
+# Sampling profiler
+# -----------------------------------------------------------------------------
+
+# Innermost frames in these files mean the thread is parked, not working
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "base_events.py")
+
+_PROFILES: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+class _Sampler:
+    """
+    Samples Python stacks of busy threads while one request runs.
+
+    Sync endpoints run on an arbitrary threadpool worker, so every thread
+    except the sampler and the event loop is sampled and parked threads
+    are skipped. Concurrent requests add noise; profile on a quiet
+    instance for clean results.
+    """
+
+    def __init__(self, loop_thread: int) -> None:
+        self.exclude = {loop_thread}
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        filename = code.co_filename.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(PROFILE_INTERVAL) and self.samples < PROFILE_MAX_SAMPLES:
+            for ident, frame in sys._current_frames().items():
+                if ident == me or ident in self.exclude:
+                    continue
+                if frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                self.samples += 1
+                self.self_counts[self._label(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    label = self._label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        self.total_counts[label] += 1
+                    frame = frame.f_back
+
+    def report(self, path: str, elapsed: float) -> Dict[str, Any]:
+        def top(counts: Counter) -> List[Dict[str, Any]]:
+            return [
+                {"function": label, "samples": n, "pct": round(100.0 * n / self.samples, 1)}
+                for label, n in counts.most_common(PROFILE_TOP_N)
+            ]
+
+        return {
+            "path": path,
+            "elapsedMs": round(elapsed * 1000, 1),
+            "intervalMs": PROFILE_INTERVAL * 1000,
+            "samples": self.samples,
+            "self": top(self.self_counts) if self.samples else [],
+            "cumulative": top(self.total_counts) if self.samples else [],
+        }
+
+
+def _store_profile(report: Dict[str, Any]) -> str:
+    profile_id = uuid.uuid4().hex[:12]
+    with _profiles_lock:
+        _PROFILES[profile_id] = report
+        while len(_PROFILES) > PROFILES_KEPT:
+            _PROFILES.popitem(last=False)
+    return profile_id
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    with _profiles_lock:
+        return _PROFILES.get(profile_id)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TimingMiddleware:
+    """ASGI middleware adding Server-Timing, X-Cache-Status and optional profiling to responses."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _CURRENT.set(timings)
+        sampler: Optional[_Sampler] = None
+        profile_id: Optional[str] = None
+        if _header(scope, b"x-profile") == "1" and admin.is_admin_token(_header(scope, b"x-admin-token")):
+            sampler = _Sampler(loop_thread=threading.get_ident())
+            sampler.start()
+            # Reserve the id now so it can go out with the response headers
+            profile_id = _store_profile({"path": scope.get("path"), "status": "running"})
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header_value().encode("latin-1")))
+                cache_status = timings.cache_status()
+                if cache_status:
+                    headers.append((b"x-cache-status", cache_status.encode("latin-1")))
+                if timings.stale:
+                    headers.append((b"warning", b'110 - "Response is Stale"'))
+                if profile_id:
+                    headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _CURRENT.reset(token)
+            if sampler is not None and profile_id is not None:
+                sampler.stop()
+                report = sampler.report(scope.get("path", ""), time.perf_counter() - timings.started)
+                with _profiles_lock:
+                    if profile_id in _PROFILES:
+                        _PROFILES[profile_id] = report
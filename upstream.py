@@ -0,0 +1,426 @@
+"""
+Upstream HTTP Access
+
+Single place where `scraper` and `propublica` talk to portal.ct.gov and
+ProPublica, so per-host latency and status are recorded uniformly.
+
+UPSTREAM_MODE selects the transport:
+
+- `live` (default): plain HTTP.
+- `record`: live, and every response is also written to a cassette under
+  UPSTREAM_CASSETTE_DIR (default `data/cassettes`).
+- `replay`: responses come only from the cassettes, with no network at
+  all; a request without a cassette fails like a connection error.
+
+Cassettes are keyed by the full request URL (query included), one JSON
+metadata file and one body file per response, grouped by host. Streamed
+responses are copied to their cassette as the caller reads them.
+
+Live requests are guarded per host:
+
+- A circuit breaker opens after UPSTREAM_BREAKER_FAILURES consecutive
+  failures (errors, timeouts, 5xx) and fails further requests immediately
+  with `CircuitOpenError` for UPSTREAM_BREAKER_COOLDOWN seconds, after
+  which one trial request decides whether it closes again. Callers with a
+  cache serve their last good value meanwhile (see STALE_IF_ERROR).
+- Timeouts adapt to observed latency: once a host has enough successful
+  samples, the caller's timeout is lowered to TIMEOUT_FACTOR times its p95
+  latency (never below MIN_TIMEOUT).
+- `hedge=True` (idempotent PDF GETs) sends a second identical request if
+  the first has not answered within the host's p95 latency, and uses
+  whichever answers first. Off unless UPSTREAM_HEDGE=1. Rate-limited
+  callers pass `before_hedge` to take a slot for the extra request.
+
+Setting UPSTREAM_STUB_URL (e.g. `http://127.0.0.1:8765`) sends every live
+request to a local stub instead, with the original host as the first path
+segment: `https://portal.ct.gov/-/media/x.pdf` is fetched from
+`http://127.0.0.1:8765/portal.ct.gov/-/media/x.pdf`. The offline
+benchmarks (`python -m benchmarks.run`) use this to replay fixtures.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import timing
+from metrics import UPSTREAM_BREAKER_OPENED, UPSTREAM_HEDGES, UPSTREAM_SECONDS, UPSTREAM_SHORT_CIRCUITS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+MODE_LIVE = "live"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODE = os.environ.get("UPSTREAM_MODE", MODE_LIVE).strip().lower() or MODE_LIVE
+CASSETTE_DIR = Path(os.environ.get("UPSTREAM_CASSETTE_DIR", BASE_DIR / "data" / "cassettes"))
+
+STUB_URL = os.environ.get("UPSTREAM_STUB_URL", "")
+
+BREAKER_FAILURES = int(os.environ.get("UPSTREAM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("UPSTREAM_BREAKER_COOLDOWN", "30"))
+HEDGE_ENABLED = os.environ.get("UPSTREAM_HEDGE", "").strip().lower() in ("1", "true", "yes", "on")
+HEDGE_DEFAULT_DELAY = 2.0  # seconds, until a host has latency samples
+HEDGE_WORKERS = 8
+
+# How long past expiry a cached value may still be served when reloading it fails
+STALE_IF_ERROR = int(os.environ.get("UPSTREAM_STALE_IF_ERROR", str(7 * 24 * 60 * 60)))
+
+LATENCY_SAMPLES = 200  # recent successful request latencies kept per host
+MIN_SAMPLES = 20  # before timeouts adapt / hedges use the observed p95
+TIMEOUT_FACTOR = 4.0
+MIN_TIMEOUT = 5.0
+
+if MODE not in {MODE_LIVE, MODE_RECORD, MODE_REPLAY}:
+    raise ValueError(f"UPSTREAM_MODE must be live, record or replay, not {MODE!r}")
+
+
+def _stub_url(url: str) -> str:
+    parsed = urlparse(url)
+    stubbed = f"{STUB_URL.rstrip('/')}/{parsed.netloc}{parsed.path}"
+    return f"{stubbed}?{parsed.query}" if parsed.query else stubbed
+
+
+# -----------------------------------------------------------------------------
+# Cassettes
+# -----------------------------------------------------------------------------
+
+
+def _cassette_path(full_url: str) -> Path:
+    host = urlparse(full_url).hostname or "unknown"
+    return CASSETTE_DIR / host / hashlib.sha256(full_url.encode("utf-8")).hexdigest()[:32]
+
+
+def _cassette_meta(full_url: str, resp: requests.Response) -> bytes:
+    meta = {
+        "url": full_url,
+        "status": resp.status_code,
+        "headers": {k: v for k, v in resp.headers.items() if k.lower() in {"content-type", "last-modified", "etag"}},
+        "recordedAt": time.time(),
+    }
+    return json.dumps(meta, indent=2).encode("utf-8")
+
+
+def _save_cassette(full_url: str, resp: requests.Response) -> None:
+    path = _cassette_path(full_url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Body first, metadata last: a cassette only counts once its .json exists
+    for suffix, data in ((".body", resp.content), (".json", _cassette_meta(full_url, resp))):
+        tmp = path.with_suffix(suffix + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path.with_suffix(suffix))
+
+
+def _tee_cassette(full_url: str, resp: requests.Response) -> None:
+    """
+    Record a streamed response as the caller reads it.
+
+    `resp.iter_content` is wrapped to copy each chunk to the cassette body,
+    so the download is never buffered in memory. The cassette is only
+    written out if the caller reads the body to the end.
+    """
+    path = _cassette_path(full_url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    iter_content = resp.iter_content
+
+    def tee(chunk_size: int = 1, decode_unicode: bool = False):
+        tmp = path.with_suffix(".body.tmp")
+        try:
+            body: Optional[BinaryIO] = tmp.open("wb")
+        except OSError as e:
+            logger.warning("Could not record cassette for %s: %s", full_url, e)
+            body = None
+
+        def stop_recording() -> None:
+            nonlocal body
+            if body is not None:
+                body.close()
+                body = None
+                tmp.unlink(missing_ok=True)
+
+        try:
+            for chunk in iter_content(chunk_size, decode_unicode):
+                if body is not None:
+                    try:
+                        body.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                    except OSError as e:
+                        logger.warning("Could not record cassette for %s: %s", full_url, e)
+                        stop_recording()
+                yield chunk
+        except BaseException:  # download error, or the caller stopped reading
+            stop_recording()
+            raise
+        if body is None:
+            return
+        body.close()
+        try:
+            # Body first, metadata last, as in _save_cassette
+            os.replace(tmp, path.with_suffix(".body"))
+            meta_tmp = path.with_suffix(".json.tmp")
+            meta_tmp.write_bytes(_cassette_meta(full_url, resp))
+            os.replace(meta_tmp, path.with_suffix(".json"))
+        except OSError as e:
+            logger.warning("Could not record cassette for %s: %s", full_url, e)
+
+    resp.iter_content = tee
+
+
+def _load_cassette(full_url: str) -> requests.Response:
+    path = _cassette_path(full_url)
+    try:
+        meta = json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+        body = path.with_suffix(".body").read_bytes()
+    except FileNotFoundError:
+        raise requests.ConnectionError(f"No cassette recorded for {full_url}") from None
+    resp = requests.Response()
+    resp.status_code = meta["status"]
+    resp.headers = CaseInsensitiveDict(meta.get("headers", {}))
+    resp._content = body
+    resp._content_consumed = True  # iter_content() then yields slices of body
+    resp.url = full_url
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    return resp
+
+
+# -----------------------------------------------------------------------------
+# Circuit breakers and latency
+# -----------------------------------------------------------------------------
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of contacting a host whose circuit breaker is open."""
+
+    def __init__(self, host: str, retry_after: float) -> None:
+        super().__init__(f"Circuit open for {host}; retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class _Breaker:
+    """Consecutive-failure circuit breaker for one host (closed -> open -> half-open)."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host: str) -> None:
+        self.host = host
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a request may go out now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + BREAKER_COOLDOWN - time.time()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN  # this request is the single trial
+                return
+        UPSTREAM_SHORT_CIRCUITS.inc(host=self.host)
+        raise CircuitOpenError(self.host, max(remaining, 1.0))
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                if self.state != self.CLOSED:
+                    logger.info("Circuit for %s closed", self.host)
+                self.state, self.failures = self.CLOSED, 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= BREAKER_FAILURES):
+                logger.warning("Circuit for %s opened after %d failures", self.host, self.failures)
+                UPSTREAM_BREAKER_OPENED.inc(host=self.host)
+                self.state, self.opened_at = self.OPEN, time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        opened_at = self.opened_at if self.state != self.CLOSED else None
+        return {"state": self.state, "failures": self.failures, "openedAt": opened_at}
+
+
+_BREAKERS: Dict[str, _Breaker] = {}
+_LATENCIES: Dict[str, Deque[float]] = {}
+_state_lock = threading.Lock()
+
+
+def _breaker(host: str) -> _Breaker:
+    breaker = _BREAKERS.get(host)
+    if breaker is None:
+        with _state_lock:
+            breaker = _BREAKERS.setdefault(host, _Breaker(host))
+    return breaker
+
+
+def _record_latency(host: str, seconds: float) -> None:
+    samples = _LATENCIES.get(host)
+    if samples is None:
+        with _state_lock:
+            samples = _LATENCIES.setdefault(host, deque(maxlen=LATENCY_SAMPLES))
+    samples.append(seconds)
+
+
+def _p95(host: str) -> Optional[float]:
+    samples = sorted(_LATENCIES.get(host, ()))
+    if len(samples) < MIN_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95) - 1]
+
+
+def _adaptive_timeout(host: str, requested: float) -> float:
+    p95 = _p95(host)
+    if p95 is None:
+        return requested
+    return min(requested, max(MIN_TIMEOUT, p95 * TIMEOUT_FACTOR))
+
+
+def host_states() -> Dict[str, Dict[str, Any]]:
+    """Breaker state, p95 latency and effective default timeout per host seen so far."""
+    states = {}
+    for host, breaker in list(_BREAKERS.items()):
+        p95 = _p95(host)
+        states[host] = {
+            **breaker.to_dict(),
+            "p95Ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "timeout": _adaptive_timeout(host, 30),
+        }
+    return states
+
+
+# -----------------------------------------------------------------------------
+# Requests
+# -----------------------------------------------------------------------------
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _timed_get(host: str, url: str, params, headers, timeout: float, stream: bool) -> requests.Response:
+    start = time.perf_counter()
+    try:
+        with timing.span(f"upstream-{host}"):
+            resp = requests.get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+    except requests.RequestException:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, host=host, status="error")
+        raise
+    elapsed = time.perf_counter() - start
+    UPSTREAM_SECONDS.observe(elapsed, host=host, status=str(resp.status_code))
+    if resp.status_code < 500:
+        _record_latency(host, elapsed)
+    return resp
+
+
+def _close_loser(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _hedged_get(
+    host: str, url: str, params, headers, timeout: float, before_hedge: Optional[Callable[[], None]] = None
+) -> requests.Response:
+    """First response of the original request and, if it is slow, one hedge."""
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _state_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="upstream-hedge")
+
+    def attempt() -> Future:
+        # Each attempt runs in its own copy of the caller's context (request timings)
+        return _hedge_pool.submit(contextvars.copy_context().run, _timed_get, host, url, params, headers, timeout, False)
+
+    first = attempt()
+    done, _ = wait([first], timeout=_p95(host) or HEDGE_DEFAULT_DELAY)
+    if done:
+        return first.result()
+
+    if before_hedge is not None:
+        before_hedge()
+        if first.done():
+            return first.result()
+    UPSTREAM_HEDGES.inc(host=host, outcome="fired")
+    hedge = attempt()
+    pending = {first, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    UPSTREAM_HEDGES.inc(host=host, outcome="won")
+                for other in pending:
+                    other.add_done_callback(_close_loser)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def get(
+    url: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 30,
+    stream: bool = False,
+    hedge: bool = False,
+    before_hedge: Optional[Callable[[], None]] = None,
+) -> requests.Response:
+    """
+    GET an upstream URL, recording latency by host and status code.
+
+    Status checking is left to the caller (`resp.raise_for_status()`).
+    Connection errors and timeouts are recorded with status "error" and
+    re-raised; in replay mode a missing cassette raises ConnectionError,
+    and a host with an open circuit breaker raises CircuitOpenError (also a
+    ConnectionError). With `stream=True` the body is read by the caller
+    (`iter_content`), and the recorded latency covers the response headers
+    only. `hedge=True` marks the request as safe to send twice (see module
+    docs); it is ignored for streamed requests. `before_hedge` is called
+    just before a hedge is sent, e.g. to wait for a rate-limit slot.
+    """
+    host = urlparse(url).hostname or "unknown"
+    full_url = url
+    if MODE != MODE_LIVE:
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        if MODE == MODE_REPLAY:
+            with timing.span(f"replay-{host}"):
+                return _load_cassette(full_url)
+    if STUB_URL:
+        url = _stub_url(url)
+
+    breaker = _breaker(host)
+    breaker.check()
+    timeout = _adaptive_timeout(host, timeout)
+    try:
+        if hedge and HEDGE_ENABLED and not stream:
+            resp = _hedged_get(host, url, params, headers, timeout, before_hedge)
+        else:
+            resp = _timed_get(host, url, params, headers, timeout, stream)
+    except BaseException:
+        breaker.record(False)
+        raise
+    breaker.record(resp.status_code < 500)
+
+    if MODE == MODE_RECORD and resp.status_code < 500:
+        try:
+            if stream:
+                _tee_cassette(full_url, resp)
+            else:
+                _save_cassette(full_url, resp)
+        except OSError as e:
+            logger.warning("Could not record cassette for %s: %s", full_url, e)
+    return resp